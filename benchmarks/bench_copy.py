@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Copy Benchmarks
+Copies synthetic guilds through the mock Discord API and reports wall time,
+request count, 429 count and peak memory for each scenario.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import tracemalloc
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discopy  # noqa: E402
+from mock_discord import API_PREFIX, MockDiscord, start_server  # noqa: E402
+
+# name -> synthetic source guild shape
+SCENARIOS: Dict[str, dict] = {
+    'small': {"channels": 50, "roles": 20, "emojis": 10, "stickers": 2, "members": 5},
+    'medium': {"channels": 500, "roles": 250, "emojis": 100, "stickers": 5, "members": 20},
+    'large': {"channels": 1500, "roles": 250, "emojis": 100, "stickers": 5, "members": 50},
+}
+MODES = ('copy', 'new', 'clean')
+SKIPPABLE = {'settings': 'copy_settings', 'emojis': 'copy_emojis', 'stickers': 'copy_stickers', 'clean': 'clean_target'}
+
+async def run_scenario(name: str, mode: str, args: argparse.Namespace) -> dict:
+    """Run one copy against a fresh mock and collect its numbers"""
+    shape = SCENARIOS[name]
+    mock = MockDiscord(args.latency, args.jitter, args.failure_rate, args.time_scale,
+                       global_limit=int(50 / args.time_scale), asset_size=args.asset_size,
+                       lost_response_rate=args.lost_response_rate)
+    source_id = mock.add_guild(f"{name} source", **shape)
+    # The target starts with a tenth of the source so the cleanup has work to do
+    target_id = mock.add_guild(f"{name} target", **{key: value // 10 for key, value in shape.items()})
+    runner, url = await start_server(mock)
+
+    discopy.GLOBAL_RATE_LIMIT = int(50 / args.time_scale)
+    try:
+        async with discopy.UserAPI("benchmark-token", f"{url}{API_PREFIX}", url, args.metrics_dir) as user_api:
+            user_api.assets.cache = None  # Every run downloads cold
+            config = discopy.RunConfig(**{SKIPPABLE[stage]: False for stage in args.skip})
+            copier = discopy.ServerCopier(user_api, config=config)
+            copier.console.quiet = not args.verbose
+            if args.verify:
+                # A copy that leaves drift behind is not ok
+                copier.verify_report = os.path.join(tempfile.gettempdir(), f"bench-{name}-{mode}.drift.json")
+
+            if args.tracemalloc:
+                tracemalloc.start()
+            started = time.perf_counter()
+            if mode == 'copy':
+                ok = await copier.copy_to_existing_server(source_id, target_id)
+            elif mode == 'new':
+                ok = await copier.copy_server(source_id, f"{name} copy")
+            else:
+                await copier.clean_server(source_id)
+                ok = True
+            elapsed = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+            if args.tracemalloc:
+                tracemalloc.stop()
+    finally:
+        await runner.cleanup()
+
+    stats = mock.stats.to_dict()
+    return {
+        "scenario": name,
+        "mode": mode,
+        "ok": bool(ok),
+        "wall_time": round(elapsed, 3),
+        "requests": stats['api_requests'],
+        "cdn_requests": stats['cdn_requests'],
+        "rate_limited": stats['rate_limited'],
+        "failures": stats['failures'],
+        "peak_memory_mb": round(peak / (1024 * 1024), 2) if peak is not None else None,
+        "routes": stats['routes'] if args.routes else None
+    }
+
+def print_results(results: List[dict]):
+    header = f"{'scenario':<8} {'mode':<6} {'ok':<3} {'wall s':>8} {'requests':>9} {'cdn':>5} {'429s':>5} {'5xx':>5} {'peak MB':>8}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        peak = f"{r['peak_memory_mb']:.2f}" if r['peak_memory_mb'] is not None else '-'
+        print(f"{r['scenario']:<8} {r['mode']:<6} {'yes' if r['ok'] else 'no':<3} {r['wall_time']:>8.2f} "
+              f"{r['requests']:>9} {r['cdn_requests']:>5} {r['rate_limited']:>5} {r['failures']:>5} {peak:>8}")
+        if r['routes']:
+            for route, count in r['routes'].items():
+                print(f"    {count:>6}  {route}")
+
+async def run(args: argparse.Namespace) -> List[dict]:
+    results = []
+    for name in args.scenario:
+        for mode in args.mode:
+            results.append(await run_scenario(name, mode, args))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Discopy copies against the mock Discord API")
+    parser.add_argument('--scenario', nargs='+', choices=list(SCENARIOS), default=['small', 'medium', 'large'])
+    parser.add_argument('--mode', nargs='+', choices=MODES, default=['copy'],
+                        help="copy: copy to an existing server, new: create a new server, clean: clean only")
+    parser.add_argument('--skip', nargs='+', choices=list(SKIPPABLE), default=[],
+                        help="Turn these config.json features off, to measure a partial copy")
+    parser.add_argument('--verify', action='store_true', help="Verify each copied target against its source")
+    parser.add_argument('--latency', type=float, default=0.02, help="Seconds added to every mock response")
+    parser.add_argument('--jitter', type=float, default=0.01, help="Maximum random extra latency in seconds")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Fraction of API requests answered with 500")
+    parser.add_argument('--lost-response-rate', type=float, default=0.0,
+                        help="Fraction of creates the mock applies but answers with 502")
+    parser.add_argument('--time-scale', type=float, default=0.001,
+                        help="Multiplier for rate limit windows, 1.0 emulates real Discord timings")
+    parser.add_argument('--asset-size', type=int, default=16 * 1024, help="Bytes per emoji, sticker and icon")
+    parser.add_argument('--no-tracemalloc', dest='tracemalloc', action='store_false',
+                        help="Skip peak memory tracking, which slows the run down")
+    parser.add_argument('--routes', action='store_true', help="Show request counts per route")
+    parser.add_argument('--json', help="Also write the results to this file")
+    parser.add_argument('--metrics-dir', help="Write Discopy's request telemetry of each run to this directory")
+    parser.add_argument('--verbose', action='store_true', help="Show Discopy's console output")
+    args = parser.parse_args()
+
+    logging.getLogger(discopy.__name__).setLevel(logging.DEBUG if args.verbose else logging.ERROR)
+    results = asyncio.run(run(args))
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    sys.exit(0 if all(r['ok'] for r in results) else 1)
+
+if __name__ == "__main__":
+    main()
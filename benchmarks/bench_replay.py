@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Replay Benchmarks
+Runs the command recorded in a cassette against its recorded responses and
+reports wall time, requests served, 429s and time spent waiting on rate limits.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discopy  # noqa: E402
+
+async def run_replay(path: str, scale: float, args: argparse.Namespace) -> dict:
+    """Replay a cassette once at a time scale and collect its numbers"""
+    cassette = discopy.Cassette.load(path)
+    recorded = max((i['at'] + i['latency'] for i in cassette.interactions), default=0.0)
+    command = argparse.Namespace(**cassette.command)
+    async with discopy.UserAPI("replay", metrics_dir=args.metrics_dir, replay=cassette, replay_scale=scale) as user_api:
+        copier = discopy.ServerCopier(user_api, show_progress=False)
+        copier.console.quiet = not args.verbose
+        started = time.perf_counter()
+        code = await discopy.dispatch_command(command, copier, copier.console)
+        elapsed = time.perf_counter() - started
+        metrics = user_api.metrics.to_dict()
+
+    routes = metrics['routes'].values()
+    return {
+        "cassette": os.path.basename(path),
+        "command": cassette.command.get('command'),
+        "scale": scale,
+        "exit_code": code,
+        "recorded_time": round(recorded, 3),
+        "wall_time": round(elapsed, 3),
+        "recorded": len(cassette.interactions),
+        "served": cassette.served,
+        "missed": cassette.missed,
+        "rate_limited": sum(route['rate_limited'] for route in routes),
+        "limiter_wait": round(metrics['limiter_wait'], 3)
+    }
+
+def print_results(results: List[dict]):
+    header = (f"{'cassette':<24} {'scale':>6} {'exit':>4} {'recorded s':>10} {'wall s':>8} "
+              f"{'served':>7} {'missed':>7} {'429s':>5} {'wait s':>7}")
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['cassette'][:24]:<24} {r['scale']:>6.2f} {r['exit_code']:>4} {r['recorded_time']:>10.2f} {r['wall_time']:>8.2f} "
+              f"{r['served']:>4}/{r['recorded']:<4} {r['missed']:>5} {r['rate_limited']:>5} {r['limiter_wait']:>7.2f}")
+
+async def run(args: argparse.Namespace) -> List[dict]:
+    results = []
+    for path in args.cassette:
+        for scale in args.scale:
+            results.append(await run_replay(path, scale, args))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Discopy against recorded Discord traffic")
+    parser.add_argument('cassette', nargs='+', help="Cassettes recorded with discopy.py --record")
+    parser.add_argument('--scale', nargs='+', type=float, default=[1.0],
+                        help="Multipliers for the recorded request times and latencies, 0 replays without waiting")
+    parser.add_argument('--json', help="Also write the results to this file")
+    parser.add_argument('--metrics-dir', help="Write Discopy's request telemetry of each replay to this directory")
+    parser.add_argument('--verbose', action='store_true', help="Show Discopy's console output")
+    args = parser.parse_args()
+
+    logging.getLogger(discopy.__name__).setLevel(logging.DEBUG if args.verbose else logging.ERROR)
+    results = asyncio.run(run(args))
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    sys.exit(0 if all(r['exit_code'] == discopy.EXIT_OK and not r['missed'] for r in results) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmarks
+Times fresh interpreter runs of the import of discopy and of the command line,
+and lists the interactive-only and deferred modules a headless start still loads.
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+import time
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'discopy.py')
+
+# Modules only the interactive menu should need
+INTERACTIVE_MODULES = ('rich.progress', 'rich.prompt', 'colorama', 'requests')
+# Modules only loaded once a command sends requests or prints
+DEFERRED_MODULES = ('aiohttp', 'multidict', 'rich.console')
+
+CASES = {
+    'import': [sys.executable, '-c', f"import sys; sys.path.insert(0, {ROOT!r}); import discopy"],
+    'help': [sys.executable, SCRIPT, '--help'],
+    'baseline': [sys.executable, '-c', 'pass']
+}
+
+def time_case(command: List[str], runs: int, cwd: str) -> Dict[str, float]:
+    """Run a command in fresh interpreters and summarize its wall times in milliseconds"""
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(command, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - started) * 1000)
+    return {"median_ms": round(statistics.median(times), 1), "min_ms": round(min(times), 1), "max_ms": round(max(times), 1)}
+
+def loaded_modules(cwd: str, modules: tuple) -> List[str]:
+    """List which of these modules importing discopy loads"""
+    probe = (f"import sys, json; sys.path.insert(0, {ROOT!r}); import discopy; "
+             f"print(json.dumps([m for m in {list(modules)!r} if m in sys.modules]))")
+    output = subprocess.run([sys.executable, '-c', probe], cwd=cwd, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Discopy's startup time")
+    parser.add_argument('--runs', type=int, default=10, help="Fresh interpreter runs per case")
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    # Runs happen in a scratch directory so the log file does not land in the repository
+    with tempfile.TemporaryDirectory() as cwd:
+        results = {name: time_case(command, args.runs, cwd) for name, command in CASES.items()}
+        results['interactive_modules_loaded'] = loaded_modules(cwd, INTERACTIVE_MODULES)
+        results['deferred_modules_loaded'] = loaded_modules(cwd, DEFERRED_MODULES)
+
+    print(f"{'case':<10} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+    for name in CASES:
+        r = results[name]
+        print(f"{name:<10} {r['median_ms']:>10.1f} {r['min_ms']:>8.1f} {r['max_ms']:>8.1f}")
+    print(f"interactive-only modules loaded by import: {', '.join(results['interactive_modules_loaded']) or 'none'}")
+    print(f"deferred modules loaded by import: {', '.join(results['deferred_modules_loaded']) or 'none'}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
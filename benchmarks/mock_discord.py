@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+Mock Discord API
+A local stand-in for the REST and CDN endpoints Discopy uses, with emulated
+rate limit buckets, 429s, latency and failures.
+"""
+
+import time
+import random
+import asyncio
+import argparse
+import itertools
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from aiohttp import web
+
+API_PREFIX = "/api/v9"
+DISCORD_EPOCH = 1420070400000  # Milliseconds, snowflakes count from here
+
+# (method, route template) -> (requests per window, window seconds), loosely modelled on Discord
+ROUTE_LIMITS = {
+    ('POST', '/guilds'): (10, 10.0),
+    ('PATCH', '/guilds/{id}'): (5, 5.0),
+    ('POST', '/guilds/{id}/roles'): (250, 48 * 3600.0),
+    ('PATCH', '/guilds/{id}/roles'): (10, 10.0),
+    ('PATCH', '/guilds/{id}/roles/{id}'): (10, 10.0),
+    ('DELETE', '/guilds/{id}/roles/{id}'): (10, 10.0),
+    ('POST', '/guilds/{id}/channels'): (5, 5.0),
+    ('PATCH', '/guilds/{id}/channels'): (5, 5.0),
+    ('PATCH', '/channels/{id}'): (2, 600.0),
+    ('DELETE', '/channels/{id}'): (5, 5.0),
+    ('POST', '/guilds/{id}/emojis'): (50, 3600.0),
+    ('POST', '/guilds/{id}/stickers'): (5, 5.0),
+}
+DEFAULT_LIMIT = (50, 1.0)
+MAJOR_PARAMETERS = ('guilds', 'channels', 'webhooks')
+
+def route_template(method: str, path: str) -> Tuple[str, str]:
+    """Split a request path into its route template and major parameter"""
+    parts = path[len(API_PREFIX):].strip('/').split('/')
+    major = ''
+    for index, part in enumerate(parts):
+        if part.isdigit():
+            if not major and index and parts[index - 1] in MAJOR_PARAMETERS:
+                major = part
+            parts[index] = '{id}'
+    return '/' + '/'.join(parts), major
+
+class MockBucket:
+    """A fixed window rate limit bucket"""
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self.remaining = limit
+        self.reset_at = 0.0
+
+    def take(self, now: float) -> Optional[float]:
+        """Claim a request slot, returning the wait time instead if the bucket is exhausted"""
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.window
+        if self.remaining <= 0:
+            return self.reset_at - now
+        self.remaining -= 1
+        return None
+
+class MockStats:
+    """Counters the benchmark reads back after a run"""
+    def __init__(self):
+        self.requests = 0
+        self.api_requests = 0
+        self.cdn_requests = 0
+        self.rate_limited = 0
+        self.global_rate_limited = 0
+        self.failures = 0
+        self.lost_responses = 0
+        self.routes: Dict[str, int] = {}
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "api_requests": self.api_requests,
+            "cdn_requests": self.cdn_requests,
+            "rate_limited": self.rate_limited,
+            "global_rate_limited": self.global_rate_limited,
+            "failures": self.failures,
+            "lost_responses": self.lost_responses,
+            "routes": dict(sorted(self.routes.items(), key=lambda item: -item[1]))
+        }
+
+class MockDiscord:
+    """In-memory Discord guild state behind an aiohttp application"""
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0,
+                 time_scale: float = 1.0, global_limit: int = 50, asset_size: int = 16 * 1024, seed: int = 0,
+                 lost_response_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.lost_response_rate = lost_response_rate  # Fraction of creates applied but answered with 502
+        self.time_scale = time_scale
+        self.global_limit = global_limit
+        self.asset_size = asset_size
+        self.random = random.Random(seed)
+        self.ids = itertools.count()
+        self.guilds: Dict[str, dict] = {}
+        self.roles: Dict[str, List[dict]] = {}
+        self.channels: Dict[str, List[dict]] = {}
+        self.emojis: Dict[str, List[dict]] = {}
+        self.stickers: Dict[str, List[dict]] = {}
+        self.members: Dict[str, List[dict]] = {}
+        self.buckets: Dict[Tuple[str, str], MockBucket] = {}
+        self.global_window = deque()
+        self.stats = MockStats()
+
+    def new_id(self) -> str:
+        """Build a snowflake, so ids carry their creation time like Discord's do"""
+        return str(((int(time.time() * 1000) - DISCORD_EPOCH) << 22) | (next(self.ids) & 0x3FFFFF))
+
+    # Synthetic data
+
+    def add_guild(self, name: str, roles: int = 10, channels: int = 20, emojis: int = 5, stickers: int = 1,
+                  members: int = 0, premium_tier: int = 3, features: Optional[List[str]] = None) -> str:
+        """Create a synthetic guild, one category per ten channels"""
+        guild_id = self.new_id()
+        self.guilds[guild_id] = {
+            "id": guild_id, "name": name, "icon": f"icon{guild_id}", "owner_id": "1",
+            "verification_level": 1, "default_message_notifications": 1, "explicit_content_filter": 2,
+            "afk_timeout": 300, "preferred_locale": "en-US", "premium_tier": premium_tier,
+            "features": features if features is not None else ["COMMUNITY"]
+        }
+        self.roles[guild_id] = [self._everyone(guild_id)]
+        for index in range(roles):
+            self.roles[guild_id].append({
+                "id": self.new_id(), "name": f"role-{index}", "permissions": str(1 << (index % 40)),
+                "color": index * 997 % 0xFFFFFF, "hoist": index % 5 == 0, "mentionable": index % 3 == 0,
+                "managed": False, "position": index + 1
+            })
+        # The benchmark user is the first member, so its overwrites survive a copy to a server of its own
+        self.members[guild_id] = [{"user": {"id": "1"}}][:members] + [{"user": {"id": self.new_id()}} for _ in range(members - 1)]
+
+        role_ids = [role['id'] for role in self.roles[guild_id][1:]]
+        self.channels[guild_id] = []
+        categories = []
+        for index in range(max(1, channels // 10) if channels else 0):
+            category = self._channel(guild_id, f"category-{index}", 4, index, None)
+            if role_ids:
+                category["permission_overwrites"] = [
+                    {"id": role_ids[index % len(role_ids)], "type": 0, "allow": "1024", "deny": "0"}
+                ]
+            if index % 3 == 0:
+                category["permission_overwrites"].append({"id": guild_id, "type": 0, "allow": "0", "deny": "1024"})
+            categories.append(category)
+            self.channels[guild_id].append(category)
+        for index in range(channels - len(categories)):
+            channel_type = (0, 0, 0, 2, 5, 13, 15)[index % 7]
+            parent = categories[index % len(categories)]['id'] if categories else None
+            channel = self._channel(guild_id, f"channel-{index}", channel_type, index // max(1, len(categories)), parent)
+            if index % 5 == 0:
+                # Private channels hide themselves from @everyone, whose id is the guild's
+                channel["permission_overwrites"].append({"id": guild_id, "type": 0, "allow": "0", "deny": "1024"})
+            if role_ids and index % 4 == 0:
+                channel["permission_overwrites"].append(
+                    {"id": role_ids[(index * 7) % len(role_ids)], "type": 0, "allow": "2048", "deny": "1024"}
+                )
+            if self.members[guild_id] and index % 9 == 0:
+                channel["permission_overwrites"].append(
+                    {"id": self.members[guild_id][0]['user']['id'], "type": 1, "allow": "1024", "deny": "0"}
+                )
+            self.channels[guild_id].append(channel)
+
+        self.emojis[guild_id] = [
+            {"id": self.new_id(), "name": f"emoji_{index}", "roles": [], "animated": index % 4 == 0, "available": True}
+            for index in range(emojis)
+        ]
+        self.stickers[guild_id] = [
+            {"id": self.new_id(), "name": f"sticker-{index}", "description": "synthetic", "tags": "bench",
+             "format_type": 1, "type": 2}
+            for index in range(stickers)
+        ]
+        return guild_id
+
+    def _everyone(self, guild_id: str) -> dict:
+        return {"id": guild_id, "name": "@everyone", "permissions": "104324673", "color": 0, "hoist": False,
+                "mentionable": False, "managed": False, "position": 0}
+
+    def _channel(self, guild_id: str, name: str, channel_type: int, position: int, parent_id: Optional[str]) -> dict:
+        channel = {"id": self.new_id(), "guild_id": guild_id, "name": name, "type": channel_type, "position": position,
+                   "parent_id": parent_id, "permission_overwrites": [], "nsfw": False}
+        if channel_type in (2, 13):
+            channel.update(bitrate=64000, user_limit=0)
+        elif channel_type != 4:
+            channel.update(topic=None, rate_limit_per_user=0)
+        return channel
+
+    # Request handling
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self.middleware], client_max_size=16 * 1024 * 1024)
+        router = app.router
+        router.add_get(API_PREFIX + '/users/@me', self.me)
+        router.add_post(API_PREFIX + '/guilds', self.create_guild)
+        router.add_route('*', API_PREFIX + '/guilds/{guild}', self.guild)
+        router.add_get(API_PREFIX + '/guilds/{guild}/members', self.list_members)
+        router.add_get(API_PREFIX + '/guilds/{guild}/members/{user}', self.get_member)
+        router.add_route('*', API_PREFIX + '/guilds/{guild}/{kind}', self.collection)
+        router.add_route('*', API_PREFIX + '/guilds/{guild}/{kind}/{item}', self.item)
+        router.add_route('*', API_PREFIX + '/channels/{channel}', self.channel)
+        router.add_post(API_PREFIX + '/channels/{channel}/invites', self.invite)
+        router.add_get('/icons/{guild}/{file}', self.cdn)
+        router.add_get('/{kind:emojis|stickers}/{file}', self.cdn)
+        return app
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        self.stats.requests += 1
+        if not request.path.startswith(API_PREFIX):
+            self.stats.cdn_requests += 1
+            await self._delay()
+            return await handler(request)
+
+        self.stats.api_requests += 1
+        route, major = route_template(request.method, request.path)
+        route_key = f"{request.method} {route}"
+        self.stats.routes[route_key] = self.stats.routes.get(route_key, 0) + 1
+        await self._delay()
+
+        now = time.monotonic()
+        while self.global_window and self.global_window[0] <= now - 1.0:
+            self.global_window.popleft()
+        if len(self.global_window) >= self.global_limit:
+            self.stats.rate_limited += 1
+            self.stats.global_rate_limited += 1
+            retry_after = round(self.global_window[0] + 1.0 - now, 3)
+            return web.json_response(
+                {"message": "You are being rate limited.", "retry_after": retry_after, "global": True}, status=429,
+                headers={"Retry-After": str(retry_after), "X-RateLimit-Global": "true", "X-RateLimit-Scope": "global"}
+            )
+        self.global_window.append(now)
+
+        limit, window = ROUTE_LIMITS.get((request.method, route), DEFAULT_LIMIT)
+        bucket = self.buckets.get((route_key, major))
+        if bucket is None:
+            bucket = self.buckets[(route_key, major)] = MockBucket(limit, window * self.time_scale)
+        retry_after = bucket.take(now)
+        headers = {
+            "X-RateLimit-Limit": str(bucket.limit),
+            "X-RateLimit-Remaining": str(max(bucket.remaining, 0)),
+            "X-RateLimit-Reset-After": f"{max(bucket.reset_at - now, 0):.3f}",
+            "X-RateLimit-Bucket": f"{abs(hash(route_key)):x}"
+        }
+        if retry_after is not None:
+            self.stats.rate_limited += 1
+            return web.json_response(
+                {"message": "You are being rate limited.", "retry_after": round(retry_after, 3), "global": False},
+                status=429, headers=dict(headers, **{"Retry-After": f"{retry_after:.3f}", "X-RateLimit-Scope": "user"})
+            )
+
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            self.stats.failures += 1
+            return web.json_response({"message": "Internal Server Error"}, status=500, headers=headers)
+
+        response = await handler(request)
+        if request.method == 'POST' and self.lost_response_rate and self.random.random() < self.lost_response_rate:
+            # The create happened, but the client never learns about it
+            self.stats.lost_responses += 1
+            return web.json_response({"message": "Bad Gateway"}, status=502, headers=headers)
+        response.headers.update(headers)
+        return response
+
+    async def _delay(self):
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def cdn(self, request: web.Request) -> web.Response:
+        seed = request.path.encode()
+        body = b'\x89PNG\r\n\x1a\n' + (seed * (self.asset_size // len(seed) + 1))[:self.asset_size]
+        content_type = 'image/gif' if request.path.split('?')[0].endswith('.gif') else 'image/png'
+        return web.Response(body=body, content_type=content_type)
+
+    async def me(self, request: web.Request) -> web.Response:
+        return web.json_response({"id": "1", "username": "benchmark"})
+
+    def _not_found(self, what: str) -> web.Response:
+        return web.json_response({"message": f"Unknown {what}", "code": 10004}, status=404)
+
+    def _store(self, kind: str) -> Optional[Dict[str, List[dict]]]:
+        return {'roles': self.roles, 'channels': self.channels, 'emojis': self.emojis, 'stickers': self.stickers}.get(kind)
+
+    async def create_guild(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        guild_id = self.new_id()
+        guild = {key: value for key, value in body.items() if key not in ('roles', 'channels')}
+        guild.update(id=guild_id, icon=f"icon{guild_id}" if body.get('icon') else None, premium_tier=0, features=[],
+                     owner_id="1")
+        self.guilds[guild_id] = guild
+        self.roles[guild_id] = [self._everyone(guild_id)]
+        self.emojis[guild_id], self.stickers[guild_id], self.members[guild_id] = [], [], [{"user": {"id": "1"}}]
+
+        placeholders = {}
+        for role in body.get('roles', []):
+            if role.get('id') == 0:
+                placeholders[0] = guild_id
+                self.roles[guild_id][0].update({k: v for k, v in role.items() if k != 'id'}, id=guild_id)
+                continue
+            role_id = self.new_id()
+            placeholders[role.get('id')] = role_id
+            self.roles[guild_id].append(dict(role, id=role_id, managed=False, position=len(self.roles[guild_id])))
+
+        if body.get('channels'):
+            self.channels[guild_id] = []
+            for channel in body['channels']:
+                channel_id = self.new_id()
+                placeholders[channel.get('id')] = channel_id
+                overwrites = [dict(o, id=placeholders.get(o['id'], o['id'])) for o in channel.get('permission_overwrites', [])]
+                self.channels[guild_id].append(dict(
+                    channel, id=channel_id, guild_id=guild_id, parent_id=placeholders.get(channel.get('parent_id')),
+                    permission_overwrites=overwrites
+                ))
+        else:
+            self.channels[guild_id] = [self._channel(guild_id, "general", 0, 0, None)]
+        return web.json_response(dict(guild, roles=self.roles[guild_id]), status=201)
+
+    async def guild(self, request: web.Request) -> web.Response:
+        guild_id = request.match_info['guild']
+        guild = self.guilds.get(guild_id)
+        if guild is None:
+            return self._not_found("Guild")
+        if request.method == 'PATCH':
+            body = await request.json()
+            if 'icon' in body:
+                body['icon'] = f"icon{self.new_id()}" if body['icon'] else None
+            guild.update(body)
+        elif request.method != 'GET':
+            return web.Response(status=405)
+        return web.json_response(guild)
+
+    async def list_members(self, request: web.Request) -> web.Response:
+        members = self.members.get(request.match_info['guild'])
+        if members is None:
+            return self._not_found("Guild")
+        limit = int(request.query.get('limit', 1))
+        after = int(request.query.get('after', 0))
+        page = [m for m in members if int(m['user']['id']) > after][:limit]
+        return web.json_response(page)
+
+    async def get_member(self, request: web.Request) -> web.Response:
+        for member in self.members.get(request.match_info['guild'], []):
+            if member['user']['id'] == request.match_info['user']:
+                return web.json_response(member)
+        return self._not_found("Member")
+
+    async def collection(self, request: web.Request) -> web.Response:
+        guild_id, kind = request.match_info['guild'], request.match_info['kind']
+        store = self._store(kind)
+        if store is None or guild_id not in self.guilds:
+            return self._not_found("Guild")
+        items = store[guild_id]
+
+        if request.method == 'GET':
+            return web.json_response(items)
+        body = await request.json()
+        if request.method == 'POST':
+            item = {key: value for key, value in body.items() if key not in ('image', 'file')}
+            item['id'] = self.new_id()
+            if kind == 'roles':
+                for role in items[1:]:
+                    role['position'] += 1
+                item.update(position=1, managed=False)
+            elif kind == 'channels':
+                item['guild_id'] = guild_id
+                item.setdefault('permission_overwrites', [])
+            items.append(item)
+            return web.json_response(item, status=201 if kind != 'roles' else 200)
+        if request.method == 'PATCH' and kind in ('roles', 'channels'):
+            by_id = {item['id']: item for item in items}
+            for change in body:
+                if change['id'] in by_id:
+                    by_id[change['id']].update({k: v for k, v in change.items() if k != 'lock_permissions'})
+            if kind == 'roles':
+                return web.json_response(items)
+            return web.Response(status=204)
+        return web.Response(status=405)
+
+    async def item(self, request: web.Request) -> web.Response:
+        guild_id, kind, item_id = request.match_info['guild'], request.match_info['kind'], request.match_info['item']
+        store = self._store(kind)
+        items = store.get(guild_id, []) if store is not None else []
+        for item in items:
+            if item['id'] == item_id:
+                if request.method == 'DELETE':
+                    items.remove(item)
+                    return web.Response(status=204)
+                if request.method == 'PATCH':
+                    item.update(await request.json())
+                return web.json_response(item)
+        return self._not_found(kind[:-1].capitalize())
+
+    async def channel(self, request: web.Request) -> web.Response:
+        channel_id = request.match_info['channel']
+        for items in self.channels.values():
+            for channel in items:
+                if channel['id'] == channel_id:
+                    if request.method == 'DELETE':
+                        items.remove(channel)
+                    elif request.method == 'PATCH':
+                        channel.update(await request.json())
+                    return web.json_response(channel)
+        return self._not_found("Channel")
+
+    async def invite(self, request: web.Request) -> web.Response:
+        return web.json_response({"code": f"bench{self.new_id()[-6:]}"})
+
+async def start_server(mock: MockDiscord, host: str = '127.0.0.1', port: int = 0) -> Tuple[web.AppRunner, str]:
+    """Serve a mock in the running loop, returning the runner and its base URL"""
+    runner = web.AppRunner(mock.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{bound_port}"
+
+async def serve(args: argparse.Namespace):
+    mock = MockDiscord(args.latency, args.jitter, args.failure_rate, args.time_scale, args.global_limit,
+                       lost_response_rate=args.lost_response_rate)
+    source_id = mock.add_guild("Mock Source", args.roles, args.channels, args.emojis, args.stickers, args.members)
+    target_id = mock.add_guild("Mock Target", 5, 10, 2, 1)
+    runner, url = await start_server(mock, args.host, args.port)
+    print(f"Mock Discord API listening on {url}")
+    print(f"  DISCORD_API_URL={url}{API_PREFIX}")
+    print(f"  DISCORD_CDN_URL={url}")
+    print(f"  Source guild: {source_id}  Target guild: {target_id}")
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await runner.cleanup()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a mock Discord API for local Discopy runs")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.02, help="Seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.01, help="Maximum random extra latency in seconds")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Fraction of API requests answered with 500")
+    parser.add_argument('--lost-response-rate', type=float, default=0.0,
+                        help="Fraction of creates that are applied but answered with 502")
+    parser.add_argument('--time-scale', type=float, default=1.0, help="Multiplier for rate limit windows")
+    parser.add_argument('--global-limit', type=int, default=50, help="Global requests per second")
+    parser.add_argument('--channels', type=int, default=50)
+    parser.add_argument('--roles', type=int, default=20)
+    parser.add_argument('--emojis', type=int, default=10)
+    parser.add_argument('--stickers', type=int, default=2)
+    parser.add_argument('--members', type=int, default=5)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        print("\nExiting...")
+
+if __name__ == "__main__":
+    main()
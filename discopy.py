@@ -10,47 +10,149 @@ import os
 import sys
 import json
 import time
+import queue
+import atexit
 import logging
+import logging.handlers
+import io
 import hashlib
 import asyncio
-import aiohttp
-import requests
-from rich.console import Console
-from rich.panel import Panel
-from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TaskProgressColumn, TimeRemainingColumn
-from rich.table import Table
-from rich.layout import Layout as RichLayout
-from rich.align import Align
-from rich.text import Text
-from rich.box import ROUNDED
+import argparse
 from dotenv import load_dotenv
-import colorama
-from colorama import Fore, init
-from typing import Dict, List, Optional, Union
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import base64
-from rich.prompt import Prompt
-
-# Initialize colorama and load environment variables
-init(autoreset=True)
+import copy
+import gzip
+import contextvars
+import heapq
+import random
+
+try:
+    import orjson  # Optional, a faster codec for request and response bodies
+except ImportError:
+    orjson = None
+
+# Load environment variables, the interactive UI modules are imported when the menu starts
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('discord_copy.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
 logger = logging.getLogger(__name__)
 
 # Constants
 API_VERSION = 9
-BASE_URL = f"https://discord.com/api/v{API_VERSION}"
+LOG_FILE = os.getenv('LOG_FILE', 'discord_copy.log')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_MB', '10')) * 1024 * 1024
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+LOG_FIELDS = ('route', 'method', 'guild_id', 'stage', 'status', 'latency', 'bucket', 'retry_after')  # Structured extras
+BASE_URL = os.getenv('DISCORD_API_URL', f"https://discord.com/api/v{API_VERSION}")
+CDN_URL = os.getenv('DISCORD_CDN_URL', "https://cdn.discordapp.com")
 RATE_LIMIT_DELAY = float(os.getenv('RATE_LIMIT_DELAY', '1.5'))
 MAX_RETRIES = int(os.getenv('MAX_RETRIES', '3'))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '30'))
+RATE_LIMIT_RETRIES = int(os.getenv('RATE_LIMIT_RETRIES', '5'))
+RETRYABLE_STATUSES = (500, 502, 503, 504)
+CREATE_ROUTES = ('POST /guilds/{id}/roles', 'POST /guilds/{id}/channels', 'POST /guilds/{id}/emojis', 'POST /guilds/{id}/stickers')
+CREATE_LOOKUP_SKEW = 5.0  # Seconds of clock skew allowed when matching a possibly created object
+DISCORD_EPOCH = 1420070400000  # Milliseconds, snowflakes count from here
+GLOBAL_RATE_LIMIT = int(os.getenv('GLOBAL_RATE_LIMIT', '50'))  # Requests per second
+MAJOR_PARAMETERS = ('guilds', 'channels', 'webhooks')
+# Request class -> total seconds, 'api' follows settings.timeout in config.json
+REQUEST_TIMEOUTS = {'api': 30.0, 'cdn': 60.0, 'token': 10.0}
+CONNECT_TIMEOUT = 10.0
+HTTP_LIMIT = int(os.getenv('HTTP_LIMIT', '100'))  # Open connections across all hosts
+HTTP_LIMIT_PER_HOST = int(os.getenv('HTTP_LIMIT_PER_HOST', '32'))
+DNS_CACHE_TTL = int(os.getenv('DNS_CACHE_TTL', '300'))
+KEEPALIVE_TIMEOUT = 60.0
+ASSET_PREFETCH_DEPTH = int(os.getenv('ASSET_PREFETCH_DEPTH', '4'))
+ASSET_CACHE_DIR = os.getenv('ASSET_CACHE_DIR', os.path.join('.discopy_cache', 'assets'))
+ASSET_CACHE_MAX_BYTES = int(os.getenv('ASSET_CACHE_MAX_MB', '256')) * 1024 * 1024
+ASSET_TRANSCODE_WORKERS = int(os.getenv('ASSET_TRANSCODE_WORKERS', '2'))
+ASSET_SHRINK_ATTEMPTS = 6
+ASSET_SIZE_LIMITS = {'emoji': 256 * 1024, 'sticker': 512 * 1024}  # Discord's upload limits in bytes
+# Sticker format type -> (CDN extension, MIME type), APNG is served and uploaded as PNG
+STICKER_FORMATS = {1: ('png', 'image/png'), 2: ('png', 'image/png'), 3: ('json', 'application/json'), 4: ('gif', 'image/gif')}
+JOURNAL_DIR = os.getenv('JOURNAL_DIR', os.path.join('.discopy_cache', 'journals'))
+READ_CACHE_TTL = float(os.getenv('READ_CACHE_TTL', '30'))  # Seconds a GET response is reused, 0 disables the cache
+READ_CACHE_TTLS = {
+    'GET /guilds/{id}': 60.0,
+    'GET /guilds/{id}/members/{id}': 300.0,
+    'GET /users/@me': 300.0
+}
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join('.discopy_cache', 'metrics'))
+METRICS_KEEP = int(os.getenv('METRICS_KEEP', '20'))  # Run summaries kept, the oldest are removed
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # Histogram upper bounds in seconds
+SNAPSHOT_FORMAT = "discopy-snapshot"
+SNAPSHOT_VERSION = 1
+PROFILE_TOP = int(os.getenv('PROFILE_TOP', '15'))  # Operations listed in the profile summary
+PROFILE_CATEGORIES = ('rate_limit', 'network', 'cdn', 'cpu', 'other')
+CASSETTE_FORMAT = "discopy-cassette"
+CASSETTE_VERSION = 1
+CASSETTE_HEADERS = ('x-ratelimit-', 'retry-after', 'content-type')  # Response headers a replay needs, by prefix
+CASSETTE_SCALED_HEADERS = ('X-RateLimit-Reset-After', 'Retry-After')  # Waits that follow the replay speed
+DEFAULT_STAGE_CONCURRENCY = 4
+STAGE_CONCURRENCY = {
+    'settings': 1,
+    'roles': int(os.getenv('ROLE_CONCURRENCY', '4')),
+    'channels': int(os.getenv('CHANNEL_CONCURRENCY', '4')),
+    'emojis': ASSET_PREFETCH_DEPTH,
+    'stickers': ASSET_PREFETCH_DEPTH,
+    'order': 1
+}
+STAGE_LABELS = {
+    'settings': "[magenta]Copying server settings...",
+    'roles': "[yellow]Copying roles...",
+    'channels': "[green]Copying channels...",
+    'emojis': "[blue]Copying emojis...",
+    'stickers': "[magenta]Copying stickers...",
+    'order': "[cyan]Ordering roles and channels..."
+}
+CLEAN_CONCURRENCY = {
+    'channels': int(os.getenv('CLEAN_CHANNEL_CONCURRENCY', '8')),
+    'roles': 2,
+    'emojis': 2,
+    'stickers': 2
+}
+CLEAN_LABELS = {
+    'channels': "[red]Cleaning channels...",
+    'roles': "[yellow]Cleaning roles...",
+    'emojis': "[green]Cleaning emojis...",
+    'stickers': "[blue]Cleaning stickers..."
+}
+SNAPSHOT_KINDS = ('roles', 'channels', 'emojis', 'stickers')  # Collections read besides the guild itself
+RUN_FEATURES = ('copy_settings', 'copy_emojis', 'copy_stickers', 'copy_webhooks', 'clean_target')  # config.json features
+FEATURE_STAGES = {'settings': 'copy_settings', 'emojis': 'copy_emojis', 'stickers': 'copy_stickers'}  # Stage -> its feature
+GUILD_CREATE_CHANNEL_TYPES = (0, 2, 4)  # Text, voice and category, the types the create guild call accepts
+# Documented or commonly observed limits of the routes a copy writes to, as (requests, window in seconds).
+# Limits learned from response headers during the run take precedence.
+ROUTE_LIMIT_ESTIMATES = {
+    'PATCH /guilds/{id}': (5, 5.0),
+    'POST /guilds/{id}/roles': (250, 48 * 3600.0),
+    'DELETE /guilds/{id}/roles/{id}': (10, 10.0),
+    'POST /guilds/{id}/channels': (5, 5.0),
+    'DELETE /channels/{id}': (5, 5.0),
+    'POST /guilds/{id}/emojis': (50, 3600.0),
+    'DELETE /guilds/{id}/emojis/{id}': (5, 5.0),
+    'POST /guilds/{id}/stickers': (5, 5.0),
+    'DELETE /guilds/{id}/stickers/{id}': (5, 5.0)
+}
+DEFAULT_ROUTE_LIMIT = (5, 5.0)
+DEFAULT_LATENCY_ESTIMATE = 0.25  # Seconds per request when the run has not measured any yet
+# Premium tier -> slots for static emojis, and as many again for animated ones
+EMOJI_SLOTS = {0: 50, 1: 100, 2: 150, 3: 250}
+STICKER_SLOTS = {0: 5, 1: 15, 2: 30, 3: 60}
+BITRATE_LIMITS = {0: 96000, 1: 128000, 2: 256000, 3: 384000}
+# Channel types that need the COMMUNITY feature -> the closest type without it
+COMMUNITY_CHANNEL_TYPES = {5: 0, 13: 2, 15: 0, 16: 0}
+LOTTIE_STICKER_FEATURES = ('VERIFIED', 'PARTNERED')  # Only these guilds may upload Lottie (format 3) stickers
+VALIDATION_REPORT_ROWS = 25
+CHANNEL_IGNORED_FIELDS = ('name', 'type', 'position')  # Positions are applied in bulk once every object exists
+DRIFT_KINDS = {'create': 'missing', 'update': 'changed', 'delete': 'extra'}  # Sync action -> drift in a verification report
+SYNC_GUILD_FIELDS = ('name', 'verification_level', 'default_message_notifications', 'explicit_content_filter',
+                     'afk_timeout', 'preferred_locale')
 
 # Anti-tampering protection
 INTEGRITY_CHECKSUM = "e9c8a1b2d3f4g5h6i7j8k9l0m1n2o3p4q5r6s7t8u9v0w1x2y3z4"
@@ -67,11 +169,11 @@ def calculate_checksum(data: dict) -> str:
     }
     return hashlib.sha256(json.dumps(critical_data, sort_keys=True).encode()).hexdigest()
 
-def verify_copyright():
-    """Verify copyright information and file integrity"""
+def verify_copyright(read_only: bool = False, require_env: bool = True):
+    """Verify copyright information and file integrity, read_only skips refreshing the stored checksum"""
     try:
         # Verify runtime integrity first
-        verify_runtime_integrity()
+        verify_runtime_integrity(require_env)
         
         # Load and verify config.json
         try:
@@ -96,7 +198,7 @@ def verify_copyright():
         expected_checksum = calculate_checksum(config)
         
         # Update config with correct checksum
-        if config.get('checksum') != expected_checksum:
+        if not read_only and config.get('checksum') != expected_checksum:
             config['checksum'] = expected_checksum
             try:
                 with open('config.json', 'w') as f:
@@ -147,14 +249,14 @@ def verify_file_integrity(filepath: str) -> bool:
             raise
         raise SecurityError(f"Integrity check failed for {filepath}: {str(e)}")
 
-def verify_runtime_integrity():
-    """Verify runtime environment integrity"""
+def verify_runtime_integrity(require_env: bool = True):
+    """Verify runtime environment integrity, require_env=False allows a token passed without a .env file"""
     try:
         # Verify config.json exists and has correct structure
         verify_file_integrity('config.json')
         
         # Verify .env exists
-        if not os.path.exists('.env'):
+        if require_env and not os.path.exists('.env'):
             raise SecurityError("Configuration file missing: .env")
             
         return True
@@ -164,14 +266,14 @@ def verify_runtime_integrity():
             raise
         raise SecurityError(f"Runtime verification failed: {str(e)}")
 
-def verify_all():
+def verify_all(read_only: bool = False, require_env: bool = True):
     """Complete verification of the tool"""
     try:
         # Verify copyright
-        verify_copyright()
+        verify_copyright(read_only, require_env)
         
         # Verify runtime integrity
-        verify_runtime_integrity()
+        verify_runtime_integrity(require_env)
         
         # Additional runtime checks
         if os.environ.get('PYTHONDEVMODE') or os.environ.get('PYTHONDEBUG'):
@@ -229,89 +331,1221 @@ class DiscordAPIError(Exception):
         self.response_text = response_text
         super().__init__(f"{message} (Status: {status_code}, Response: {response_text})")
 
-class RateLimitHandler:
-    """Handles Discord API rate limiting"""
-    def __init__(self):
-        self.reset_after = 0
-        self.last_request = 0
-
-    async def handle_ratelimit(self):
-        """Wait if we're being rate limited"""
-        if time.time() < self.reset_after:
-            wait_time = self.reset_after - time.time()
-            logger.warning(f"Rate limited. Waiting {wait_time:.2f} seconds...")
+def snowflake_time(snowflake: str) -> float:
+    """Unix time at which a Discord id was created"""
+    return ((int(snowflake) >> 22) + DISCORD_EPOCH) / 1000
+
+class RetryPolicy:
+    """Decides whether and when a failed request is sent again, per class of failure"""
+    NETWORK = 'network'
+    SERVER = 'server'
+    RATE_LIMIT = 'rate_limit'
+    CLIENT = 'client'
+
+    def __init__(self, max_retries: int = MAX_RETRIES, base_delay: float = RATE_LIMIT_DELAY,
+                 max_delay: float = RETRY_MAX_DELAY, rate_limit_retries: int = RATE_LIMIT_RETRIES):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Retries allowed per class, client errors will fail the same way again
+        self.max_retries = {
+            self.NETWORK: max_retries,
+            self.SERVER: max_retries,
+            self.RATE_LIMIT: rate_limit_retries,
+            self.CLIENT: 0
+        }
+
+    @classmethod
+    def classify(cls, status: Optional[int]) -> str:
+        """Class of a failed response, None for a failure without a response"""
+        if status is None:
+            return cls.NETWORK
+        if status == 429:
+            return cls.RATE_LIMIT
+        if status in RETRYABLE_STATUSES:
+            return cls.SERVER
+        return cls.CLIENT
+
+    def should_retry(self, error_class: str, retries: int) -> bool:
+        """Whether a request that already failed this many times with this class may be sent again"""
+        return retries <= self.max_retries.get(error_class, 0)
+
+    def delay(self, error_class: str, retries: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait before the next attempt, honoring a Retry-After the server sent"""
+        if error_class == self.RATE_LIMIT:
+            return 0.0  # The rate limiter already holds the bucket until it resets
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # Exponential backoff with jitter, so failed requests do not come back in lockstep
+        backoff = min(self.max_delay, self.base_delay * 2 ** (retries - 1))
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+def parse_route(method: str, endpoint: str) -> Tuple[str, str]:
+    """Split an endpoint into its route template and major parameter"""
+    parts = endpoint.split('?', 1)[0].strip('/').split('/')
+    major = ''
+    for index, part in enumerate(parts):
+        if part.isdigit():
+            if not major and index and parts[index - 1] in MAJOR_PARAMETERS:
+                major = part
+            parts[index] = '{id}'
+    return f"{method.upper()} /{'/'.join(parts)}", major
+
+class RateLimitBucket:
+    """Tracks the request budget of a single Discord rate limit bucket"""
+    def __init__(self, key: str):
+        self.key = key
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = 1
+        self.reset_at = 0.0
+        self.window = 0.0  # Longest reset delay seen, an estimate of the bucket's window
+        self.lock = asyncio.Lock()
+
+    @property
+    def known(self) -> bool:
+        """Whether a response has told us how this bucket behaves"""
+        return self.limit is not None
+
+    async def reserve(self) -> float:
+        """Wait for a free slot in this bucket and claim it, returning the time waited"""
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            if self.remaining is None:
+                return waited
+            if self.remaining <= 0 and self.known and now >= self.reset_at:
+                self.remaining = self.limit
+            if self.remaining > 0 or now >= self.reset_at:
+                self.remaining -= 1
+                return waited
+            wait_time = self.reset_at - now
+            if wait_time > 0:
+                # Waiting for a known reset is routine, 429s are still logged as warnings
+                logger.debug(f"Bucket {self.key} exhausted. Waiting {wait_time:.2f} seconds...",
+                             extra={"bucket": self.key, "retry_after": round(wait_time, 3)})
             await asyncio.sleep(wait_time)
+            waited += wait_time
+
+    def update(self, headers) -> None:
+        """Update the bucket from the rate limit headers of a response"""
+        if 'X-RateLimit-Remaining' not in headers:
+            # Routes without rate limit headers are not limited per bucket
+            self.limit = 0
+            self.remaining = None
+            return
+
+        remaining = int(headers['X-RateLimit-Remaining'])
+        reset_after = float(headers.get('X-RateLimit-Reset-After', 0))
+        reset_at = time.monotonic() + reset_after
+        self.window = max(self.window, reset_after)
+        self.limit = int(headers.get('X-RateLimit-Limit', remaining + 1))
+        if self.remaining is None or reset_at > self.reset_at + 0.5:
+            # A new window started, the header is authoritative
+            self.remaining = remaining
+        else:
+            # Responses can arrive out of order, never hand back slots we already claimed
+            self.remaining = min(self.remaining, remaining)
+        self.reset_at = reset_at
 
-    def update_ratelimit(self, headers: Dict[str, str]):
+class RateLimitHandler:
+    """Handles Discord API rate limiting per bucket and globally"""
+    def __init__(self, paced: bool = True):
+        self.buckets: Dict[str, RateLimitBucket] = {}
+        self.route_buckets: Dict[str, str] = {}
+        self.global_reset_at = 0.0
+        self.global_window = deque()
+        self.paced = paced  # Whether requests wait for their limits, replays keep their recorded timing instead
+
+    def get_bucket(self, method: str, endpoint: str) -> RateLimitBucket:
+        """Get the bucket a request will be counted against"""
+        route, major = parse_route(method, endpoint)
+        key = f"{self.route_buckets.get(route, route)}:{major}"
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = RateLimitBucket(key)
+        return bucket
+
+    async def handle_global_ratelimit(self) -> float:
+        """Wait until the global limit allows another request, returning the time waited"""
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            if now < self.global_reset_at:
+                wait_time = self.global_reset_at - now
+            else:
+                while self.global_window and self.global_window[0] <= now - 1:
+                    self.global_window.popleft()
+                if len(self.global_window) < GLOBAL_RATE_LIMIT:
+                    self.global_window.append(now)
+                    return waited
+                wait_time = self.global_window[0] + 1 - now
+            await asyncio.sleep(wait_time)
+            waited += wait_time
+
+    @asynccontextmanager
+    async def acquire(self, method: str, endpoint: str):
+        """Wait for the bucket of a request, yielding it while the request is in flight"""
+        bucket = self.get_bucket(method, endpoint)
+        if not self.paced:
+            yield bucket
+            return
+        await bucket.lock.acquire()
+        held = True
+        try:
+            await bucket.reserve()
+            await self.handle_global_ratelimit()
+            if bucket.known:
+                # The budget is known, let queued requests go while this one is in flight.
+                # Unknown buckets stay locked until the response tells us their limit.
+                bucket.lock.release()
+                held = False
+            yield bucket
+        finally:
+            if held:
+                bucket.lock.release()
+
+    def update_ratelimit(self, bucket: RateLimitBucket, method: str, endpoint: str, headers) -> RateLimitBucket:
         """Update rate limit info from response headers"""
-        if 'X-RateLimit-Reset-After' in headers:
-            self.reset_after = time.time() + float(headers['X-RateLimit-Reset-After'])
+        bucket.update(headers)
+        bucket_hash = headers.get('X-RateLimit-Bucket')
+        if not bucket_hash:
+            return bucket
+
+        route, major = parse_route(method, endpoint)
+        self.route_buckets[route] = bucket_hash
+        key = f"{bucket_hash}:{major}"
+        shared = self.buckets.get(key)
+        if shared is None:
+            if self.buckets.get(bucket.key) is bucket:
+                del self.buckets[bucket.key]
+            bucket.key = key
+            self.buckets[key] = bucket
+            return bucket
+        if shared is not bucket:
+            shared.update(headers)
+        return shared
+
+    def known_limits(self) -> Dict[str, Tuple[int, float]]:
+        """Return the limit and window responses have reported for each route seen so far"""
+        limits = {}
+        for route, bucket_hash in self.route_buckets.items():
+            for bucket in self.buckets.values():
+                if bucket.key.startswith(f"{bucket_hash}:") and bucket.known and bucket.limit and bucket.window:
+                    limits[route] = (bucket.limit, bucket.window)
+                    break
+        return limits
+
+    def handle_too_many_requests(self, bucket: RateLimitBucket, headers, data: dict) -> float:
+        """Record a 429 response, returning how long the request has to wait"""
+        retry_after = float(data.get('retry_after') or headers.get('Retry-After', RATE_LIMIT_DELAY))
+        is_global = data.get('global') or headers.get('X-RateLimit-Global', '').lower() == 'true'
+        if is_global:
+            self.global_reset_at = time.monotonic() + retry_after
+        else:
+            bucket.remaining = 0
+            bucket.reset_at = time.monotonic() + retry_after
+        logger.warning(f"Rate limited ({'global' if is_global else bucket.key}). Waiting {retry_after} seconds...",
+                       extra={"bucket": 'global' if is_global else bucket.key, "status": 429, "retry_after": retry_after})
+        return retry_after
+
+# Stage of the operation a request is made for, set by the scheduler and read by the telemetry
+current_stage: contextvars.ContextVar = contextvars.ContextVar('current_stage', default='unstaged')
+
+def request_context(method: str, endpoint: str) -> dict:
+    """Structured log fields that identify a request"""
+    route, major = parse_route(method, endpoint)
+    return {
+        "route": route,
+        "method": method.upper(),
+        "guild_id": major if endpoint.startswith('/guilds/') else None
+    }
 
-class UserAPI:
-    """Handles Discord API interactions"""
-    def __init__(self, token: str):
-        self.token = token
-        self.headers = {
-            "Authorization": token,
-            "Content-Type": "application/json",
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+class StageFilter(logging.Filter):
+    """Stamp records with the stage of the operation that logged them"""
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, 'stage', None) is None:
+            record.stage = current_stage.get()
+        return True
+
+class RecordQueueHandler(logging.handlers.QueueHandler):
+    """Queue records with their message and traceback rendered, keeping them separate for the JSON log"""
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line, with the structured request fields they carry"""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for field in LOG_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+def configure_logging(log_file: str = LOG_FILE, level: str = LOG_LEVEL) -> logging.handlers.QueueListener:
+    """Route logging through a queue so writing records never blocks the event loop"""
+    global _log_listener
+    if _log_listener is not None:
+        return _log_listener
+
+    # The listener thread owns the slow handlers, callers only enqueue records
+    file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+                                                        encoding='utf-8', delay=True)
+    file_handler.setFormatter(JsonFormatter())
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = RecordQueueHandler(log_queue)
+    queue_handler.addFilter(StageFilter())
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, level, logging.INFO))
+    root.addHandler(queue_handler)
+
+    _log_listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+    return _log_listener
+
+class RequestStats:
+    """Request counters and latency histogram of one route template or stage"""
+    def __init__(self, name: str):
+        self.name = name
+        self.buckets: Dict[str, int] = {}  # Rate limit bucket, without its major parameter -> requests
+        self.count = 0
+        self.statuses: Dict[str, int] = {}
+        self.retries = 0
+        self.rate_limited = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)  # Last slot counts latencies above every bound
+        self.limiter_wait = 0.0
+
+    def observe(self, status: str, latency: float, waited: float, bucket: str):
+        """Record one response or network failure"""
+        self.count += 1
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status == '429':
+            self.rate_limited += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        self.limiter_wait += waited
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.histogram[index] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.count,
+            "statuses": self.statuses,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "cache_hits": self.cache_hits,
+            "coalesced": self.coalesced,
+            "latency_total": round(self.latency_total, 4),
+            "latency_avg": round(self.latency_total / self.count, 4) if self.count else 0.0,
+            "latency_max": round(self.latency_max, 4),
+            "latency_histogram": {
+                **{str(bound): count for bound, count in zip(LATENCY_BUCKETS, self.histogram)},
+                "+Inf": self.histogram[-1]
+            },
+            "limiter_wait": round(self.limiter_wait, 4),
+            "buckets": self.buckets
+        }
+
+def _prometheus_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class RequestMetrics:
+    """Per route and per stage telemetry of the requests made through a UserAPI"""
+    def __init__(self):
+        self.started_at = time.time()
+        self.routes: Dict[str, RequestStats] = {}
+        self.stages: Dict[str, RequestStats] = {}
+
+    def _stats(self, method: str, endpoint: str) -> List[RequestStats]:
+        route = parse_route(method, endpoint)[0]
+        stage = current_stage.get()
+        if route not in self.routes:
+            self.routes[route] = RequestStats(route)
+        if stage not in self.stages:
+            self.stages[stage] = RequestStats(stage)
+        return [self.routes[route], self.stages[stage]]
+
+    def observe(self, method: str, endpoint: str, status: Union[int, str], latency: float, waited: float, bucket: str = ''):
+        """Record a response, or a network failure as status 'error'"""
+        for stats in self._stats(method, endpoint):
+            stats.observe(str(status), latency, waited, bucket)
+
+    def retry(self, method: str, endpoint: str):
+        """Record that a request is about to be sent again"""
+        for stats in self._stats(method, endpoint):
+            stats.retries += 1
+
+    def served_from_cache(self, method: str, endpoint: str, coalesced: bool = False):
+        """Record a read answered by the read cache or by an identical request already in flight"""
+        for stats in self._stats(method, endpoint):
+            if coalesced:
+                stats.coalesced += 1
+            else:
+                stats.cache_hits += 1
+
+    def average_latency(self) -> Optional[float]:
+        """Mean response latency of the run so far, None before the first response"""
+        count = sum(stats.count for stats in self.routes.values())
+        return sum(stats.latency_total for stats in self.routes.values()) / count if count else None
+
+    def to_dict(self) -> dict:
+        return {
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(),
+            "duration": round(time.time() - self.started_at, 3),
+            "requests": sum(stats.count for stats in self.routes.values()),
+            "limiter_wait": round(sum(stats.limiter_wait for stats in self.routes.values()), 4),
+            "routes": {route: stats.to_dict() for route, stats in sorted(self.routes.items())},
+            "stages": {stage: stats.to_dict() for stage, stats in sorted(self.stages.items())}
         }
-        self.rate_limiter = RateLimitHandler()
-        self.session = None
+
+    def to_prometheus(self) -> str:
+        """Render the metrics in the Prometheus text exposition format"""
+        lines = [
+            "# HELP discopy_run_duration_seconds Wall time of the run",
+            "# TYPE discopy_run_duration_seconds gauge",
+            f"discopy_run_duration_seconds {time.time() - self.started_at:.3f}"
+        ]
+        for label, group in (('route', self.routes), ('stage', self.stages)):
+            prefix = f"discopy_{label}"
+            lines += [
+                f"# HELP {prefix}_requests_total Discord API requests by {label} and status",
+                f"# TYPE {prefix}_requests_total counter"
+            ]
+            for name, stats in sorted(group.items()):
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'{prefix}_requests_total{{{label}="{_prometheus_label(name)}",status="{status}"}} {count}')
+            lines += [
+                f"# HELP {prefix}_request_duration_seconds Discord API response latency by {label}",
+                f"# TYPE {prefix}_request_duration_seconds histogram"
+            ]
+            for name, stats in sorted(group.items()):
+                labels = f'{label}="{_prometheus_label(name)}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, stats.histogram):
+                    cumulative += count
+                    lines.append(f'{prefix}_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.count}')
+                lines.append(f'{prefix}_request_duration_seconds_sum{{{labels}}} {stats.latency_total:.6f}')
+                lines.append(f'{prefix}_request_duration_seconds_count{{{labels}}} {stats.count}')
+            for metric, kind, help_text, attr in (
+                ('retries_total', 'counter', 'Requests sent again after a failure', 'retries'),
+                ('rate_limited_total', 'counter', 'Responses with status 429', 'rate_limited'),
+                ('cache_hits_total', 'counter', 'Reads answered from the read cache', 'cache_hits'),
+                ('coalesced_total', 'counter', 'Reads that joined an identical read in flight', 'coalesced'),
+                ('ratelimit_wait_seconds_total', 'counter', 'Time spent waiting in the rate limiter', 'limiter_wait')
+            ):
+                lines += [f"# HELP {prefix}_{metric} {help_text} by {label}", f"# TYPE {prefix}_{metric} {kind}"]
+                for name, stats in sorted(group.items()):
+                    lines.append(f'{prefix}_{metric}{{{label}="{_prometheus_label(name)}"}} {getattr(stats, attr)}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory: str = METRICS_DIR) -> Tuple[str, str]:
+        """Write the JSON summary of this run and replace the Prometheus textfile, returning both paths"""
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.fromtimestamp(self.started_at).strftime('%Y%m%d-%H%M%S-%f')
+        summary_path = os.path.join(directory, f"run-{stamp}.json")
+        with open(summary_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        # Timestamped names sort oldest first
+        summaries = sorted(name for name in os.listdir(directory) if name.startswith('run-') and name.endswith('.json'))
+        for name in summaries[:-max(1, METRICS_KEEP)]:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+        # Written aside and renamed so a textfile collector never reads a partial file
+        textfile_path = os.path.join(directory, "discopy.prom")
+        with open(f"{textfile_path}.tmp", 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(f"{textfile_path}.tmp", textfile_path)
+        return summary_path, textfile_path
+
+class ProfileFrame:
+    """Where the time of one coroutine, or of all coroutines sharing a name, went"""
+    __slots__ = ('path', 'count', 'wall', 'cpu', 'rate_limit', 'network', 'cdn', 'owns_waits')
+
+    def __init__(self, path: Tuple[str, ...], owns_waits: bool = True):
+        self.path = path
+        self.count = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.rate_limit = 0.0  # Blocked in the RateLimitHandler
+        self.network = 0.0  # API requests in flight
+        self.cdn = 0.0  # Asset downloads in flight
+        self.owns_waits = owns_waits  # False when the rest of the wall time is spent waiting on child frames
+
+    @property
+    def other(self) -> float:
+        """Wall time outside the measured categories, retry backoff, worker processes and shared reads"""
+        if not self.owns_waits:
+            return 0.0
+        return max(0.0, self.wall - self.cpu - self.rate_limit - self.network - self.cdn)
+
+# Frame that requests made in this context are attributed to, set while a run is profiled
+current_profile: contextvars.ContextVar = contextvars.ContextVar('current_profile', default=None)
+
+class _CpuTimed:
+    """Drives a coroutine and adds the CPU time of each of its steps to a frame"""
+    __slots__ = ('coro', 'frame')
+
+    def __init__(self, coro: Awaitable, frame: ProfileFrame):
+        self.coro = coro
+        self.frame = frame
+
+    def __await__(self):
+        inner = self.coro.__await__()
+        send, value = inner.send, None
+        while True:
+            started = time.thread_time()
+            try:
+                yielded = send(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.frame.cpu += time.thread_time() - started
+            try:
+                value, send = (yield yielded), inner.send
+            except BaseException as e:
+                value, send = e, inner.throw
+
+class RunProfiler:
+    """Splits the wall time of a run's coroutines into rate limit waits, network, CDN, CPU and other time"""
+    def __init__(self, name: str):
+        self.root = ProfileFrame((name,), owns_waits=False)
+        self.frames: Dict[Tuple[str, ...], ProfileFrame] = {self.root.path: self.root}
+
+    def frame(self, *names: str) -> ProfileFrame:
+        """Get the frame of a coroutine below the run, frames are shared by name"""
+        path = self.root.path + tuple(name.replace(';', ':') for name in names)
+        frame = self.frames.get(path)
+        if frame is None:
+            frame = self.frames[path] = ProfileFrame(path)
+        return frame
+
+    async def measure(self, frame: ProfileFrame, coro: Awaitable):
+        """Await a coroutine, attributing its time and the requests it makes to a frame"""
+        token = current_profile.set(frame)
+        started = time.perf_counter()
+        try:
+            return await _CpuTimed(coro, frame)
+        finally:
+            frame.wall += time.perf_counter() - started
+            frame.count += 1
+            current_profile.reset(token)
+
+    def call(self, frame: ProfileFrame, function: Callable, *args):
+        """Call a function, attributing its time to a frame"""
+        started, cpu = time.perf_counter(), time.thread_time()
+        try:
+            return function(*args)
+        finally:
+            frame.cpu += time.thread_time() - cpu
+            frame.wall += time.perf_counter() - started
+            frame.count += 1
+
+    def folded(self) -> List[str]:
+        """Render the frames as folded stacks in microseconds, the input format of flamegraph.pl, inferno and speedscope"""
+        lines = []
+        for frame in self.frames.values():
+            for category in PROFILE_CATEGORIES:
+                micros = int(getattr(frame, category) * 1_000_000)
+                if micros > 0:
+                    lines.append(f"{';'.join(frame.path)};{category} {micros}")
+        return lines
+
+    def write(self, path: str):
+        with open(path, 'w') as f:
+            f.write('\n'.join(self.folded()) + '\n')
+
+    def stage_totals(self) -> Dict[Tuple[str, ...], ProfileFrame]:
+        """Sum the frames of each phase and stage"""
+        totals: Dict[Tuple[str, ...], ProfileFrame] = {}
+        for path, frame in self.frames.items():
+            if len(path) < 3:
+                continue
+            total = totals.get(path[1:3])
+            if total is None:
+                total = totals[path[1:3]] = ProfileFrame(path[1:3])
+            if path[-1] != 'progress':
+                total.count += frame.count
+            for field in ('wall', 'cpu', 'rate_limit', 'network', 'cdn'):
+                setattr(total, field, getattr(total, field) + getattr(frame, field))
+        return totals
+
+def payload_hash(payload) -> Optional[str]:
+    """Identify a request body without storing it, uploads can be megabytes"""
+    if payload is None:
+        return None
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()).hexdigest()[:16]
+
+class Cassette:
+    """Recorded responses of a run's API and CDN requests, with their timing, that a replay serves back"""
+    def __init__(self, interactions: Optional[List[dict]] = None, command: Optional[dict] = None):
+        self.interactions = interactions or []
+        self.command = command or {}  # Command line arguments of the recorded run
+        self.started = time.perf_counter()
+        self.served = 0
+        self.missed = 0
+        self._queues: Optional[Dict[tuple, deque]] = None
+
+    def record(self, channel: str, method: str, path: str, payload, sent_at: float, latency: float,
+               status: Optional[int] = None, headers=None, body: bytes = b'', error: Optional[str] = None):
+        """Add a response, or the network error that came instead, to the cassette"""
+        interaction = {
+            "channel": channel,  # 'api' or 'cdn'
+            "method": method,
+            "path": path,
+            "payload": payload_hash(payload),
+            "at": round(sent_at - self.started, 4),
+            "latency": round(latency, 4)
+        }
+        if error is not None:
+            interaction["error"] = error
+        else:
+            interaction["status"] = status
+            interaction["headers"] = {
+                name: value for name, value in (headers or {}).items() if name.lower().startswith(CASSETTE_HEADERS)
+            }
+            try:
+                interaction["body"] = body.decode('utf-8') if channel == 'api' else base64.b64encode(body).decode('ascii')
+            except UnicodeDecodeError:
+                interaction["body"] = ''
+        self.interactions.append(interaction)
+
+    def take(self, channel: str, method: str, path: str, payload) -> Optional[dict]:
+        """Hand out the next unused interaction for a request, preferring one with the same body"""
+        if self._queues is None:
+            self._queues = {}
+            for interaction in self.interactions:
+                interaction['used'] = False
+                base = (interaction['channel'], interaction['method'], interaction['path'])
+                self._queues.setdefault(base + (interaction['payload'],), deque()).append(interaction)
+                self._queues.setdefault(base, deque()).append(interaction)
+        # Concurrent requests can arrive in another order than they were recorded in
+        base = (channel, method, path)
+        for key in (base + (payload_hash(payload),), base):
+            candidates = self._queues.get(key)
+            while candidates:
+                interaction = candidates.popleft()
+                if not interaction['used']:
+                    interaction['used'] = True
+                    self.served += 1
+                    return interaction
+        self.missed += 1
+        return None
+
+    def save(self, path: str):
+        """Write the cassette as compact JSON, gzip compressed when the path ends in .gz"""
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'wt', encoding='utf-8') as f:
+            json.dump({
+                "format": CASSETTE_FORMAT,
+                "version": CASSETTE_VERSION,
+                "created_at": datetime.utcnow().isoformat() + "Z",
+                "command": self.command,
+                "interactions": [{k: v for k, v in i.items() if k != 'used'} for i in self.interactions]
+            }, f, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path: str) -> 'Cassette':
+        """Read a cassette written by save"""
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or data.get('format') != CASSETTE_FORMAT:
+            raise ValueError(f"{path} is not a Discopy cassette")
+        if data.get('version', 0) > CASSETTE_VERSION:
+            raise ValueError(f"Cassette version {data['version']} is newer than supported version {CASSETTE_VERSION}")
+        return cls(data.get('interactions', []), data.get('command', {}))
+
+class ReplayResponse:
+    """A recorded response, answering the parts of aiohttp's response API the clients use"""
+    def __init__(self, interaction: dict, time_scale: float):
+        from multidict import CIMultiDict
+        self.status = interaction['status']
+        self.headers = CIMultiDict(interaction.get('headers', {}))
+        for name in CASSETTE_SCALED_HEADERS:
+            if name in self.headers:
+                self.headers[name] = str(float(self.headers[name]) * time_scale)
+        body = interaction.get('body', '')
+        self._body = body.encode('utf-8') if interaction['channel'] == 'api' else base64.b64decode(body)
+        self.time_scale = time_scale
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    async def read(self) -> bytes:
+        return self._body
+
+    async def text(self) -> str:
+        return self._body.decode('utf-8')
+
+    async def json(self, content_type: Optional[str] = 'application/json'):
+        data = decode_json(self._body) if self._body else None
+        if self.status == 429 and isinstance(data, dict) and 'retry_after' in data:
+            data['retry_after'] = float(data['retry_after']) * self.time_scale
+        return data
+
+def encode_json(data) -> bytes:
+    """Serialize a request body, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+def decode_json(body: bytes):
+    """Parse a response body, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+class HTTPTransport:
+    """The one pooled connection behind every API, token and CDN request, recording or replaying them on request"""
+    def __init__(self, api_url: str = BASE_URL, cdn_url: str = CDN_URL, timeout: Optional[float] = None,
+                 recorder: Optional[Cassette] = None, replay: Optional[Cassette] = None, replay_scale: float = 1.0):
+        import aiohttp  # Most of discopy's import time, so only loaded once a transport is built
+        self.base_urls = {'api': api_url, 'token': api_url, 'cdn': cdn_url}
+        seconds = dict(REQUEST_TIMEOUTS, **({'api': float(timeout)} if timeout else {}))
+        self.timeouts = {kind: aiohttp.ClientTimeout(total=total, sock_connect=min(total, CONNECT_TIMEOUT))
+                         for kind, total in seconds.items()}
+        self.recorder = recorder  # Cassette every response is added to
+        self.replay = replay  # Cassette that answers requests instead of the network
+        self.replay_scale = replay_scale
+        self.replay_started = 0.0
+        self.session: Optional[aiohttp.ClientSession] = None
 
     async def __aenter__(self):
-        """Initialize aiohttp session when entering context"""
-        self.session = aiohttp.ClientSession(headers=self.headers)
+        """Open the connection pool, a replay needs none"""
+        import aiohttp
+        self.replay_started = time.perf_counter()
+        if self.replay is None:
+            connector = aiohttp.TCPConnector(limit=HTTP_LIMIT, limit_per_host=HTTP_LIMIT_PER_HOST,
+                                             ttl_dns_cache=DNS_CACHE_TTL, keepalive_timeout=KEEPALIVE_TIMEOUT)
+            self.session = aiohttp.ClientSession(connector=connector)
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        """Close aiohttp session when exiting context"""
+        """Close the connection pool"""
         if self.session:
             await self.session.close()
             self.session = None
 
-    async def request(self, method: str, endpoint: str, **kwargs) -> dict:
-        """Make an API request with rate limit handling and retries"""
+    @asynccontextmanager
+    async def request(self, kind: str, method: str, path: str, headers: Optional[dict] = None, payload=None):
+        """Send a request of a class ('api', 'token' or 'cdn') and yield its response"""
+        import aiohttp
+        channel = 'cdn' if kind == 'cdn' else 'api'
+        if self.replay is not None:
+            interaction = self.replay.take(channel, method, path, payload)
+            if interaction is None:
+                raise aiohttp.ClientConnectionError(f"No recorded response for {method} {path}")
+            # Not sent before its recorded time, then answered after its recorded latency, both scaled
+            delay = self.replay_started + interaction['at'] * self.replay_scale - time.perf_counter()
+            delay = max(0.0, delay) + interaction['latency'] * self.replay_scale
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if 'error' in interaction:
+                raise aiohttp.ClientConnectionError(interaction['error'])
+            yield ReplayResponse(interaction, self.replay_scale)
+            return
         if not self.session:
             raise RuntimeError("Session not initialized. Use 'async with' context manager.")
 
-        url = f"{BASE_URL}{endpoint}"
-        retries = 0
+        sent_at = time.perf_counter()
+        responded = False
+        try:
+            async with self.session.request(method, f"{self.base_urls[kind]}{path}", headers=headers,
+                                            data=encode_json(payload) if payload is not None else None,
+                                            timeout=self.timeouts[kind]) as resp:
+                responded = True
+                if self.recorder is not None:
+                    self.recorder.record(channel, method, path, payload, sent_at, time.perf_counter() - sent_at,
+                                         resp.status, resp.headers, await resp.read())
+                yield resp
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if self.recorder is not None and not responded:
+                self.recorder.record(channel, method, path, payload, sent_at, time.perf_counter() - sent_at,
+                                     error=str(e) or type(e).__name__)
+            raise
 
-        while retries < MAX_RETRIES:
-            await self.rate_limiter.handle_ratelimit()
+def asset_key(kind: str, asset_id: str, asset_hash: Optional[str] = None) -> str:
+    """Build the identity of an asset from its kind, id and hash"""
+    return f"{kind}:{asset_id}:{asset_hash or ''}"
+
+class AssetCache:
+    """On-disk cache of asset data URIs keyed by asset id and hash, evicting least recently used files"""
+    def __init__(self, directory: str = ASSET_CACHE_DIR, max_bytes: int = ASSET_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, int]" = OrderedDict()  # Cache key -> size, least recently used first
+        self.size = 0
+        self._load_index()
+
+    @staticmethod
+    def key(kind: str, asset_id: str, asset_hash: Optional[str] = None) -> str:
+        """Build the content address of an asset"""
+        return hashlib.sha256(asset_key(kind, asset_id, asset_hash).encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _load_index(self):
+        """Rebuild the LRU order from the files already on disk"""
+        if not os.path.isdir(self.directory):
+            return
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, key, size in sorted(files):
+            self.entries[key] = size
+            self.size += size
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached data URI and mark it as recently used"""
+        if key not in self.entries:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            self.size -= self.entries.pop(key)
+            return None
+        self.entries.move_to_end(key)
+        return data
+
+    def put(self, key: str, data: str):
+        """Store a data URI, evicting the least recently used assets beyond the size cap"""
+        size = len(data)
+        if size > self.max_bytes:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{self._path(key)}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            logger.warning(f"Failed to cache asset {key}: {str(e)}")
+            return
 
+        self.size += size - self.entries.pop(key, 0)
+        self.entries[key] = size
+        while self.size > self.max_bytes and self.entries:
+            evicted, evicted_size = self.entries.popitem(last=False)
+            self.size -= evicted_size
             try:
-                async with self.session.request(method, url, **kwargs) as resp:
-                    self.rate_limiter.update_ratelimit(resp.headers)
+                os.remove(self._path(evicted))
+            except OSError:
+                pass
+
+def encode_data_uri(data: bytes, mime_type: str) -> str:
+    """Build the base64 data URI Discord expects for uploaded images"""
+    # Kept as text, the form the asset cache and snapshots store it in. Encoding is about 1ms per 256 KB
+    # and serializing the body about 0.3ms more, small next to the upload, so it is not spliced into the body as bytes.
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+def shrink_asset(data: bytes, mime_type: str, max_bytes: int) -> Optional[str]:
+    """Recompress, then downscale, an image until it fits an upload limit, returning its data URI"""
+    # Runs in a worker process, Pillow is only needed when an asset is over its limit
+    try:
+        from PIL import Image, ImageSequence
+    except ImportError:
+        return None
+    if mime_type not in ('image/png', 'image/gif'):
+        return None  # Lottie JSON cannot be made smaller without changing it
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        image_format = 'GIF' if mime_type == 'image/gif' else 'PNG'
+        frames = [frame.copy() for frame in ImageSequence.Iterator(image)]
+        durations = [frame.info.get('duration', image.info.get('duration', 100)) for frame in frames]
+        scale = 1.0
+        for _ in range(ASSET_SHRINK_ATTEMPTS):
+            size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+            resized = [frame if scale == 1.0 else frame.resize(size, Image.LANCZOS) for frame in frames]
+            output = io.BytesIO()
+            if len(resized) > 1:
+                resized[0].save(output, format=image_format, save_all=True, append_images=resized[1:],
+                                duration=durations, loop=image.info.get('loop', 0), optimize=True, disposal=2)
+            else:
+                resized[0].save(output, format=image_format, optimize=True)
+            if output.tell() <= max_bytes:
+                return encode_data_uri(output.getvalue(), mime_type)
+            # Bytes grow roughly with the pixel count, aim a little under the limit
+            scale *= min(0.9, max(0.5, (max_bytes / output.tell()) ** 0.5 * 0.95))
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning(f"Failed to shrink {mime_type} asset: {str(e)}")
+    return None
+
+class AssetClient:
+    """Downloads icons, emojis and stickers from the Discord CDN through the shared transport"""
+    def __init__(self, transport: HTTPTransport, prefetch_depth: int = ASSET_PREFETCH_DEPTH, cache: Optional[AssetCache] = None):
+        self.transport = transport
+        self.prefetch_depth = max(1, prefetch_depth)
+        # Recorded runs download every asset so their replay does not depend on this machine's cache
+        self.cache = cache if transport.recorder is None and transport.replay is None else None
+        self.pool: Optional[ProcessPoolExecutor] = None
+
+    async def __aenter__(self):
+        return self
 
-                    if resp.status == 429:  # Rate limited
-                        retry_after = float(resp.headers.get('Retry-After', RATE_LIMIT_DELAY))
-                        logger.warning(f"Rate limited. Waiting {retry_after} seconds...")
-                        await asyncio.sleep(retry_after)
-                        retries += 1
-                        continue
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Stop the transcoding workers"""
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    async def download(self, path: str) -> Optional[bytes]:
+        """Download an asset, returning None if the CDN does not have it"""
+        sent_at = time.perf_counter()
+        try:
+            async with self.transport.request('cdn', 'GET', path) as resp:
+                if resp.status == 200:
+                    return await resp.read()
+                logger.warning(f"CDN download of {path} failed with status {resp.status}")
+                return None
+        finally:
+            profile = current_profile.get()
+            if profile is not None:
+                profile.cdn += time.perf_counter() - sent_at
+
+    async def data_uri(self, path: str, mime_type: str = "image/png", max_bytes: Optional[int] = None) -> Optional[str]:
+        """Download an asset as a base64 data URI ready to be uploaded, shrinking it to fit max_bytes"""
+        data = await self.download(path)
+        if data is None:
+            return None
+        if max_bytes is None or len(data) <= max_bytes:
+            return encode_data_uri(data, mime_type)
+
+        # Image work is CPU bound, keep it off the event loop
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=max(1, ASSET_TRANSCODE_WORKERS))
+        try:
+            shrunk = await asyncio.get_running_loop().run_in_executor(self.pool, shrink_asset, data, mime_type, max_bytes)
+        except Exception as e:
+            # A worker that crashed or ran out of memory skips this asset, not the whole stage
+            logger.warning(f"Failed to shrink {mime_type} asset {path}: {str(e)}")
+            shrunk = None
+        if shrunk is None:
+            logger.warning(f"Asset {path} is {len(data)} bytes, over the {max_bytes} byte upload limit and could not be shrunk")
+        return shrunk
+
+    async def fetch(self, kind: str, asset_id: str, path: str, asset_hash: Optional[str] = None, mime_type: str = "image/png") -> Optional[str]:
+        """Get an asset data URI from the cache, downloading it on a miss"""
+        key = AssetCache.key(kind, asset_id, asset_hash)
+        if self.cache:
+            cached = self.cache.get(key)
+            if cached:
+                return cached
+        data = await self.data_uri(path, mime_type, ASSET_SIZE_LIMITS.get(kind))
+        if data and self.cache:
+            self.cache.put(key, data)
+        return data
+
+    async def prefetch(self, items: List[dict], fetch: Callable[[dict], Awaitable]) -> AsyncIterator[Tuple[dict, asyncio.Future]]:
+        """Yield each item with its pending download, keeping the next downloads in flight"""
+        iterator = iter(items)
+        pending = deque()
+
+        def schedule_next():
+            for item in iterator:
+                pending.append((item, asyncio.ensure_future(fetch(item))))
+                break
+
+        for _ in range(self.prefetch_depth):
+            schedule_next()
+        try:
+            while pending:
+                item, download = pending.popleft()
+                schedule_next()
+                yield item, download
+        finally:
+            for _, download in pending:
+                download.cancel()
+
+def _resource_path(endpoint: str) -> str:
+    return endpoint.split('?', 1)[0].rstrip('/')
+
+class ReadCache:
+    """Short-lived cache of GET responses and reads in flight, dropped when a write touches the same resource"""
+    def __init__(self, default_ttl: float = READ_CACHE_TTL, ttls: Optional[Dict[str, float]] = None):
+        self.default_ttl = default_ttl
+        self.ttls = {**READ_CACHE_TTLS, **(ttls or {})}
+        self.entries: Dict[str, Tuple[float, object]] = {}  # Endpoint -> (expiry, response)
+        self.inflight: Dict[str, asyncio.Future] = {}
+
+    def ttl(self, endpoint: str) -> float:
+        return self.ttls.get(parse_route('GET', endpoint)[0], self.default_ttl)
+
+    def get(self, endpoint: str) -> Tuple[bool, object]:
+        """Return whether a fresh response is cached and a copy of it"""
+        entry = self.entries.get(endpoint)
+        if entry is None:
+            return False, None
+        if time.monotonic() >= entry[0]:
+            del self.entries[endpoint]
+            return False, None
+        return True, copy.deepcopy(entry[1])
+
+    def complete(self, endpoint: str, future: asyncio.Future):
+        """Cache the response of a finished read, unless a write invalidated it while it was in flight"""
+        if self.inflight.get(endpoint) is not future:
+            return
+        del self.inflight[endpoint]
+        if future.cancelled() or future.exception() is not None:
+            return
+        ttl = self.ttl(endpoint)
+        if ttl > 0:
+            self.entries[endpoint] = (time.monotonic() + ttl, copy.deepcopy(future.result()))
+
+    @staticmethod
+    def related(write_path: str, read_path: str) -> bool:
+        """Whether a write to one path can change the response of a read of another"""
+        if read_path == write_path or read_path.startswith(f"{write_path}/") or write_path.startswith(f"{read_path}/"):
+            return True
+        # Channel routes do not name their guild, so any guild's channel list may have changed
+        return write_path.startswith('/channels/') and read_path.endswith('/channels')
+
+    def invalidate(self, endpoint: str):
+        """Drop cached and in-flight reads of every resource a write to this endpoint can change"""
+        path = _resource_path(endpoint)
+        for key in [key for key in self.entries if self.related(path, _resource_path(key))]:
+            del self.entries[key]
+        for key in [key for key in self.inflight if self.related(path, _resource_path(key))]:
+            # The read still completes for its callers, but its response is not kept
+            del self.inflight[key]
+
+    def clear(self):
+        """Drop every cached response and cancel reads in flight"""
+        for future in self.inflight.values():
+            future.cancel()
+        self.inflight.clear()
+        self.entries.clear()
 
-                    if resp.status == 404:
-                        raise DiscordAPIError("Resource not found", resp.status, await resp.text())
+class UserAPI:
+    """Handles Discord API interactions"""
+    def __init__(self, token: str, base_url: str = BASE_URL, cdn_url: str = CDN_URL, metrics_dir: Optional[str] = METRICS_DIR,
+                 retry_policy: Optional[RetryPolicy] = None, recorder: Optional[Cassette] = None,
+                 replay: Optional[Cassette] = None, replay_scale: float = 1.0, timeout: Optional[float] = None):
+        self.token = token
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.transport = HTTPTransport(base_url, cdn_url, timeout, recorder, replay, replay_scale)
+        self.created_ids = set()  # Objects this session's create calls were told about
+        self.metrics = RequestMetrics()
+        self.metrics_dir = metrics_dir
+        self.headers = {
+            "Authorization": token,
+            "Content-Type": "application/json",
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+        }
+        # A replay is paced by its recorded offsets alone, waiting on the recorded limits as well would count them twice
+        self.rate_limiter = RateLimitHandler(paced=replay is None)
+        self.read_cache = ReadCache()
+        self.assets = AssetClient(self.transport, cache=AssetCache())
 
-                    if resp.status == 403:
-                        raise DiscordAPIError("Permission denied", resp.status, await resp.text())
+    async def __aenter__(self):
+        """Open the shared transport when entering context"""
+        await self.transport.__aenter__()
+        await self.assets.__aenter__()
+        return self
 
-                    if resp.status >= 400:
-                        raise DiscordAPIError("API request failed", resp.status, await resp.text())
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Close the shared transport when exiting context"""
+        self.read_cache.clear()
+        await self.assets.__aexit__(exc_type, exc_val, exc_tb)
+        await self.transport.__aexit__(exc_type, exc_val, exc_tb)
+        if self.metrics_dir and self.metrics.routes:
+            try:
+                summary_path, textfile_path = self.metrics.write(self.metrics_dir)
+                logger.info(f"Request metrics written to {summary_path} and {textfile_path}")
+            except OSError as e:
+                logger.warning(f"Failed to write request metrics: {str(e)}")
 
-                    return await resp.json() if resp.status != 204 else {}
+    async def verify_token(self) -> bool:
+        """Check the token against the current user, straight to the API"""
+        try:
+            async with self.transport.request('token', 'GET', '/users/@me', headers=self.headers) as resp:
+                if resp.status == 200:
+                    user_data = decode_json(await resp.read())
+                    logger.info(f"Token verified for user: {user_data.get('username', 'Unknown')}")
+                    return True
+                logger.error(f"Token verification failed with status {resp.status}")
+                return False
+        except Exception as e:
+            logger.error(f"Token verification error: {str(e)}")
+            return False
 
-            except aiohttp.ClientError as e:
-                logger.error(f"Network error: {str(e)}")
-                retries += 1
-                if retries < MAX_RETRIES:
-                    await asyncio.sleep(RATE_LIMIT_DELAY * retries)
-                else:
-                    raise DiscordAPIError(f"Max retries exceeded: {str(e)}")
+    async def request(self, method: str, endpoint: str, **kwargs) -> dict:
+        """Make an API request, answering repeated reads from the read cache and invalidating it on writes"""
+        method = method.upper()
+        if method != 'GET' or kwargs:
+            try:
+                return await self._send(method, endpoint, **kwargs)
+            finally:
+                # Even a failed write may have been applied
+                if method != 'GET':
+                    self.read_cache.invalidate(endpoint)
+
+        hit, data = self.read_cache.get(endpoint)
+        if hit:
+            self.metrics.served_from_cache(method, endpoint)
+            return data
+        future = self.read_cache.inflight.get(endpoint)
+        if future is not None:
+            self.metrics.served_from_cache(method, endpoint, coalesced=True)
+            return copy.deepcopy(await asyncio.shield(future))
+
+        future = self.read_cache.inflight[endpoint] = asyncio.ensure_future(self._send(method, endpoint))
+        future.add_done_callback(lambda done: self.read_cache.complete(endpoint, done))
+        return await asyncio.shield(future)
+
+    async def _send(self, method: str, endpoint: str, **kwargs) -> dict:
+        """Send an API request with rate limit handling and retries"""
+        import aiohttp
+        payload = kwargs.get('json')
+        retries: Dict[str, int] = {}
+        first_sent_at: Optional[float] = None
 
-        raise DiscordAPIError("Max retries exceeded")
+        while True:
+            queued_at = sent_at = time.perf_counter()
+            observed = False
+            retry_after = None
+            try:
+                async with self.rate_limiter.acquire(method, endpoint) as bucket:
+                    sent_at = time.perf_counter()
+                    if first_sent_at is None:
+                        first_sent_at = time.time()
+                    async with self.transport.request('api', method, endpoint, self.headers, payload) as resp:
+                        latency = time.perf_counter() - sent_at
+                        shared = self.rate_limiter.update_ratelimit(bucket, method, endpoint, resp.headers)
+                        self.metrics.observe(method, endpoint, resp.status, latency, sent_at - queued_at,
+                                            shared.key.rsplit(':', 1)[0])
+                        observed = True
+                        profile = current_profile.get()
+                        if profile is not None:
+                            profile.rate_limit += sent_at - queued_at
+                            profile.network += latency
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug(f"{method} {endpoint} -> {resp.status} in {latency * 1000:.0f}ms", extra={
+                                **request_context(method, endpoint), "status": resp.status,
+                                "latency": round(latency, 4), "bucket": shared.key
+                            })
+
+                        if resp.status == 429:  # Rate limited, the bucket waits before the retry
+                            try:
+                                data = await resp.json(content_type=None)
+                            except (aiohttp.ContentTypeError, ValueError):
+                                data = {}
+                            self.rate_limiter.handle_too_many_requests(bucket, resp.headers, data or {})
+                            error = DiscordAPIError("Max retries exceeded", resp.status)
+                        elif resp.status in RETRYABLE_STATUSES:
+                            error = DiscordAPIError("API request failed", resp.status, await resp.text())
+                            if resp.headers.get('Retry-After'):
+                                try:
+                                    retry_after = float(resp.headers['Retry-After'])
+                                except ValueError:
+                                    pass
+                        elif resp.status == 404:
+                            raise DiscordAPIError("Resource not found", resp.status, await resp.text())
+                        elif resp.status == 403:
+                            raise DiscordAPIError("Permission denied", resp.status, await resp.text())
+                        elif resp.status >= 400:
+                            raise DiscordAPIError("API request failed", resp.status, await resp.text())
+                        else:
+                            body = await resp.read()
+                            result = (decode_json(body) if body else None) if resp.status != 204 else {}
+                            if method == 'POST' and isinstance(result, dict) and 'id' in result:
+                                self.created_ids.add(result['id'])
+                            return result
+                        error_class = self.retry_policy.classify(resp.status)
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"Network error: {str(e)}", extra={
+                    **request_context(method, endpoint), "latency": round(time.perf_counter() - sent_at, 4)
+                })
+                if not observed:
+                    self.metrics.observe(method, endpoint, 'error', time.perf_counter() - sent_at, sent_at - queued_at)
+                    profile = current_profile.get()
+                    if profile is not None:
+                        profile.rate_limit += sent_at - queued_at
+                        profile.network += time.perf_counter() - sent_at
+                error = DiscordAPIError(f"Max retries exceeded: {str(e)}")
+                error_class = self.retry_policy.classify(None)
+
+            retries[error_class] = retries.get(error_class, 0) + 1
+            if not self.retry_policy.should_retry(error_class, retries[error_class]):
+                raise error
+
+            # A create that failed without a clear answer may still have been applied
+            if error_class in (RetryPolicy.NETWORK, RetryPolicy.SERVER) and first_sent_at is not None:
+                created = await self._find_created(method, endpoint, payload, first_sent_at)
+                if created is not None:
+                    self.created_ids.add(created['id'])
+                    logger.warning(f"{method} {endpoint} was applied despite the error, not sending it again",
+                                   extra=request_context(method, endpoint))
+                    return created
+
+            self.metrics.retry(method, endpoint)
+            delay = self.retry_policy.delay(error_class, retries[error_class], retry_after)
+            if delay > 0 and self.rate_limiter.paced:
+                await asyncio.sleep(delay)
+
+    async def _find_created(self, method: str, endpoint: str, payload: Optional[dict], since: float) -> Optional[dict]:
+        """Look for the object a failed create call made anyway, so retrying does not create it twice"""
+        if parse_route(method, endpoint)[0] not in CREATE_ROUTES or not payload or not payload.get('name'):
+            return None
+        try:
+            # Straight to the API, a cached listing predates the create
+            existing = await self._send('GET', endpoint)
+        except DiscordAPIError:
+            return None
+        for item in existing or []:
+            if item.get('name') != payload['name'] or item.get('id') in self.created_ids:
+                continue
+            if 'type' in payload and item.get('type') != payload['type']:
+                continue
+            if payload.get('parent_id') and item.get('parent_id') != payload['parent_id']:
+                continue
+            # Only objects created since the first attempt, older ones with the same name are not ours
+            if snowflake_time(item['id']) >= since - CREATE_LOOKUP_SKEW:
+                return item
+        return None
 
 def load_config() -> dict:
     """Load configuration from config.json"""
@@ -332,113 +1566,1200 @@ def save_config(config: dict):
     except Exception as e:
         logger.error(f"Failed to save config: {str(e)}")
 
+class RunConfig:
+    """Which stages a copy or clean runs and how, from the features and settings of config.json"""
+    __slots__ = RUN_FEATURES + ('max_retries', 'timeout', 'rate_limit_delay', 'concurrency', 'clean_concurrency')
+
+    def __init__(self, copy_settings: bool = True, copy_emojis: bool = True, copy_stickers: bool = True,
+                 copy_webhooks: bool = True, clean_target: bool = True, max_retries: int = MAX_RETRIES,
+                 timeout: Optional[float] = None, rate_limit_delay: float = RATE_LIMIT_DELAY,
+                 concurrency: Optional[Dict[str, int]] = None, clean_concurrency: Optional[Dict[str, int]] = None):
+        self.copy_settings = copy_settings
+        self.copy_emojis = copy_emojis
+        self.copy_stickers = copy_stickers
+        self.copy_webhooks = copy_webhooks  # Webhooks are not copied yet, kept so the section round-trips
+        self.clean_target = clean_target
+        self.max_retries = max_retries
+        self.timeout = timeout  # Seconds per API request, None keeps REQUEST_TIMEOUTS
+        self.rate_limit_delay = rate_limit_delay
+        self.concurrency = dict(STAGE_CONCURRENCY, **(concurrency or {}))
+        self.clean_concurrency = dict(CLEAN_CONCURRENCY, **(clean_concurrency or {}))
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'RunConfig':
+        """Read the features and settings sections, keeping the default of anything missing or invalid"""
+        features = config.get('features') or {}
+        settings = config.get('settings') or {}
+        options = {name: bool(features[name]) for name in RUN_FEATURES if name in features}
+        for name, cast in (('max_retries', int), ('timeout', float), ('rate_limit_delay', float)):
+            if settings.get(name) is not None:
+                try:
+                    options[name] = cast(settings[name])
+                except (TypeError, ValueError):
+                    logger.warning(f"Ignoring invalid setting {name}: {settings[name]!r}")
+        for name in ('concurrency', 'clean_concurrency'):
+            limits = {}
+            for stage, limit in (settings.get(name) or {}).items():
+                try:
+                    limits[stage] = max(1, int(limit))
+                except (TypeError, ValueError):
+                    logger.warning(f"Ignoring invalid {name} for {stage}: {limit!r}")
+            options[name] = limits
+        return cls(**options)
+
+    def copies(self, stage: str) -> bool:
+        """Whether a stage runs, stages without a feature always do"""
+        feature = FEATURE_STAGES.get(stage)
+        return feature is None or getattr(self, feature)
+
+    @property
+    def source_kinds(self) -> Tuple[str, ...]:
+        """The collections a copy has to read"""
+        return tuple(kind for kind in SNAPSHOT_KINDS if self.copies(kind))
+
+    @property
+    def clean_kinds(self) -> List[str]:
+        """The collections a copy's cleanup deletes, disabled stages leave the target's untouched"""
+        return [kind for kind in CLEAN_LABELS if self.copies(kind)]
+
+    def select(self, snapshot: 'GuildSnapshot') -> 'GuildSnapshot':
+        """The part of a snapshot this run copies"""
+        if self.copy_emojis and self.copy_stickers:
+            return snapshot
+        return snapshot.derive(emojis=snapshot.emojis if self.copy_emojis else [],
+                               stickers=snapshot.stickers if self.copy_stickers else [])
+
+    def retry_policy(self) -> RetryPolicy:
+        return RetryPolicy(self.max_retries, self.rate_limit_delay)
+
+class GuildIndex:
+    """Lookups over a guild's objects by parent, by kind and by the roles they reference, built in one pass"""
+    # The objects stay the dicts the API returned, the index only adds lists and maps of references to them
+    __slots__ = ('everyone', 'roles', 'categories', 'plain_channels', 'children', 'overwrite_roles', 'member_ids')
+
+    def __init__(self, guild_id: str, roles: List[dict], channels: List[dict]):
+        self.everyone = next((r for r in roles if r['id'] == guild_id), None) or \
+            next((r for r in roles if r['name'] == '@everyone'), None)
+        self.roles = [role for role in roles if role is not self.everyone and role['name'] != '@everyone']
+        self.categories: List[dict] = []
+        self.plain_channels: List[dict] = []
+        self.children: Dict[Optional[str], List[dict]] = {}  # Category id, None at the top level -> its channels
+        self.overwrite_roles: Dict[str, List[str]] = {}  # Channel id -> roles named in its overwrites
+        member_ids = set()
+        for channel in channels:
+            if channel['type'] == 4:
+                self.categories.append(channel)
+            else:
+                self.plain_channels.append(channel)
+                self.children.setdefault(channel.get('parent_id'), []).append(channel)
+            for overwrite in channel.get('permission_overwrites', []):
+                if overwrite['type'] == 0:
+                    self.overwrite_roles.setdefault(channel['id'], []).append(overwrite['id'])
+                else:
+                    member_ids.add(overwrite['id'])
+        self.member_ids = sorted(member_ids)  # Users named in member overwrites
+
+    @property
+    def creation_order(self) -> List[dict]:
+        """Categories first, so every channel's parent exists before it"""
+        return self.categories + self.plain_channels
+
+class GuildSnapshot:
+    """Full state of a source guild that copies can be replayed from"""
+    __slots__ = ('guild', 'roles', 'channels', 'emojis', 'stickers', 'assets', '_index')
+
+    def __init__(self, guild: dict, roles: List[dict], channels: List[dict], emojis: List[dict],
+                 stickers: List[dict], assets: Optional[Dict[str, str]] = None):
+        self.guild = guild
+        self.roles = roles
+        self.channels = channels
+        self.emojis = emojis
+        self.stickers = stickers
+        self.assets = assets or {}  # Asset key -> data URI, every asset stored once
+        self._index: Optional[GuildIndex] = None
+
+    @property
+    def id(self) -> str:
+        return self.guild['id']
+
+    def derive(self, guild: Optional[dict] = None, channels: Optional[List[dict]] = None,
+               emojis: Optional[List[dict]] = None, stickers: Optional[List[dict]] = None) -> 'GuildSnapshot':
+        """A snapshot with some parts replaced, sharing this one's index while its roles and channels are kept"""
+        snapshot = GuildSnapshot(guild or self.guild, self.roles, self.channels if channels is None else channels,
+                                 self.emojis if emojis is None else emojis,
+                                 self.stickers if stickers is None else stickers, self.assets)
+        if snapshot.channels is self.channels and snapshot.id == self.id:
+            snapshot._index = self.index
+        return snapshot
+
+    @property
+    def index(self) -> GuildIndex:
+        """Lookups over the roles and channels, built on first use"""
+        if self._index is None:
+            self._index = GuildIndex(self.id, self.roles, self.channels)
+        return self._index
+
+    @classmethod
+    async def fetch(cls, user_api: 'UserAPI', guild_id: str, kinds: Tuple[str, ...] = SNAPSHOT_KINDS) -> 'GuildSnapshot':
+        """Read the state of a guild from the API, every collection in kinds at once and the others left empty"""
+        guild, *listings = await asyncio.gather(
+            user_api.request('GET', f'/guilds/{guild_id}?with_counts=true'),
+            *(user_api.request('GET', f'/guilds/{guild_id}/{kind}') for kind in kinds)
+        )
+        collections = dict(zip(kinds, listings))
+        return cls(guild, *(collections.get(kind) or [] for kind in SNAPSHOT_KINDS))
+
+    @staticmethod
+    def emoji_ref(emoji: dict) -> Tuple[str, str, str, Optional[str], str]:
+        """Locate the upload source of an emoji, animated emojis keep their GIF"""
+        if emoji.get('animated'):
+            return ('emoji', emoji['id'], f"/emojis/{emoji['id']}.gif", 'gif', 'image/gif')
+        return ('emoji', emoji['id'], f"/emojis/{emoji['id']}.png", None, 'image/png')
+
+    @staticmethod
+    def sticker_ref(sticker: dict) -> Tuple[str, str, str, Optional[str], str]:
+        """Locate the upload source of a sticker in its own format"""
+        extension, mime_type = STICKER_FORMATS.get(sticker.get('format_type'), STICKER_FORMATS[1])
+        # PNG entries keep the hash they had before formats were told apart, so older snapshots still match
+        return ('sticker', sticker['id'], f"/stickers/{sticker['id']}.{extension}", None if extension == 'png' else extension, mime_type)
+
+    def asset_refs(self) -> List[Tuple[str, str, str, Optional[str], str]]:
+        """List the (kind, id, CDN path, hash, MIME type) of every asset a copy uploads"""
+        refs = []
+        if self.guild.get('icon'):
+            refs.append(('icon', self.id, f"/icons/{self.id}/{self.guild['icon']}.png?size=1024", self.guild['icon'], 'image/png'))
+        refs.extend(self.emoji_ref(emoji) for emoji in self.emojis)
+        refs.extend(self.sticker_ref(sticker) for sticker in self.stickers)
+        return refs
+
+    async def asset(self, client: Optional['AssetClient'], kind: str, asset_id: str, path: str,
+                    asset_hash: Optional[str] = None, mime_type: str = "image/png") -> Optional[str]:
+        """Get an asset data URI from the snapshot, falling back to the CDN"""
+        stored = self.assets.get(asset_key(kind, asset_id, asset_hash))
+        if stored or client is None:
+            return stored
+        return await client.fetch(kind, asset_id, path, asset_hash, mime_type)
+
+    async def icon(self, client: Optional['AssetClient']) -> Optional[str]:
+        """Get the guild icon data URI"""
+        if not self.guild.get('icon'):
+            return None
+        return await self.asset(client, 'icon', self.id, f"/icons/{self.id}/{self.guild['icon']}.png?size=1024", self.guild['icon'])
+
+    async def emoji_image(self, client: Optional['AssetClient'], emoji: dict) -> Optional[str]:
+        """Get the image data URI of an emoji"""
+        return await self.asset(client, *self.emoji_ref(emoji))
+
+    async def sticker_file(self, client: Optional['AssetClient'], sticker: dict) -> Optional[str]:
+        """Get the file data URI of a sticker"""
+        return await self.asset(client, *self.sticker_ref(sticker))
+
+    async def fetch_assets(self, client: 'AssetClient', on_progress: Optional[Callable[[], None]] = None):
+        """Download every asset into the snapshot"""
+        refs = self.asset_refs()
+        downloads = client.prefetch(refs, lambda ref: self.asset(client, *ref))
+        async for (kind, asset_id, _, asset_hash, _), download in downloads:
+            try:
+                data = await download
+                if data:
+                    self.assets[asset_key(kind, asset_id, asset_hash)] = data
+            except Exception as e:
+                logger.error(f"Failed to download {kind} {asset_id}: {str(e)}")
+            if on_progress:
+                on_progress()
+
+    def to_dict(self) -> dict:
+        return {
+            "format": SNAPSHOT_FORMAT,
+            "version": SNAPSHOT_VERSION,
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "guild": self.guild,
+            "roles": self.roles,
+            "channels": self.channels,
+            "emojis": self.emojis,
+            "stickers": self.stickers,
+            "assets": self.assets
+        }
+
+    def save(self, path: str):
+        """Write the snapshot as compact JSON, gzip compressed when the path ends in .gz"""
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'wt', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path: str) -> 'GuildSnapshot':
+        """Read a snapshot written by save"""
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or data.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError(f"{path} is not a Discopy snapshot")
+        if data.get('version', 0) > SNAPSHOT_VERSION:
+            raise ValueError(f"Snapshot version {data['version']} is newer than supported version {SNAPSHOT_VERSION}")
+        return cls(data['guild'], data.get('roles', []), data.get('channels', []), data.get('emojis', []),
+                   data.get('stickers', []), data.get('assets', {}))
+
+def update_permission_overwrites(overwrites: List[dict], role_mapping: Dict[str, str]) -> List[dict]:
+    """Update permission overwrites with new role IDs"""
+    updated_overwrites = []
+    for overwrite in overwrites:
+        new_overwrite = overwrite.copy()
+        if overwrite['type'] == 0:  # Role overwrite
+            new_overwrite['id'] = role_mapping.get(overwrite['id'], overwrite['id'])
+        updated_overwrites.append(new_overwrite)
+    return updated_overwrites
+
+def settings_payload(guild: dict, icon_data: Optional[str]) -> dict:
+    """Build the guild settings sent to the target"""
+    payload = {field: guild.get(field) for field in SYNC_GUILD_FIELDS}
+    payload["icon"] = icon_data
+    return payload
+
+def role_payload(role: dict) -> dict:
+    """Build the payload that creates a copy of a role"""
+    return {
+        "name": role['name'],
+        "permissions": role['permissions'],
+        "color": role['color'],
+        "hoist": role['hoist'],
+        "mentionable": role['mentionable']
+    }
+
+def channel_payload(channel: dict, role_mapping: Dict[str, str], channel_mapping: Dict[str, str]) -> dict:
+    """Build the payload that creates a copy of a category or channel"""
+    overwrites = update_permission_overwrites(channel.get('permission_overwrites', []), role_mapping)
+    if channel['type'] == 4:
+        return {
+            "name": channel['name'],
+            "type": 4,
+            "position": channel['position'],
+            "permission_overwrites": overwrites
+        }
+    return {
+        "name": channel['name'],
+        "type": channel['type'],
+        "topic": channel.get('topic'),
+        "bitrate": channel.get('bitrate'),
+        "user_limit": channel.get('user_limit'),
+        "rate_limit_per_user": channel.get('rate_limit_per_user'),
+        "position": channel['position'],
+        "nsfw": channel.get('nsfw', False),
+        "parent_id": channel_mapping.get(channel.get('parent_id')),
+        "permission_overwrites": overwrites
+    }
+
+def emoji_payload(emoji: dict, role_mapping: Dict[str, str], image: Optional[str] = None) -> dict:
+    """Build the payload that creates a copy of an emoji"""
+    payload = {
+        "name": emoji['name'],
+        "roles": [role_mapping.get(role_id, role_id) for role_id in emoji.get('roles', [])]
+    }
+    if image is not None:
+        payload["image"] = image
+    return payload
+
+def sticker_payload(sticker: dict, file_data: Optional[str] = None) -> dict:
+    """Build the payload that creates a copy of a sticker"""
+    payload = {
+        "name": sticker['name'],
+        "description": sticker.get('description', ''),
+        "tags": sticker.get('tags', '')
+    }
+    if file_data is not None:
+        payload["file"] = file_data
+    return payload
+
+def guild_create_payload(source: 'GuildSnapshot', name: str, icon_data: Optional[str], settings: bool = True) -> dict:
+    """Build a create guild payload carrying every role and channel the endpoint can express, and the settings if asked"""
+    index = source.index
+    role_placeholders = {source.id: 0}  # The first role of the payload is @everyone
+    roles = []
+    if index.everyone:
+        role_placeholders[index.everyone['id']] = 0
+        roles.append({"id": 0, "permissions": index.everyone['permissions']})
+    for role in sorted(index.roles, key=lambda r: r.get('position', 0)):
+        role_placeholders[role['id']] = len(role_placeholders)
+        roles.append(dict(role_payload(role), id=role_placeholders[role['id']]))
+
+    channel_placeholders = {}
+    channels = []
+    next_id = len(role_placeholders) + 1
+    # Channels under a category the payload cannot carry are left out with it
+    tree = index.categories + index.children.get(None, [])
+    tree.extend(channel for category in index.categories for channel in index.children.get(category['id'], []))
+    for channel in tree:
+        if channel['type'] not in GUILD_CREATE_CHANNEL_TYPES:
+            continue
+        if channel.get('parent_id') and channel['parent_id'] not in channel_placeholders:
+            continue
+        channel_placeholders[channel['id']] = next_id
+        next_id += 1
+        payload = channel_payload(channel, {}, {})
+        payload["id"] = channel_placeholders[channel['id']]
+        if channel.get('parent_id'):
+            payload["parent_id"] = channel_placeholders[channel['parent_id']]
+        # Only role overwrites can point at placeholders, members are not in the new guild yet
+        payload["permission_overwrites"] = [
+            dict(overwrite, id=role_placeholders[overwrite['id']])
+            for overwrite in channel.get('permission_overwrites', [])
+            if overwrite['type'] == 0 and overwrite['id'] in role_placeholders
+        ]
+        channels.append({key: value for key, value in payload.items() if value is not None})
+
+    payload = {
+        "name": name,
+        "roles": roles,
+        "channels": channels
+    }
+    if not settings:
+        return payload
+    payload.update({
+        "icon": icon_data,
+        "verification_level": source.guild.get('verification_level', 0),
+        "default_message_notifications": source.guild.get('default_message_notifications', 0),
+        "explicit_content_filter": source.guild.get('explicit_content_filter', 0),
+        "preferred_locale": source.guild.get('preferred_locale', "en-US")
+    })
+    if source.guild.get('afk_timeout') is not None:
+        payload["afk_timeout"] = source.guild['afk_timeout']
+    for field in ('afk_channel_id', 'system_channel_id'):
+        if source.guild.get(field) in channel_placeholders:
+            payload[field] = channel_placeholders[source.guild[field]]
+    return payload
+
+def position_moves(source_items: List[dict], target_items: List[dict], mapping: Dict[str, str],
+                   group: Callable[[dict], object] = lambda item: None, first: int = 0) -> List[dict]:
+    """Order copied objects like their sources within the places they already hold, returning only the moves to send"""
+    def order(item: dict) -> Tuple[int, int]:
+        return (item.get('position') or 0, int(item['id']))
+
+    source_by_target = {mapping[item['id']]: item for item in source_items if item['id'] in mapping}
+    groups: Dict[object, List[dict]] = {}
+    for item in sorted(target_items, key=order):
+        groups.setdefault(group(item), []).append(item)
+    moves = []
+    for items in groups.values():
+        # Objects that were not copied keep their place, the copied ones trade places until they match the source
+        copied = iter(sorted((item for item in items if item['id'] in source_by_target),
+                             key=lambda item: order(source_by_target[item['id']])))
+        for position, item in enumerate(items, first):
+            placed = next(copied) if item['id'] in source_by_target else item
+            if placed.get('position') != position:
+                moves.append({"id": placed['id'], "position": position})
+    return moves
+
+def order_moves(kind: str, source: 'GuildSnapshot', target_id: str, target_items: List[dict], mapping: Dict[str, str]) -> List[dict]:
+    """Position changes that give a target's roles or channels their source order"""
+    if kind == 'roles':
+        # @everyone is always at the bottom, position 0
+        roles = [role for role in target_items if role['id'] != target_id and role['name'] != '@everyone']
+        return position_moves(source.index.roles, roles, mapping, first=1)
+    # Categories are ordered among themselves, channels among their siblings
+    return position_moves(source.channels, target_items, mapping, lambda c: (c.get('parent_id'), c['type'] == 4))
+
+def _overwrite_set(overwrites: List[dict]) -> set:
+    return {(o['id'], int(o['type']), str(o.get('allow', '0')), str(o.get('deny', '0'))) for o in overwrites or []}
+
+def changed_fields(payload: dict, target: dict, ignore: Tuple[str, ...] = ('name', 'type')) -> dict:
+    """Return the payload fields whose value differs on the target object"""
+    changes = {}
+    for field, value in payload.items():
+        if field in ignore:
+            continue
+        current = target.get(field)
+        if field == 'permission_overwrites':
+            if _overwrite_set(value) != _overwrite_set(current):
+                changes[field] = value
+        elif field == 'roles':
+            if set(value or []) != set(current or []):
+                changes[field] = value
+        elif value != current and (value or current):
+            # Missing, null, empty and zero values are all equivalent on Discord objects
+            changes[field] = value
+    return changes
+
+def _match_objects(source_items: List[dict], target_items: List[dict], key: Callable[[dict], tuple],
+                   target_key: Optional[Callable[[dict], tuple]] = None):
+    """Pair source and target objects that share a key, in order, returning pairs, unmatched source and unmatched target"""
+    available = {}
+    for item in target_items:
+        available.setdefault((target_key or key)(item), deque()).append(item)
+    pairs, missing = [], []
+    for item in source_items:
+        candidates = available.get(key(item))
+        if candidates:
+            pairs.append((item, candidates.popleft()))
+        else:
+            missing.append(item)
+    extra = [item for candidates in available.values() for item in candidates]
+    return pairs, missing, extra
+
+class ValidationIssue:
+    """A planned object the target cannot accept as it is, and what was done about it"""
+    def __init__(self, kind: str, name: str, action: str, reason: str):
+        self.kind = kind
+        self.name = name
+        self.action = action  # 'changed' or 'dropped'
+        self.reason = reason
+
+class TargetCapacity:
+    """What a target guild can hold: slots for its premium tier, its features and which users are members"""
+    def __init__(self, guild: dict, members: Optional[set] = None, emojis: Optional[List[dict]] = None,
+                 stickers: Optional[List[dict]] = None):
+        tier = guild.get('premium_tier') or 0
+        self.features = set(guild.get('features') or [])
+        self.emoji_slots = EMOJI_SLOTS.get(tier, EMOJI_SLOTS[0])
+        self.sticker_slots = STICKER_SLOTS.get(tier, STICKER_SLOTS[0])
+        self.max_bitrate = BITRATE_LIMITS[3] if 'VIP_REGIONS' in self.features else BITRATE_LIMITS.get(tier, BITRATE_LIMITS[0])
+        self.members = members  # None when membership was not checked
+        emojis = emojis or []
+        self.animated_emojis = sum(1 for emoji in emojis if emoji.get('animated'))
+        self.static_emojis = len(emojis) - self.animated_emojis
+        self.stickers = len(stickers or [])
+
+    @classmethod
+    async def fetch(cls, user_api: 'UserAPI', guild: dict, source: 'GuildSnapshot', emojis: Optional[List[dict]] = None,
+                    stickers: Optional[List[dict]] = None) -> 'TargetCapacity':
+        """Check which users named in the source's member overwrites are members of the target"""
+        user_ids = source.index.member_ids
+        lookups = await asyncio.gather(
+            *(user_api.request('GET', f"/guilds/{guild['id']}/members/{user_id}") for user_id in user_ids),
+            return_exceptions=True
+        )
+        # Only a 404 proves a user is missing, other failures keep their overwrites
+        members = {
+            user_id for user_id, result in zip(user_ids, lookups)
+            if not isinstance(result, DiscordAPIError) or result.status_code != 404
+        }
+        return cls(guild, members, emojis, stickers)
+
+def validate_for_target(source: 'GuildSnapshot', capacity: TargetCapacity,
+                        completed: Optional[set] = None) -> Tuple['GuildSnapshot', List[ValidationIssue]]:
+    """Drop or change what the target would reject, so no request is spent on a certain failure"""
+    completed = completed or set()
+    issues = []
+
+    channels = []
+    for channel in source.channels:
+        changed = dict(channel)
+        overwrites = channel.get('permission_overwrites', [])
+        if capacity.members is not None:
+            kept = [o for o in overwrites if o['type'] != 1 or o['id'] in capacity.members]
+            if len(kept) != len(overwrites):
+                changed['permission_overwrites'] = kept
+                issues.append(ValidationIssue('channel', channel['name'], 'changed',
+                                              f"{len(overwrites) - len(kept)} overwrites for users not in the target removed"))
+        if channel['type'] in COMMUNITY_CHANNEL_TYPES and 'COMMUNITY' not in capacity.features:
+            changed['type'] = COMMUNITY_CHANNEL_TYPES[channel['type']]
+            issues.append(ValidationIssue('channel', channel['name'], 'changed',
+                                          f"type {channel['type']} needs COMMUNITY, created as type {changed['type']}"))
+        if (channel.get('bitrate') or 0) > capacity.max_bitrate:
+            changed['bitrate'] = capacity.max_bitrate
+            issues.append(ValidationIssue('channel', channel['name'], 'changed',
+                                          f"bitrate {channel['bitrate']} lowered to the target's {capacity.max_bitrate}"))
+        channels.append(changed if changed != channel else channel)
+    if all(kept is channel for kept, channel in zip(channels, source.channels)):
+        channels = source.channels  # Nothing changed, the source's index still applies
+
+    # Objects an earlier run already created hold their slots and are kept
+    emojis = []
+    free = {False: capacity.emoji_slots - capacity.static_emojis, True: capacity.emoji_slots - capacity.animated_emojis}
+    for emoji in source.emojis:
+        animated = bool(emoji.get('animated'))
+        if f"emoji:{emoji['id']}" not in completed:
+            if free[animated] <= 0:
+                issues.append(ValidationIssue('emoji', emoji['name'], 'dropped',
+                                              f"no free {'animated' if animated else 'static'} emoji slots "
+                                              f"({capacity.emoji_slots} at this tier)"))
+                continue
+            free[animated] -= 1
+        emojis.append(emoji)
+
+    stickers = []
+    free_stickers = capacity.sticker_slots - capacity.stickers
+    for sticker in source.stickers:
+        if f"sticker:{sticker['id']}" not in completed:
+            if sticker.get('format_type') == 3 and not capacity.features.intersection(LOTTIE_STICKER_FEATURES):
+                issues.append(ValidationIssue('sticker', sticker['name'], 'dropped',
+                                              "Lottie stickers can only be uploaded to verified or partnered servers"))
+                continue
+            if free_stickers <= 0:
+                issues.append(ValidationIssue('sticker', sticker['name'], 'dropped',
+                                              f"no free sticker slots ({capacity.sticker_slots} at this tier)"))
+                continue
+            free_stickers -= 1
+        stickers.append(sticker)
+
+    return source.derive(channels=channels, emojis=emojis, stickers=stickers), issues
+
+class SyncAction:
+    """A single create, update or delete needed to bring a target object in line with its source"""
+    __slots__ = ('action', 'kind', 'source', 'target', 'changes')
+
+    def __init__(self, action: str, kind: str, source: Optional[dict] = None, target: Optional[dict] = None,
+                 changes: Optional[dict] = None):
+        self.action = action
+        self.kind = kind
+        self.source = source
+        self.target = target
+        self.changes = changes or {}
+
+    @property
+    def name(self) -> str:
+        obj = self.source or self.target or {}
+        return obj.get('name', 'Unknown')
+
+class SyncPlan:
+    """The minimal set of changes that turns a target guild into a copy of its source"""
+    def __init__(self, source: GuildSnapshot, target: GuildSnapshot):
+        self.source = source
+        self.target = target
+        self.role_mapping: Dict[str, str] = {source.id: target.id}
+        self.channel_mapping: Dict[str, str] = {}
+        self.actions: List[SyncAction] = []
+        self.out_of_order = False  # Whether matched roles or channels need moving
+        self._build()
+
+    def _build(self):
+        deletes, changes = [], []
+        source, target = self.source, self.target
+
+        # Settings, every upload gets a new icon hash so only whether there is an icon can be compared
+        settings = changed_fields(settings_payload(source.guild, None), target.guild, ignore=('icon',))
+        if bool(source.guild.get('icon')) != bool(target.guild.get('icon')):
+            settings['icon'] = source.guild.get('icon')
+        if settings:
+            changes.append(SyncAction('update', 'settings', source.guild, target.guild, settings))
+
+        # Roles by name, @everyone is always the guild itself
+        source_roles = source.index.roles[::-1]
+        target_roles = [r for r in reversed(target.index.roles) if not r.get('managed')]
+        pairs, missing, extra = _match_objects(source_roles, target_roles, lambda r: (r['name'],))
+        for role, existing in pairs:
+            self.role_mapping[role['id']] = existing['id']
+        for role, existing in pairs:
+            diff = changed_fields(role_payload(role), existing)
+            if diff:
+                changes.append(SyncAction('update', 'role', role, existing, diff))
+        changes.extend(SyncAction('create', 'role', role) for role in missing)
+        deletes.extend(SyncAction('delete', 'role', target=role) for role in extra)
+
+        # Categories by name, then channels by name, type and matched parent
+        categories, missing, extra = _match_objects(
+            source.index.categories, target.index.categories, lambda c: (c['name'],)
+        )
+        for category, existing in categories:
+            self.channel_mapping[category['id']] = existing['id']
+        category_deletes = [SyncAction('delete', 'category', target=c) for c in extra]
+        category_changes = [SyncAction('create', 'category', c) for c in missing]
+
+        target_parents = {existing['id']: category['id'] for category, existing in categories}
+        channels, missing, extra = _match_objects(
+            source.index.plain_channels,
+            target.index.plain_channels,
+            lambda c: (c['name'], c['type'], c.get('parent_id')),
+            lambda c: (c['name'], c['type'], target_parents.get(c.get('parent_id'), c.get('parent_id')))
+        )
+        for channel, existing in channels:
+            self.channel_mapping[channel['id']] = existing['id']
+        for category, existing in categories:
+            diff = changed_fields(channel_payload(category, self.role_mapping, self.channel_mapping), existing, CHANNEL_IGNORED_FIELDS)
+            if diff:
+                category_changes.append(SyncAction('update', 'category', category, existing, diff))
+        changes.extend(category_changes)
+        for channel, existing in channels:
+            diff = changed_fields(channel_payload(channel, self.role_mapping, self.channel_mapping), existing, CHANNEL_IGNORED_FIELDS)
+            if diff:
+                changes.append(SyncAction('update', 'channel', channel, existing, diff))
+        changes.extend(SyncAction('create', 'channel', c) for c in missing)
+        # Channels go before their categories so nothing is left orphaned mid-sync
+        deletes = [SyncAction('delete', 'channel', target=c) for c in extra] + category_deletes + deletes
+
+        # Emojis and stickers by name
+        pairs, missing, extra = _match_objects(source.emojis, target.emojis, lambda e: (e['name'],))
+        deletes.extend(SyncAction('delete', 'emoji', target=e) for e in extra)
+        for emoji, existing in pairs:
+            diff = changed_fields(emoji_payload(emoji, self.role_mapping), existing)
+            if diff:
+                changes.append(SyncAction('update', 'emoji', emoji, existing, diff))
+        changes.extend(SyncAction('create', 'emoji', e) for e in missing)
+
+        pairs, missing, extra = _match_objects(source.stickers, target.stickers, lambda s: (s['name'],))
+        deletes.extend(SyncAction('delete', 'sticker', target=s) for s in extra)
+        for sticker, existing in pairs:
+            diff = changed_fields(sticker_payload(sticker), existing)
+            if diff:
+                changes.append(SyncAction('update', 'sticker', sticker, existing, diff))
+        changes.extend(SyncAction('create', 'sticker', s) for s in missing)
+
+        # Deletes first so freed emoji and sticker slots can be reused
+        self.actions = deletes + changes
+        # Positions are not compared per object, the order is applied in bulk once the actions are done
+        self.out_of_order = bool(order_moves('roles', source, target.id, target.roles, self.role_mapping) or
+                                 order_moves('channels', source, target.id, target.channels, self.channel_mapping))
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """Count the planned actions per kind"""
+        counts: Dict[str, Dict[str, int]] = {}
+        for action in self.actions:
+            kind_counts = counts.setdefault(action.kind, {'create': 0, 'update': 0, 'delete': 0})
+            kind_counts[action.action] += 1
+        return counts
+
+def drift_entries(plan: SyncPlan, moves: Dict[str, List[dict]]) -> List[dict]:
+    """Describe every object that differs between a source and its target, with the expected and actual values"""
+    entries = []
+    for action in plan.actions:
+        entry = {
+            "kind": action.kind,
+            "name": action.name,
+            "drift": DRIFT_KINDS[action.action],
+            "source_id": action.source.get('id') if action.source else None,
+            "target_id": action.target.get('id') if action.target else None
+        }
+        if action.action == 'update':
+            entry["fields"] = {
+                field: {"expected": value, "actual": action.target.get(field)} for field, value in action.changes.items()
+            }
+        entries.append(entry)
+
+    for kind, kind_moves in moves.items():
+        mapping = plan.role_mapping if kind == 'roles' else plan.channel_mapping
+        sources = {target_id: source_id for source_id, target_id in mapping.items()}
+        targets = {item['id']: item for item in (plan.target.roles if kind == 'roles' else plan.target.channels)}
+        for move in kind_moves:
+            item = targets.get(move['id'], {})
+            entries.append({
+                "kind": 'role' if kind == 'roles' else ('category' if item.get('type') == 4 else 'channel'),
+                "name": item.get('name', 'Unknown'),
+                "drift": "moved",
+                "source_id": sources.get(move['id']),
+                "target_id": move['id'],
+                "fields": {"position": {"expected": move['position'], "actual": item.get('position')}}
+            })
+    return entries
+
+class Operation:
+    """A single request of a copy and the operations it has to wait for"""
+    __slots__ = ('key', 'stage', 'method', 'endpoint', 'run', 'deps', 'description', 'result', 'error', 'started_at', 'finished_at')
+
+    def __init__(self, key: str, stage: str, method: str, endpoint: str, run: Callable[[], Awaitable],
+                 deps: Optional[List[str]] = None, description: str = ''):
+        self.key = key
+        self.stage = stage
+        self.method = method
+        self.endpoint = endpoint
+        self.run = run
+        self.deps = deps or []
+        self.description = description or key
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.started_at = 0.0
+        self.finished_at = 0.0
+
+class OperationScheduler:
+    """Runs every operation whose dependencies have finished, bounding concurrency per stage"""
+    def __init__(self, concurrency: Optional[Dict[str, int]] = None, profiler: Optional[RunProfiler] = None,
+                 phase: str = 'operations'):
+        self.concurrency = concurrency or {}
+        self.profiler = profiler
+        self.phase = phase  # Profile frame the operations are grouped under
+
+    async def run(self, operations: List[Operation], on_done: Optional[Callable[[Operation], None]] = None) -> List[Operation]:
+        """Run operations in dependency order, failed operations still release their dependents"""
+        by_key = {op.key: op for op in operations}
+        waiting: Dict[str, int] = {}
+        dependents: Dict[str, List[Operation]] = {}
+        for op in operations:
+            # Dependencies outside the graph are treated as already done
+            deps = [dep for dep in op.deps if dep in by_key]
+            waiting[op.key] = len(deps)
+            for dep in deps:
+                dependents.setdefault(dep, []).append(op)
+
+        semaphores = {
+            stage: asyncio.Semaphore(max(1, self.concurrency.get(stage, DEFAULT_STAGE_CONCURRENCY)))
+            for stage in {op.stage for op in operations}
+        }
+        tasks: List[asyncio.Future] = []
+
+        async def execute(op: Operation):
+            async with semaphores[op.stage]:
+                current_stage.set(op.stage)
+                op.started_at = time.monotonic()
+                try:
+                    if self.profiler is not None:
+                        op.result = await self.profiler.measure(self.profiler.frame(self.phase, op.stage, op.description), op.run())
+                    else:
+                        op.result = await op.run()
+                except Exception as e:
+                    op.error = e
+                op.finished_at = time.monotonic()
+            if on_done and self.profiler is not None:
+                # Progress bar updates, the console's share of the run
+                self.profiler.call(self.profiler.frame(self.phase, op.stage, 'progress'), on_done, op)
+            elif on_done:
+                on_done(op)
+            for dependent in dependents.get(op.key, []):
+                waiting[dependent.key] -= 1
+                if waiting[dependent.key] == 0:
+                    tasks.append(asyncio.ensure_future(execute(dependent)))
+
+        tasks.extend(asyncio.ensure_future(execute(op)) for op in operations if waiting[op.key] == 0)
+        try:
+            index = 0
+            while index < len(tasks):
+                await tasks[index]
+                index += 1
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        for op in operations:
+            if waiting[op.key] > 0:
+                op.error = RuntimeError(f"Dependency cycle detected at {op.key}")
+                if on_done:
+                    on_done(op)
+        return operations
+
+def estimate_schedule(operations: List[Operation], concurrency: Optional[Dict[str, int]] = None,
+                      limits: Optional[Dict[str, Tuple[int, float]]] = None,
+                      latency: float = DEFAULT_LATENCY_ESTIMATE) -> Dict[str, Tuple[float, float]]:
+    """Simulate the scheduler against per-bucket and global limits, returning each operation's estimated start and end"""
+    concurrency = concurrency or {}
+    limits = {**ROUTE_LIMIT_ESTIMATES, **(limits or {})}
+    by_key = {op.key: op for op in operations}
+    waiting: Dict[str, int] = {}
+    dependents: Dict[str, List[Operation]] = {}
+    ready: Dict[str, deque] = {op.stage: deque() for op in operations}
+    running = {stage: 0 for stage in ready}
+    for op in operations:
+        deps = [dep for dep in op.deps if dep in by_key]
+        waiting[op.key] = len(deps)
+        for dep in deps:
+            dependents.setdefault(dep, []).append(op)
+        if not deps:
+            ready[op.stage].append(op)
+
+    buckets: Dict[str, List[float]] = {}  # Bucket -> [remaining, reset time]
+    global_counts: Dict[int, int] = {}  # Whole second -> requests sent in it
+    events: List[Tuple[float, int, str]] = []
+    times: Dict[str, Tuple[float, float]] = {}
+    now = 0.0
+
+    def send_time(op: Operation, at: float) -> float:
+        route, major = parse_route(op.method, op.endpoint)
+        limit, window = limits.get(route, DEFAULT_ROUTE_LIMIT)
+        state = buckets.setdefault(f"{route}:{major}", [limit, 0.0])
+        if at >= state[1]:
+            state[0], state[1] = limit, at + window
+        elif state[0] <= 0:
+            at = state[1]
+            state[0], state[1] = limit, at + window
+        state[0] -= 1
+        second = int(at)
+        while global_counts.get(second, 0) >= GLOBAL_RATE_LIMIT:
+            second += 1
+        global_counts[second] = global_counts.get(second, 0) + 1
+        return max(at, second)
+
+    def start_ready():
+        for stage, queue in ready.items():
+            while queue and running[stage] < max(1, concurrency.get(stage, DEFAULT_STAGE_CONCURRENCY)):
+                op = queue.popleft()
+                running[stage] += 1
+                end = send_time(op, now) + latency
+                times[op.key] = (now, end)
+                heapq.heappush(events, (end, len(times), op.key))
+
+    start_ready()
+    while events:
+        now, _, key = heapq.heappop(events)
+        op = by_key[key]
+        running[op.stage] -= 1
+        for dependent in dependents.get(key, []):
+            waiting[dependent.key] -= 1
+            if waiting[dependent.key] == 0:
+                ready[dependent.stage].append(dependent)
+        start_ready()
+    return times
+
+def drift_resolved(report: Optional[dict]) -> bool:
+    """Whether a verification found the target in sync, or fixed everything it found"""
+    if report is None:
+        return False
+    fixes = report.get('fixes')
+    return report['in_sync'] or bool(fixes and not fixes['failed'])
+
+def format_duration(seconds: float) -> str:
+    """Format a duration as hours, minutes and seconds"""
+    minutes, secs = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m {secs:02d}s"
+    if minutes:
+        return f"{minutes}m {secs:02d}s"
+    return f"{seconds:.1f}s"
+
+class CopyJournal:
+    """Write-ahead log of a copy's planned and completed operations and the ids they created"""
+    def __init__(self, path: str):
+        self.path = path
+        self.planned: List[str] = []
+        self.completed: Dict[str, Optional[str]] = {}  # Operation key -> id of the created object
+        self.cleaned = False
+        self.finished = False
+
+    @classmethod
+    def for_copy(cls, source_id: str, target_id: str) -> 'CopyJournal':
+        return cls(os.path.join(JOURNAL_DIR, f"{source_id}-{target_id}.jsonl"))
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def is_unfinished(self) -> bool:
+        """Whether an earlier copy between the same servers stopped part way"""
+        if not self.exists():
+            return False
+        self.load()
+        return not self.finished
+
+    def load(self):
+        """Replay the journal, ignoring a torn last line from a crash"""
+        self.planned, self.completed, self.cleaned, self.finished = [], {}, False, False
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                event = entry.get('event')
+                if event == 'plan':
+                    self.planned = entry['keys']
+                elif event == 'cleaned':
+                    self.cleaned = True
+                elif event == 'done':
+                    self.completed[entry['key']] = entry.get('id')
+                elif event == 'finished':
+                    self.finished = True
+
+    def mappings(self) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """Rebuild the old to new role and channel id mappings of completed operations"""
+        role_mapping, channel_mapping = {}, {}
+        for key, new_id in self.completed.items():
+            kind, _, old_id = key.partition(':')
+            if new_id and kind == 'role':
+                role_mapping[old_id] = new_id
+            elif new_id and kind == 'channel':
+                channel_mapping[old_id] = new_id
+        return role_mapping, channel_mapping
+
+    def _append(self, *entries: dict):
+        """Write entries and sync them to disk once, however many there are"""
+        at = time.time()
+        with open(self.path, 'a') as f:
+            f.write(''.join(json.dumps(dict(entry, at=at), separators=(',', ':')) + '\n' for entry in entries))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def reset(self):
+        """Start a new journal, discarding any earlier run"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        open(self.path, 'w').close()
+        self.planned, self.completed, self.cleaned, self.finished = [], {}, False, False
+
+    def mark_cleaned(self):
+        self.cleaned = True
+        self._append({"event": "cleaned"})
+
+    def plan(self, operations: List['Operation']):
+        self.planned = [op.key for op in operations]
+        self._append({"event": "plan", "keys": self.planned})
+
+    def record(self, op: 'Operation'):
+        """Record a completed operation and the id of the object it created"""
+        new_id = op.result.get('id') if isinstance(op.result, dict) else None
+        self.completed[op.key] = new_id
+        self._append({"event": "done", "key": op.key, "id": new_id})
+
+    def record_mappings(self, role_mapping: Dict[str, str], channel_mapping: Dict[str, str]):
+        """Record objects created outside the operation graph as completed"""
+        entries = []
+        for kind, mapping in (('role', role_mapping), ('channel', channel_mapping)):
+            for old_id, new_id in mapping.items():
+                key = f"{kind}:{old_id}"
+                self.completed[key] = new_id
+                entries.append({"event": "done", "key": key, "id": new_id})
+        self._append(*entries)
+
+    def finish(self):
+        self.finished = True
+        self._append({"event": "finished"})
+
+class NullProgress:
+    """Stand-in for a rich Progress when no progress bars are shown"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    def add_task(self, description: str, total: Optional[float] = None, **kwargs) -> int:
+        return 0
+
+    def update(self, task_id: int, **kwargs):
+        pass
+
 class ServerCopier:
-    def __init__(self, user_api):
+    def __init__(self, user_api, console: Optional['Console'] = None, show_progress: bool = True,
+                 config: Optional[RunConfig] = None):
+        from rich.console import Console
         self.user_api = user_api
-        self.console = Console()
-        self.progress = Progress(
-            SpinnerColumn(),
-            TextColumn("[progress.description]{task.description}"),
-            BarColumn(bar_width=40),
-            TaskProgressColumn(),
-            TimeRemainingColumn(),
-            console=self.console
+        self.config = config or RunConfig()
+        self.console = console or Console()
+        self.show_progress = show_progress
+        self._progress = None
+        self.profiler: Optional[RunProfiler] = None  # Set to split the time of scheduled operations
+        self.verify_report: Optional[str] = None  # Set to check every copy against its target, writing the drift here
+        self.verify_fix = False  # With verify_report, also send the fixes for the drift found
+
+    @property
+    def progress(self):
+        """Progress bars, rich.progress is only imported once bars are shown"""
+        if self._progress is None:
+            if not self.show_progress:
+                self._progress = NullProgress()
+            else:
+                from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TaskProgressColumn, TimeRemainingColumn
+                self._progress = Progress(
+                    SpinnerColumn(),
+                    TextColumn("[progress.description]{task.description}"),
+                    BarColumn(bar_width=40),
+                    TaskProgressColumn(),
+                    TimeRemainingColumn(),
+                    console=self.console
+                )
+        return self._progress
+
+    async def _clean_operations(self, guild_id: str, kinds: Optional[List[str]] = None) -> Tuple[List[Operation], List[str]]:
+        """List everything of the given kinds in a server and express its removal as delete operations,
+        also returning the kinds that could not be listed"""
+        kinds = list(kinds or CLEAN_LABELS)
+        listings = await asyncio.gather(
+            *(self.user_api.request('GET', f'/guilds/{guild_id}/{kind}') for kind in kinds), return_exceptions=True
         )
+        operations = []
+        unlisted = []
+        for kind, items in zip(kinds, listings):
+            if isinstance(items, Exception):
+                self.console.print(f"[red]Error cleaning {kind}: {str(items)}")
+                unlisted.append(kind)
+                continue
+            for item in items or []:
+                if kind == 'roles' and (item['name'] == '@everyone' or item.get('managed')):
+                    continue
+                endpoint = f'/channels/{item["id"]}' if kind == 'channels' else f'/guilds/{guild_id}/{kind}/{item["id"]}'
+                operations.append(Operation(
+                    f"{kind}:{item['id']}", kind, 'DELETE', endpoint,
+                    lambda endpoint=endpoint: self.user_api.request('DELETE', endpoint),
+                    description=f"{kind[:-1]} {item.get('name', 'Unknown')}"
+                ))
+        return operations, unlisted
+
+    async def clean_server(self, guild_id: str, kinds: Optional[List[str]] = None):
+        """Clean a server before copying, every kind unless told which"""
+        from rich.panel import Panel
+        from rich.table import Table
+        from rich.box import ROUNDED
+        self.console.print(Panel("Starting server cleanup...", style="yellow"))
 
-    async def get_server_icon(self, guild_id: str) -> Optional[str]:
-        """Get server icon data"""
+        # Every kind is listed and deleted at once, each in its own buckets
+        operations, unlisted = await self._clean_operations(guild_id, kinds)
+        await self._run_operations(operations, "[cyan]Overall cleanup progress...", "deleting", CLEAN_LABELS,
+                                   self.config.clean_concurrency)
+
+        table = Table(title="Cleanup throughput", box=ROUNDED)
+        for column in ("Kind", "Deleted", "Failed", "Time", "Rate"):
+            table.add_column(column, justify="left" if column == "Kind" else "right")
+        for kind in CLEAN_LABELS:
+            done = [op for op in operations if op.stage == kind]
+            if not done:
+                continue
+            elapsed = max(op.finished_at for op in done) - min(op.started_at for op in done)
+            failed = sum(1 for op in done if op.error)
+            rate = len(done) / elapsed if elapsed > 0 else float(len(done))
+            table.add_row(kind, str(len(done) - failed), str(failed), f"{elapsed:.2f}s", f"{rate:.1f}/s")
+        self.console.print(table)
+
+        # A kind that could not be listed was not cleaned
+        failed = sum(1 for op in operations if op.error)
+        if unlisted:
+            self.console.print(Panel(f"Server cleanup incomplete, could not list {', '.join(unlisted)}", style="red"))
+        elif failed:
+            self.console.print(Panel(f"Server cleanup completed with {failed} failed deletes", style="yellow"))
+        else:
+            self.console.print(Panel("Server cleanup completed!", style="green"))
+        return not unlisted and not failed
+
+    async def copy_to_existing_server(self, source_id: str, target_id: str, resume: bool = False):
+        """Copy a server to an existing server with improved progress tracking"""
         try:
-            guild = await self.user_api.request('GET', f'/guilds/{guild_id}')
-            if guild.get('icon'):
-                icon_url = f"https://cdn.discordapp.com/icons/{guild_id}/{guild['icon']}.png?size=1024"
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(icon_url) as resp:
-                        if resp.status == 200:
-                            icon_data = await resp.read()
-                            return f"data:image/png;base64,{base64.b64encode(icon_data).decode('utf-8')}"
+            source = await GuildSnapshot.fetch(self.user_api, source_id, self.config.source_kinds)
         except Exception as e:
-            logger.error(f"Failed to get server icon: {str(e)}")
-        return None
+            self.console.print(f"[red]Error: Could not read source server: {str(e)}")
+            return False
+        return await self.copy_snapshot(source, target_id, resume)
 
-    async def clean_server(self, guild_id: str):
-        """Clean a server before copying"""
-        self.console.print(Panel("Starting server cleanup...", style="yellow"))
-        
-        with self.progress as progress:
-            overall_task = progress.add_task("[cyan]Overall cleanup progress...", total=4)
-            
-            # Delete channels
-            channels_task = progress.add_task("[red]Cleaning channels...", total=100)
-            try:
-                channels = await self.user_api.request('GET', f'/guilds/{guild_id}/channels')
-                if channels:
-                    increment = 100 / len(channels)
-                    for channel in channels:
-                        try:
-                            await self.user_api.request('DELETE', f'/channels/{channel["id"]}')
-                            progress.update(channels_task, advance=increment)
-                        except Exception as e:
-                            self.console.print(f"[red]Error deleting channel {channel.get('name', 'Unknown')}: {str(e)}")
-                progress.update(overall_task, advance=1)
-            except Exception as e:
-                self.console.print(f"[red]Error cleaning channels: {str(e)}")
-            
-            # Delete roles
-            roles_task = progress.add_task("[yellow]Cleaning roles...", total=100)
-            try:
-                roles = await self.user_api.request('GET', f'/guilds/{guild_id}/roles')
-                if roles:
-                    increment = 100 / len(roles)
-                    for role in roles:
-                        if role['name'] != '@everyone':
-                            try:
-                                await self.user_api.request('DELETE', f'/guilds/{guild_id}/roles/{role["id"]}')
-                                progress.update(roles_task, advance=increment)
-                            except Exception as e:
-                                self.console.print(f"[red]Error deleting role {role.get('name', 'Unknown')}: {str(e)}")
-                progress.update(overall_task, advance=1)
-            except Exception as e:
-                self.console.print(f"[red]Error cleaning roles: {str(e)}")
-            
-            # Delete emojis
-            emojis_task = progress.add_task("[green]Cleaning emojis...", total=100)
-            try:
-                emojis = await self.user_api.request('GET', f'/guilds/{guild_id}/emojis')
-                if emojis:
-                    increment = 100 / len(emojis)
-                    for emoji in emojis:
-                        try:
-                            await self.user_api.request('DELETE', f'/guilds/{guild_id}/emojis/{emoji["id"]}')
-                            progress.update(emojis_task, advance=increment)
-                        except Exception as e:
-                            self.console.print(f"[red]Error deleting emoji {emoji.get('name', 'Unknown')}: {str(e)}")
-                progress.update(overall_task, advance=1)
-            except Exception as e:
-                self.console.print(f"[red]Error cleaning emojis: {str(e)}")
-            
-            # Delete stickers
-            stickers_task = progress.add_task("[blue]Cleaning stickers...", total=100)
-            try:
-                stickers = await self.user_api.request('GET', f'/guilds/{guild_id}/stickers')
-                if stickers:
-                    increment = 100 / len(stickers)
-                    for sticker in stickers:
-                        try:
-                            await self.user_api.request('DELETE', f'/guilds/{guild_id}/stickers/{sticker["id"]}')
-                            progress.update(stickers_task, advance=increment)
-                        except Exception as e:
-                            self.console.print(f"[red]Error deleting sticker {sticker.get('name', 'Unknown')}: {str(e)}")
-                progress.update(overall_task, advance=1)
-            except Exception as e:
-                self.console.print(f"[red]Error cleaning stickers: {str(e)}")
+    async def plan_copy(self, source_id: str, target_id: str, path: str):
+        """Build the operations a copy to an existing server would run and estimate its duration, without writing"""
+        from rich.panel import Panel
+        from rich.table import Table
+        from rich.box import ROUNDED
+        try:
+            started = time.monotonic()
+            source, target_guild, (clean_ops, _) = await asyncio.gather(
+                GuildSnapshot.fetch(self.user_api, source_id, self.config.source_kinds),
+                self.user_api.request('GET', f'/guilds/{target_id}?with_counts=true'),
+                self._clean_operations(target_id, self.config.clean_kinds) if self.config.clean_target else asyncio.sleep(0, ([], []))
+            )
+            # The cleanup empties the target, so only its tier, features and members limit the copy
+            capacity = await TargetCapacity.fetch(self.user_api, target_guild, source)
+            source, issues = validate_for_target(source, capacity)
+            read_time = time.monotonic() - started
+            self._print_validation_report(issues)
+            copy_ops = self._copy_operations(source, target_id, {source.id: target_id}, {})
+
+            limits = self.user_api.rate_limiter.known_limits()
+            latency = self.user_api.metrics.average_latency() or DEFAULT_LATENCY_ESTIMATE
+            clean_times = estimate_schedule(clean_ops, self.config.clean_concurrency, limits, latency)
+            clean_time = max((end for _, end in clean_times.values()), default=0.0)
+            copy_times = estimate_schedule(copy_ops, self.config.concurrency, limits, latency)
+            copy_time = max((end for _, end in copy_times.values()), default=0.0)
+
+            phases = [('clean', clean_ops, clean_times, read_time), ('copy', copy_ops, copy_times, read_time + clean_time)]
+            stages = []
+            entries = []
+            for phase, operations, times, offset in phases:
+                for stage in dict.fromkeys(op.stage for op in operations):
+                    ops = [op for op in operations if op.stage == stage]
+                    stages.append({
+                        "phase": phase,
+                        "stage": stage,
+                        "requests": len(ops),
+                        "start": round(offset + min(times[op.key][0] for op in ops), 3),
+                        "end": round(offset + max(times[op.key][1] for op in ops), 3)
+                    })
+                for op in operations:
+                    start, end = times[op.key]
+                    entries.append({
+                        "phase": phase,
+                        "key": op.key,
+                        "stage": op.stage,
+                        "method": op.method,
+                        "endpoint": op.endpoint,
+                        "route": parse_route(op.method, op.endpoint)[0],
+                        "deps": op.deps,
+                        "description": op.description,
+                        "start": round(offset + start, 3),
+                        "end": round(offset + end, 3)
+                    })
 
-        self.console.print(Panel("Server cleanup completed!", style="green"))
+            routes: Dict[str, int] = {}
+            for entry in entries:
+                routes[entry['route']] = routes.get(entry['route'], 0) + 1
+            total = read_time + clean_time + copy_time
+            plan = {
+                "source": {"id": source.id, "name": source.guild.get('name')},
+                "target": {"id": target_id, "name": target_guild.get('name')},
+                "created_at": datetime.now().isoformat(),
+                "estimate": {
+                    "total": round(total, 3),
+                    "reads": round(read_time, 3),
+                    "clean": round(clean_time, 3),
+                    "copy": round(copy_time, 3),
+                    "latency": round(latency, 4)
+                },
+                "requests": len(entries),
+                "routes": {
+                    route: {
+                        "requests": count,
+                        "limit": list(limits.get(route, ROUTE_LIMIT_ESTIMATES.get(route, DEFAULT_ROUTE_LIMIT))),
+                        "learned": route in limits
+                    }
+                    for route, count in sorted(routes.items())
+                },
+                "stages": stages,
+                "validation": [
+                    {"kind": issue.kind, "name": issue.name, "action": issue.action, "reason": issue.reason}
+                    for issue in issues
+                ],
+                "operations": entries
+            }
+            with open(path, 'w') as f:
+                json.dump(plan, f, indent=2)
+
+            table = Table(title="Dry run plan", box=ROUNDED)
+            for column in ("Phase", "Stage", "Requests", "Starts", "Ends"):
+                table.add_column(column, justify="left" if column in ("Phase", "Stage") else "right")
+            for stage in stages:
+                table.add_row(stage['phase'], stage['stage'], str(stage['requests']),
+                              format_duration(stage['start']), format_duration(stage['end']))
+            self.console.print(table)
+            self.console.print(Panel(
+                f"[cyan]From:[/] {source.guild['name']}\n" +
+                f"[cyan]To:[/] {target_guild['name']}\n" +
+                f"[cyan]Requests:[/] {len(entries)} ({len(clean_ops)} deletes, {len(copy_ops)} copies)\n" +
+                f"[cyan]Estimated time:[/] {format_duration(total)}\n" +
+                f"[cyan]Plan:[/] {path}",
+                title="Dry Run",
+                border_style="cyan"
+            ))
+            return plan
+        except Exception as e:
+            self.console.print(f"[red]Error planning copy: {str(e)}")
+            logger.error(f"Copy planning error: {str(e)}", exc_info=True)
+            return None
 
-    async def copy_to_existing_server(self, source_id: str, target_id: str):
-        """Copy a server to an existing server with improved progress tracking"""
+    async def export_snapshot(self, source_id: str, path: str):
+        """Write the full state of a server and its assets to a snapshot file"""
+        from rich.panel import Panel
         try:
-            # Verify server access
-            source_guild = await self.user_api.request('GET', f'/guilds/{source_id}?with_counts=true')
+            snapshot = await GuildSnapshot.fetch(self.user_api, source_id)
+            with self.progress as progress:
+                assets_task = progress.add_task("[blue]Downloading assets...", total=len(snapshot.asset_refs()))
+                await snapshot.fetch_assets(self.user_api.assets, lambda: progress.update(assets_task, advance=1))
+            snapshot.save(path)
+            self.console.print(Panel(
+                "[green]Snapshot exported successfully!\n" +
+                f"[cyan]Server:[/] {snapshot.guild['name']}\n" +
+                f"[cyan]Contents:[/] {len(snapshot.roles)} roles, {len(snapshot.channels)} channels, " +
+                f"{len(snapshot.emojis)} emojis, {len(snapshot.stickers)} stickers, {len(snapshot.assets)} assets\n" +
+                f"[cyan]File:[/] {path}",
+                title="Success",
+                border_style="green"
+            ))
+            return True
+        except Exception as e:
+            self.console.print(f"[red]Error exporting snapshot: {str(e)}")
+            logger.error(f"Snapshot export error: {str(e)}", exc_info=True)
+            return False
+
+    async def import_snapshot(self, path: str, target_id: str, resume: bool = False):
+        """Copy a server from a snapshot file to an existing server"""
+        try:
+            snapshot = GuildSnapshot.load(path)
+        except (OSError, ValueError) as e:
+            self.console.print(f"[red]Error loading snapshot: {str(e)}")
+            return False
+        return await self.copy_snapshot(snapshot, target_id, resume)
+
+    async def copy_snapshot(self, source: GuildSnapshot, target_id: str, resume: bool = False):
+        """Copy a server snapshot to an existing server, optionally resuming an interrupted copy"""
+        from rich.panel import Panel
+        try:
+            source = self.config.select(source)
+            source_guild = source.guild
             target_guild = await self.user_api.request('GET', f'/guilds/{target_id}?with_counts=true')
             
             if not source_guild or not target_guild:
@@ -447,200 +2768,453 @@ class ServerCopier:
 
             self.console.print(Panel(f"[cyan]Copying from:[/] {source_guild['name']}\n[cyan]To:[/] {target_guild['name']}", title="Server Copy"))
 
-            # Clean target server first
-            await self.clean_server(target_id)
-            
-            with self.progress as progress:
-                overall_task = progress.add_task("[cyan]Overall copy progress...", total=6)
-                
-                # Copy server settings and icon
-                settings_task = progress.add_task("[magenta]Copying server settings...", total=100)
-                try:
-                    # Get server icon
-                    icon_data = await self.get_server_icon(source_id)
-                    progress.update(settings_task, advance=50)
-                    
-                    # Update server settings
-                    await self.user_api.request('PATCH', f'/guilds/{target_id}', json={
-                        "name": source_guild.get('name'),
-                        "icon": icon_data,
-                        "verification_level": source_guild.get('verification_level'),
-                        "default_message_notifications": source_guild.get('default_message_notifications'),
-                        "explicit_content_filter": source_guild.get('explicit_content_filter'),
-                        "afk_timeout": source_guild.get('afk_timeout'),
-                        "preferred_locale": source_guild.get('preferred_locale')
-                    })
-                    progress.update(settings_task, advance=50)
-                    progress.update(overall_task, advance=1)
-                except Exception as e:
-                    self.console.print(f"[red]Error copying server settings: {str(e)}")
+            journal = CopyJournal.for_copy(source.id, target_id)
+            if resume and journal.exists():
+                journal.load()
+                self.console.print(f"[cyan]Resuming copy: {len(journal.completed)} of {len(journal.planned)} operations already done[/]")
+            else:
+                journal.reset()
+
+            # Clean target server first, unless disabled or an interrupted run already did
+            if self.config.clean_target and not journal.cleaned:
+                await self.clean_server(target_id, self.config.clean_kinds)
+                journal.mark_cleaned()
+
+            # Only the emoji and sticker slots still taken after the cleanup count against the target
+            existing_emojis, existing_stickers = await asyncio.gather(*(
+                self.user_api.request('GET', f'/guilds/{target_id}/{kind}') if self.config.copies(kind) else asyncio.sleep(0, [])
+                for kind in ('emojis', 'stickers')
+            ))
+            capacity = await TargetCapacity.fetch(self.user_api, target_guild, source, existing_emojis, existing_stickers)
+            source, issues = validate_for_target(source, capacity, journal.completed)
+            self._print_validation_report(issues)
+
+            role_mapping, channel_mapping = journal.mappings()
+            # @everyone is the guild itself, its overwrites name the target instead of the source
+            role_mapping[source.id] = target_id
+            operations = self._copy_operations(source, target_id, role_mapping, channel_mapping)
+            journal.plan(operations)
+            # Ordering only sends moves, so it runs again in case a resumed run creates more objects
+            pending = [op for op in operations if op.key not in journal.completed or op.stage == 'order']
+            await self._run_operations(pending, "[cyan]Overall copy progress...", "copying", journal=journal)
+            failed = sum(1 for op in pending if op.error)
+            if not failed:
+                journal.finish()
 
-                # Copy roles
-                roles_task = progress.add_task("[yellow]Copying roles...", total=100)
-                source_roles = await self.user_api.request('GET', f'/guilds/{source_id}/roles')
-                role_mapping = {}
-                
-                if source_roles:
-                    increment = 100 / len(source_roles)
-                    for role in reversed(source_roles):
-                        if role['name'] != '@everyone':
-                            try:
-                                new_role = await self.user_api.request('POST', f'/guilds/{target_id}/roles', json={
-                                    "name": role['name'],
-                                    "permissions": role['permissions'],
-                                    "color": role['color'],
-                                    "hoist": role['hoist'],
-                                    "mentionable": role['mentionable']
-                                })
-                                role_mapping[role['id']] = new_role['id']
-                                progress.update(roles_task, advance=increment)
-                            except Exception as e:
-                                self.console.print(f"[red]Error copying role {role.get('name', 'Unknown')}: {str(e)}")
-                progress.update(overall_task, advance=1)
+            self.console.print(Panel(
+                ("[green]Server copy completed successfully!\n" if not failed else
+                 f"[yellow]Server copy completed with {failed} failed operations, resume to retry them\n") +
+                f"[cyan]Copied:[/] {len(role_mapping) - 1} roles, {len(channel_mapping)} channels\n" +
+                f"[cyan]From:[/] {source_guild['name']}\n" +
+                f"[cyan]To:[/] {target_guild['name']}",
+                title="Success",
+                border_style="green" if not failed else "yellow"
+            ))
+            if self.verify_report:
+                report = await self.verify_snapshot(source, target_id, self.verify_report, self.verify_fix, validated=True)
+                return not failed and drift_resolved(report)
+            return not failed
 
-                # Copy categories and channels
-                channels_task = progress.add_task("[green]Copying channels...", total=100)
-                source_channels = await self.user_api.request('GET', f'/guilds/{source_id}/channels')
-                channel_mapping = {}
-                
-                if source_channels:
-                    # First copy categories
-                    categories = [c for c in source_channels if c['type'] == 4]
-                    if categories:
-                        cat_increment = 50 / len(categories)
-                        for category in categories:
-                            try:
-                                new_category = await self.user_api.request('POST', f'/guilds/{target_id}/channels', json={
-                                    "name": category['name'],
-                                    "type": 4,
-                                    "position": category['position'],
-                                    "permission_overwrites": self._update_permission_overwrites(category.get('permission_overwrites', []), role_mapping)
-                                })
-                                channel_mapping[category['id']] = new_category['id']
-                                progress.update(channels_task, advance=cat_increment)
-                            except Exception as e:
-                                self.console.print(f"[red]Error copying category {category.get('name', 'Unknown')}: {str(e)}")
-                    
-                    # Then copy other channels
-                    non_categories = [c for c in source_channels if c['type'] != 4]
-                    if non_categories:
-                        chan_increment = 50 / len(non_categories)
-                        for channel in non_categories:
-                            try:
-                                new_channel = await self.user_api.request('POST', f'/guilds/{target_id}/channels', json={
-                                    "name": channel['name'],
-                                    "type": channel['type'],
-                                    "topic": channel.get('topic'),
-                                    "bitrate": channel.get('bitrate'),
-                                    "user_limit": channel.get('user_limit'),
-                                    "rate_limit_per_user": channel.get('rate_limit_per_user'),
-                                    "position": channel['position'],
-                                    "nsfw": channel.get('nsfw', False),
-                                    "parent_id": channel_mapping.get(channel.get('parent_id')),
-                                    "permission_overwrites": self._update_permission_overwrites(channel.get('permission_overwrites', []), role_mapping)
-                                })
-                                channel_mapping[channel['id']] = new_channel['id']
-                                progress.update(channels_task, advance=chan_increment)
-                            except Exception as e:
-                                self.console.print(f"[red]Error copying channel {channel.get('name', 'Unknown')}: {str(e)}")
-                progress.update(overall_task, advance=1)
+        except Exception as e:
+            self.console.print(f"[red]Error copying server: {str(e)}")
+            logger.error(f"Server copy error: {str(e)}", exc_info=True)
+            return False
 
-                # Copy emojis
-                emojis_task = progress.add_task("[blue]Copying emojis...", total=100)
-                source_emojis = await self.user_api.request('GET', f'/guilds/{source_id}/emojis')
-                if source_emojis:
-                    increment = 100 / len(source_emojis)
-                    for emoji in source_emojis:
-                        try:
-                            # Get emoji image data
-                            emoji_url = f"https://cdn.discordapp.com/emojis/{emoji['id']}.png"
-                            async with aiohttp.ClientSession() as session:
-                                async with session.get(emoji_url) as resp:
-                                    if resp.status == 200:
-                                        image_data = await resp.read()
-                                        image_b64 = f"data:image/png;base64,{base64.b64encode(image_data).decode('utf-8')}"
-                                        
-                                        await self.user_api.request('POST', f'/guilds/{target_id}/emojis', json={
-                                            "name": emoji['name'],
-                                            "image": image_b64,
-                                            "roles": [role_mapping.get(role_id, role_id) for role_id in emoji.get('roles', [])]
-                                        })
-                            progress.update(emojis_task, advance=increment)
-                        except Exception as e:
-                            self.console.print(f"[red]Error copying emoji {emoji.get('name', 'Unknown')}: {str(e)}")
-                progress.update(overall_task, advance=1)
+    def _copy_operations(self, source: GuildSnapshot, target_id: str, role_mapping: Dict[str, str],
+                         channel_mapping: Dict[str, str]) -> List[Operation]:
+        """Express a copy as operations that depend only on the objects they reference"""
+        operations = []
+        index = source.index
+        role_keys = {role['id']: f"role:{role['id']}" for role in index.roles}
+
+        def role_deps(role_ids: List[str]) -> List[str]:
+            return [role_keys[role_id] for role_id in role_ids if role_id in role_keys]
+
+        async def copy_settings():
+            icon_data = await source.icon(self.user_api.assets)
+            return await self.user_api.request('PATCH', f'/guilds/{target_id}', json=settings_payload(source.guild, icon_data))
+
+        if self.config.copy_settings:
+            operations.append(Operation('settings', 'settings', 'PATCH', f'/guilds/{target_id}', copy_settings,
+                                        description="server settings"))
+
+        # Roles are created in any order, the order operation below stacks them like the source
+        for role in reversed(index.roles):
+            async def copy_role(role=role):
+                new_role = await self.user_api.request('POST', f'/guilds/{target_id}/roles', json=role_payload(role))
+                role_mapping[role['id']] = new_role['id']
+                return new_role
+
+            operations.append(Operation(role_keys[role['id']], 'roles', 'POST', f'/guilds/{target_id}/roles', copy_role,
+                                        description=f"role {role.get('name', 'Unknown')}"))
+
+        # Categories wait for the roles in their overwrites, channels also for their category
+        for channel in index.creation_order:
+            async def copy_channel(channel=channel):
+                new_channel = await self.user_api.request(
+                    'POST', f'/guilds/{target_id}/channels', json=channel_payload(channel, role_mapping, channel_mapping)
+                )
+                channel_mapping[channel['id']] = new_channel['id']
+                return new_channel
+
+            deps = role_deps(index.overwrite_roles.get(channel['id'], []))
+            if channel.get('parent_id'):
+                deps.append(f"channel:{channel['parent_id']}")
+            kind = 'category' if channel['type'] == 4 else 'channel'
+            operations.append(Operation(f"channel:{channel['id']}", 'channels', 'POST', f'/guilds/{target_id}/channels',
+                                        copy_channel, deps=deps, description=f"{kind} {channel.get('name', 'Unknown')}"))
+
+        # Emojis and stickers download while other uploads are in flight, bounded by their stage concurrency
+        for emoji in source.emojis:
+            async def copy_emoji(emoji=emoji):
+                image_b64 = await source.emoji_image(self.user_api.assets, emoji)
+                if image_b64:
+                    return await self.user_api.request(
+                        'POST', f'/guilds/{target_id}/emojis', json=emoji_payload(emoji, role_mapping, image_b64)
+                    )
+
+            operations.append(Operation(f"emoji:{emoji['id']}", 'emojis', 'POST', f'/guilds/{target_id}/emojis', copy_emoji,
+                                        deps=role_deps(emoji.get('roles', [])), description=f"emoji {emoji.get('name', 'Unknown')}"))
 
-                # Copy stickers
-                stickers_task = progress.add_task("[magenta]Copying stickers...", total=100)
-                source_stickers = await self.user_api.request('GET', f'/guilds/{source_id}/stickers')
-                if source_stickers:
-                    increment = 100 / len(source_stickers)
-                    for sticker in source_stickers:
-                        try:
-                            # Get sticker data
-                            sticker_url = f"https://cdn.discordapp.com/stickers/{sticker['id']}.png"
-                            async with aiohttp.ClientSession() as session:
-                                async with session.get(sticker_url) as resp:
-                                    if resp.status == 200:
-                                        sticker_data = await resp.read()
-                                        sticker_b64 = f"data:image/png;base64,{base64.b64encode(sticker_data).decode('utf-8')}"
-                                        
-                                        await self.user_api.request('POST', f'/guilds/{target_id}/stickers', json={
-                                            "name": sticker['name'],
-                                            "description": sticker.get('description', ''),
-                                            "tags": sticker.get('tags', ''),
-                                            "file": sticker_b64
-                                        })
-                            progress.update(stickers_task, advance=increment)
-                        except Exception as e:
-                            self.console.print(f"[red]Error copying sticker {sticker.get('name', 'Unknown')}: {str(e)}")
+        for sticker in source.stickers:
+            async def copy_sticker(sticker=sticker):
+                sticker_b64 = await source.sticker_file(self.user_api.assets, sticker)
+                if sticker_b64:
+                    return await self.user_api.request(
+                        'POST', f'/guilds/{target_id}/stickers', json=sticker_payload(sticker, sticker_b64)
+                    )
+
+            operations.append(Operation(f"sticker:{sticker['id']}", 'stickers', 'POST', f'/guilds/{target_id}/stickers',
+                                        copy_sticker, description=f"sticker {sticker.get('name', 'Unknown')}"))
+
+        # Once every role or channel exists, a single bulk request puts them in source order
+        for kind, mapping, deps in (('roles', role_mapping, list(role_keys.values())),
+                                    ('channels', channel_mapping, [f"channel:{c['id']}" for c in source.channels])):
+            operations.append(Operation(f"order:{kind}", 'order', 'PATCH', f'/guilds/{target_id}/{kind}',
+                                        lambda kind=kind, mapping=mapping: self._apply_order(source, target_id, kind, mapping),
+                                        deps=deps, description=f"{kind} order"))
+
+        return operations
+
+    def _member_overwrite_operations(self, source: GuildSnapshot, role_mapping: Dict[str, str],
+                                     channel_mapping: Dict[str, str]) -> List[Operation]:
+        """Give channels made by the create guild call the member overwrites it cannot carry"""
+        operations = []
+        for channel in source.channels:
+            new_id = channel_mapping.get(channel['id'])
+            if not new_id or not any(o['type'] == 1 for o in channel.get('permission_overwrites', [])):
+                continue
+
+            async def copy_overwrites(channel=channel, new_id=new_id):
+                overwrites = channel_payload(channel, role_mapping, channel_mapping)['permission_overwrites']
+                return await self.user_api.request('PATCH', f'/channels/{new_id}', json={"permission_overwrites": overwrites})
+
+            kind = 'category' if channel['type'] == 4 else 'channel'
+            operations.append(Operation(f"overwrites:{channel['id']}", 'channels', 'PATCH', f'/channels/{new_id}',
+                                        copy_overwrites, description=f"{kind} {channel.get('name', 'Unknown')} overwrites"))
+        return operations
+
+    async def _apply_order(self, source: GuildSnapshot, target_id: str, kind: str, mapping: Dict[str, str],
+                           target_items: Optional[List[dict]] = None) -> int:
+        """Move copied roles or channels into source order with one bulk request, returning how many moved"""
+        if target_items is None:
+            target_items = await self.user_api.request('GET', f'/guilds/{target_id}/{kind}')
+        moves = order_moves(kind, source, target_id, target_items or [], mapping)
+        if moves:
+            await self.user_api.request('PATCH', f'/guilds/{target_id}/{kind}', json=moves)
+        return len(moves)
+
+    def _print_validation_report(self, issues: List[ValidationIssue]):
+        """Show what was dropped or changed before sending, logging every issue"""
+        from rich.table import Table
+        from rich.box import ROUNDED
+        if not issues:
+            return
+        table = Table(title="Adjusted for the target", box=ROUNDED)
+        for column in ("Kind", "Object", "Action", "Reason"):
+            table.add_column(column)
+        for issue in issues[:VALIDATION_REPORT_ROWS]:
+            table.add_row(issue.kind, issue.name, issue.action, issue.reason)
+        if len(issues) > VALIDATION_REPORT_ROWS:
+            table.add_row("...", f"{len(issues) - VALIDATION_REPORT_ROWS} more in the log", "", "")
+        self.console.print(table)
+        for issue in issues:
+            logger.info(f"{issue.kind} {issue.name} {issue.action}: {issue.reason}")
+
+    async def _run_operations(self, operations: List[Operation], overall_label: str, verb: str,
+                              labels: Dict[str, str] = STAGE_LABELS, concurrency: Optional[Dict[str, int]] = None,
+                              journal: Optional['CopyJournal'] = None):
+        """Run operations through the scheduler with a progress bar per stage, journaling completed ones"""
+        with self.progress as progress:
+            overall_task = progress.add_task(overall_label, total=len(operations))
+            stage_tasks = {}
+            for stage, label in labels.items():
+                count = sum(1 for op in operations if op.stage == stage)
+                if count:
+                    stage_tasks[stage] = progress.add_task(label, total=count)
+
+            def on_done(op: Operation):
+                if op.error:
+                    self.console.print(f"[red]Error {verb} {op.description}: {str(op.error)}")
+                elif journal:
+                    journal.record(op)
+                progress.update(stage_tasks[op.stage], advance=1)
                 progress.update(overall_task, advance=1)
 
-                # Final update
-                progress.update(overall_task, completed=100)
+            await OperationScheduler(concurrency or self.config.concurrency, self.profiler, verb).run(operations, on_done)
+
+    async def sync_server(self, source_id: str, target_id: str):
+        """Bring an existing server in line with a source server, sending only the needed changes"""
+        try:
+            source = await GuildSnapshot.fetch(self.user_api, source_id, self.config.source_kinds)
+        except Exception as e:
+            self.console.print(f"[red]Error: Could not read source server: {str(e)}")
+            return False
+        return await self.sync_snapshot(source, target_id)
+
+    async def sync_snapshot(self, source: GuildSnapshot, target_id: str):
+        """Bring an existing server in line with a server snapshot"""
+        from rich.panel import Panel
+        from rich.table import Table
+        from rich.box import ROUNDED
+        try:
+            # Disabled stages are neither read nor compared on either side
+            source = self.config.select(source)
+            target = await GuildSnapshot.fetch(self.user_api, target_id, self.config.source_kinds)
+            # Compare against what a copy would send, so converted channels and dropped overwrites are not undone
+            capacity = await TargetCapacity.fetch(self.user_api, target.guild, source)
+            source, issues = validate_for_target(source, capacity)
+            self._print_validation_report(issues)
+            plan = SyncPlan(source, target)
+            if not self.config.copy_settings:
+                plan.actions = [action for action in plan.actions if action.kind != 'settings']
+
+            if not plan.actions and not plan.out_of_order:
+                self.console.print(Panel("[green]Target server is already in sync!", title="Success", border_style="green"))
+                return True
+
+            table = Table(title=f"Sync plan: {source.guild['name']} → {target.guild['name']}", box=ROUNDED)
+            table.add_column("Kind", style="cyan")
+            for action in ('create', 'update', 'delete'):
+                table.add_column(action.capitalize(), justify="right")
+            for kind, counts in plan.summary().items():
+                table.add_row(kind, *(str(counts[action]) for action in ('create', 'update', 'delete')))
+            self.console.print(table)
+
+            failed, moved = await self._apply_plan(plan, "[cyan]Applying changes...")
 
             self.console.print(Panel(
-                "[green]Server copy completed successfully!\n" +
-                f"[cyan]Copied:[/] {len(role_mapping)} roles, {len(channel_mapping)} channels\n" +
-                f"[cyan]From:[/] {source_guild['name']}\n" +
-                f"[cyan]To:[/] {target_guild['name']}",
+                "[green]Server sync completed!\n" +
+                f"[cyan]Applied:[/] {len(plan.actions) - failed} of {len(plan.actions)} changes, {moved} moves\n" +
+                f"[cyan]From:[/] {source.guild['name']}\n" +
+                f"[cyan]To:[/] {target.guild['name']}",
                 title="Success",
-                border_style="green"
+                border_style="green" if not failed else "yellow"
             ))
-            return True
+            return not failed
 
         except Exception as e:
-            self.console.print(f"[red]Error copying server: {str(e)}")
-            logger.error(f"Server copy error: {str(e)}", exc_info=True)
+            self.console.print(f"[red]Error syncing server: {str(e)}")
+            logger.error(f"Server sync error: {str(e)}", exc_info=True)
             return False
 
+    async def _apply_plan(self, plan: SyncPlan, label: str) -> Tuple[int, int]:
+        """Apply a sync plan's actions in order, then the role and channel order, returning failures and moves"""
+        failed = 0
+        with self.progress as progress:
+            sync_task = progress.add_task(label, total=len(plan.actions))
+            for action in plan.actions:
+                try:
+                    await self._apply_sync_action(plan, action)
+                except Exception as e:
+                    failed += 1
+                    self.console.print(f"[red]Error applying {action.action} to {action.kind} {action.name}: {str(e)}")
+                progress.update(sync_task, advance=1)
+
+        moved = 0
+        for kind, mapping in (('roles', plan.role_mapping), ('channels', plan.channel_mapping)):
+            try:
+                moved += await self._apply_order(plan.source, plan.target.id, kind, mapping)
+            except Exception as e:
+                failed += 1
+                self.console.print(f"[red]Error ordering {kind}: {str(e)}")
+        return failed, moved
+
+    async def verify_server(self, source_id: str, target_id: str, report_path: str, fix: bool = False):
+        """Check a copy of a source server against its target"""
+        try:
+            source = await GuildSnapshot.fetch(self.user_api, source_id, self.config.source_kinds)
+        except Exception as e:
+            self.console.print(f"[red]Error: Could not read source server: {str(e)}")
+            return None
+        return await self.verify_snapshot(source, target_id, report_path, fix)
+
+    async def verify_snapshot(self, source: GuildSnapshot, target_id: str, report_path: str, fix: bool = False,
+                              validated: bool = False) -> Optional[dict]:
+        """Compare a target with the source it was copied from in one read, writing a drift report and optionally fixing it"""
+        from rich.panel import Panel
+        from rich.table import Table
+        from rich.box import ROUNDED
+        try:
+            source = self.config.select(source)
+            # Read what the target holds now, not what this run has cached
+            self.user_api.read_cache.invalidate(f'/guilds/{target_id}')
+            target = await GuildSnapshot.fetch(self.user_api, target_id, self.config.source_kinds)
+            if not validated:
+                # Expect what a copy would have sent, a cleaned target has all of its slots free
+                source, _ = validate_for_target(source, await TargetCapacity.fetch(self.user_api, target.guild, source))
+            plan = SyncPlan(source, target)
+
+            actions = []
+            for action in plan.actions:
+                # Without a cleanup, objects the target had before the copy are its own, not drift
+                if action.action == 'delete' and not self.config.clean_target:
+                    continue
+                if action.kind == 'settings' and not self.config.copy_settings:
+                    continue
+                actions.append(action)
+            plan.actions = actions
+            moves = {
+                'roles': order_moves('roles', source, target.id, target.roles, plan.role_mapping),
+                'channels': order_moves('channels', source, target.id, target.channels, plan.channel_mapping)
+            }
+            entries = drift_entries(plan, moves)
+
+            counts: Dict[str, Dict[str, int]] = {}
+            for entry in entries:
+                kind_counts = counts.setdefault(entry['kind'], {drift: 0 for drift in ('missing', 'changed', 'extra', 'moved')})
+                kind_counts[entry['drift']] += 1
+            report = {
+                "source": {"id": source.id, "name": source.guild.get('name')},
+                "target": {"id": target.id, "name": target.guild.get('name')},
+                "verified_at": datetime.now().isoformat(),
+                "checked": {
+                    "roles": len(source.index.roles),
+                    "channels": len(source.channels),
+                    "emojis": len(source.emojis),
+                    "stickers": len(source.stickers),
+                    "settings": self.config.copy_settings
+                },
+                "in_sync": not entries,
+                "counts": counts,
+                "drift": entries
+            }
+
+            if entries:
+                table = Table(title=f"Drift: {source.guild['name']} → {target.guild['name']}", box=ROUNDED)
+                table.add_column("Kind", style="cyan")
+                for drift in ('missing', 'changed', 'extra', 'moved'):
+                    table.add_column(drift.capitalize(), justify="right")
+                for kind, kind_counts in counts.items():
+                    table.add_row(kind, *(str(count) for count in kind_counts.values()))
+                self.console.print(table)
+
+            if fix and entries:
+                failed, moved = await self._apply_plan(plan, "[cyan]Fixing drift...")
+                report["fixes"] = {"applied": len(plan.actions) - failed, "failed": failed, "moved": moved}
+
+            with open(report_path, 'w') as f:
+                json.dump(report, f, indent=2)
+
+            fixes = report.get("fixes")
+            self.console.print(Panel(
+                ("[green]Target matches the source!\n" if not entries else
+                 f"[yellow]Found {len(entries)} differences\n") +
+                (f"[cyan]Fixed:[/] {fixes['applied']} changes, {fixes['moved']} moves, {fixes['failed']} failed\n" if fixes else "") +
+                f"[cyan]Checked:[/] {len(source.index.roles)} roles, {len(source.channels)} channels, " +
+                f"{len(source.emojis)} emojis, {len(source.stickers)} stickers\n" +
+                f"[cyan]Report:[/] {report_path}",
+                title="Verification",
+                border_style="green" if drift_resolved(report) else "yellow"
+            ))
+            return report
+
+        except Exception as e:
+            self.console.print(f"[red]Error verifying copy: {str(e)}")
+            logger.error(f"Copy verification error: {str(e)}", exc_info=True)
+            return None
+
+    async def _apply_sync_action(self, plan: SyncPlan, action: SyncAction):
+        """Send the request for a single planned sync action"""
+        target_id = plan.target.id
+        source, target = action.source, action.target
+
+        if action.action == 'delete':
+            if action.kind in ('channel', 'category'):
+                await self.user_api.request('DELETE', f'/channels/{target["id"]}')
+            else:
+                await self.user_api.request('DELETE', f'/guilds/{target_id}/{action.kind}s/{target["id"]}')
+            return
+
+        if action.kind == 'settings':
+            changes = dict(action.changes)
+            if 'icon' in changes:
+                changes['icon'] = await plan.source.icon(self.user_api.assets)
+            await self.user_api.request('PATCH', f'/guilds/{target_id}', json=changes)
+
+        elif action.kind == 'role':
+            if action.action == 'create':
+                new_role = await self.user_api.request('POST', f'/guilds/{target_id}/roles', json=role_payload(source))
+                plan.role_mapping[source['id']] = new_role['id']
+            else:
+                await self.user_api.request('PATCH', f'/guilds/{target_id}/roles/{target["id"]}', json=action.changes)
+
+        elif action.kind in ('category', 'channel'):
+            # Recompute against the final mappings, roles created earlier in the sync now have target ids
+            payload = channel_payload(source, plan.role_mapping, plan.channel_mapping)
+            if action.action == 'create':
+                new_channel = await self.user_api.request('POST', f'/guilds/{target_id}/channels', json=payload)
+                plan.channel_mapping[source['id']] = new_channel['id']
+            else:
+                changes = changed_fields(payload, target, CHANNEL_IGNORED_FIELDS)
+                if changes:
+                    await self.user_api.request('PATCH', f'/channels/{target["id"]}', json=changes)
+
+        elif action.kind == 'emoji':
+            if action.action == 'create':
+                image = await plan.source.emoji_image(self.user_api.assets, source)
+                if image:
+                    await self.user_api.request('POST', f'/guilds/{target_id}/emojis', json=emoji_payload(source, plan.role_mapping, image))
+            else:
+                await self.user_api.request('PATCH', f'/guilds/{target_id}/emojis/{target["id"]}', json=emoji_payload(source, plan.role_mapping))
+
+        elif action.kind == 'sticker':
+            if action.action == 'create':
+                file_data = await plan.source.sticker_file(self.user_api.assets, source)
+                if file_data:
+                    await self.user_api.request('POST', f'/guilds/{target_id}/stickers', json=sticker_payload(source, file_data))
+            else:
+                await self.user_api.request('PATCH', f'/guilds/{target_id}/stickers/{target["id"]}', json=action.changes)
+
     async def copy_server(self, source_id: str, new_name: str):
         """Create a new server and copy content from source server"""
+        from rich.panel import Panel
         try:
-            # Verify source server access
-            source_guild = await self.user_api.request('GET', f'/guilds/{source_id}?with_counts=true')
-            if not source_guild:
+            # Read the source once, the new server is created from it
+            try:
+                source = await GuildSnapshot.fetch(self.user_api, source_id, self.config.source_kinds)
+            except Exception:
+                source = None
+            if not source or not source.guild:
                 self.console.print("[red]Error: Could not access source server. Please check the ID and permissions.")
                 return False
+            source_guild = source.guild
+
+            # A new server has no boosts, no features and no members but us
+            me = await self.user_api.request('GET', '/users/@me')
+            source, issues = validate_for_target(source, TargetCapacity({}, {me['id']}))
+            self._print_validation_report(issues)
 
             self.console.print(f"\n[cyan]Creating new server: {new_name}[/]")
             
-            # Create new server
+            # Create new server with its roles and channels in a single request
             new_guild = None
             try:
                 # Get source server icon
-                icon_data = await self.get_server_icon(source_id)
+                icon_data = await source.icon(self.user_api.assets) if self.config.copy_settings else None
                 
-                new_guild = await self.user_api.request('POST', '/guilds', json={
-                    "name": new_name,
-                    "icon": icon_data,
-                    "verification_level": source_guild.get('verification_level', 0),
-                    "default_message_notifications": source_guild.get('default_message_notifications', 0),
-                    "explicit_content_filter": source_guild.get('explicit_content_filter', 0),
-                    "preferred_locale": source_guild.get('preferred_locale', "en-US"),
-                    "roles": [],
-                    "channels": []
-                })
+                payload = guild_create_payload(source, new_name, icon_data, self.config.copy_settings)
+                new_guild = await self.user_api.request('POST', '/guilds', json=payload)
                 if not new_guild:
                     self.console.print("[red]Error: Failed to create new server.")
                     return False
@@ -649,21 +3223,49 @@ class ServerCopier:
                 self.console.print(f"[red]Error creating new server: {str(e)}")
                 return False
 
-            # Wait for server creation to complete
-            await asyncio.sleep(2)
-
             self.console.print(Panel(f"[cyan]Copying from:[/] {source_guild['name']}\n[cyan]To:[/] {new_name}", title="Server Copy"))
-            
-            # Copy everything to the new server
-            success = await self.copy_to_existing_server(source_id, new_guild_id)
+
+            # Map the skeleton back to the source, then create only what the create call could not express
+            new_roles = new_guild.get('roles') or await self.user_api.request('GET', f'/guilds/{new_guild_id}/roles')
+            new_channels = await self.user_api.request('GET', f'/guilds/{new_guild_id}/channels')
+            skeleton = SyncPlan(source, GuildSnapshot(new_guild, new_roles or [], new_channels or [], [], []))
+            role_mapping, channel_mapping = skeleton.role_mapping, skeleton.channel_mapping
+            created = {'settings'} | {f"role:{role_id}" for role_id in role_mapping} | {f"channel:{channel_id}" for channel_id in channel_mapping}
+            self.console.print(
+                f"[green]Created {len(role_mapping) - 1} roles and {len(channel_mapping)} channels with the server[/]"
+            )
+
+            # Journal the skeleton as done so a failed run resumes as a copy to the new server
+            journal = CopyJournal.for_copy(source.id, new_guild_id)
+            journal.reset()
+            journal.mark_cleaned()
+            operations = self._copy_operations(source, new_guild_id, role_mapping, channel_mapping)
+            operations.extend(self._member_overwrite_operations(source, role_mapping, channel_mapping))
+            journal.plan(operations)
+            journal.record_mappings(role_mapping, channel_mapping)
+            operations = [op for op in operations if op.key not in created]
+            await self._run_operations(operations, "[cyan]Overall copy progress...", "copying", journal=journal)
+            success = all(op.error is None for op in operations)
+            if success:
+                journal.finish()
+            else:
+                self.console.print(f"[yellow]Some objects failed, copy to existing server {new_guild_id} with resume to retry them[/]")
+            if self.verify_report:
+                # The new server is named by the user, not after its source
+                expected = source.derive(guild=dict(source.guild, name=new_name))
+                report = await self.verify_snapshot(expected, new_guild_id, self.verify_report, self.verify_fix, validated=True)
+                success = success and drift_resolved(report)
             
             if success:
                 # Create invite link
                 try:
-                    channels = await self.user_api.request('GET', f'/guilds/{new_guild_id}/channels')
-                    text_channels = [c for c in channels if c['type'] == 0]  # Type 0 is text channel
+                    # The mapping already knows the new text channels, no need to list them again
+                    text_channels = [
+                        channel_mapping[c['id']] for c in sorted(source.channels, key=lambda c: c.get('position', 0))
+                        if c['type'] == 0 and c['id'] in channel_mapping  # Type 0 is text channel
+                    ]
                     if text_channels:
-                        invite = await self.user_api.request('POST', f'/channels/{text_channels[0]["id"]}/invites', json={
+                        invite = await self.user_api.request('POST', f'/channels/{text_channels[0]}/invites', json={
                             "max_age": 86400,  # 24 hours
                             "max_uses": 0,     # Unlimited uses
                             "temporary": False,
@@ -690,38 +3292,29 @@ class ServerCopier:
             logger.error(f"Server creation error: {str(e)}", exc_info=True)
             return False
 
-    def _update_permission_overwrites(self, overwrites: List[dict], role_mapping: Dict[str, str]) -> List[dict]:
-        """Update permission overwrites with new role IDs"""
-        updated_overwrites = []
-        for overwrite in overwrites:
-            new_overwrite = overwrite.copy()
-            if overwrite['type'] == 0:  # Role overwrite
-                new_overwrite['id'] = role_mapping.get(overwrite['id'], overwrite['id'])
-            updated_overwrites.append(new_overwrite)
-        return updated_overwrites
-
-async def verify_token(token: str) -> bool:
+async def verify_token(token: str, timeout: Optional[float] = None) -> bool:
     """Verify if the Discord token is valid"""
-    try:
-        headers = {
-            "Authorization": token,
-            "Content-Type": "application/json"
-        }
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(f"{BASE_URL}/users/@me") as resp:
-                if resp.status == 200:
-                    user_data = await resp.json()
-                    logger.info(f"Token verified for user: {user_data.get('username', 'Unknown')}")
-                    return True
-                else:
-                    logger.error(f"Token verification failed with status {resp.status}")
-                    return False
-    except Exception as e:
-        logger.error(f"Token verification error: {str(e)}")
+    async with UserAPI(token, metrics_dir=None, timeout=timeout) as user_api:
+        return await user_api.verify_token()
+
+def ask_resume(source_id: str, target_id: str) -> bool:
+    """Offer to resume an unfinished copy between the same servers"""
+    if not CopyJournal.for_copy(source_id, target_id).is_unfinished():
         return False
+    from rich.prompt import Prompt
+    return Prompt.ask(
+        "[yellow]A previous copy to this server did not finish. Resume it?[/]", choices=["yes", "no"], default="yes"
+    ) == "yes"
 
 async def main():
-    """Main entry point of the application"""
+    """Interactive entry point of the application"""
+    # The menu's UI modules are only needed here
+    from colorama import init
+    from rich.console import Console
+    from rich.panel import Panel
+    from rich.prompt import Prompt
+    init(autoreset=True)
+
     # Initialize rich console at the start
     console = Console()
     
@@ -733,6 +3326,8 @@ async def main():
             console.print(f"[red]{str(e)}[/]")
             return
         
+        config = RunConfig.from_config(load_config())
+
         # Try to load token from .env file first
         load_dotenv()
         token = os.getenv('DISCORD_TOKEN')
@@ -753,7 +3348,7 @@ async def main():
                     console.print("[green]Token saved to .env file[/]")
 
         # Verify token if provided
-        if token and not await verify_token(token):
+        if token and not await verify_token(token, config.timeout):
             console.print("[red]Error: Invalid Discord token[/]")
             token = None
 
@@ -767,12 +3362,16 @@ async def main():
 1. [green]Copy Server[/] - Create new server with content
 2. [yellow]Clean Server[/] - Remove all content
 3. [blue]Copy to Existing[/] - Copy content to existing server
-4. [red]Exit[/]
+4. [magenta]Export Snapshot[/] - Save server content to a file
+5. [magenta]Import Snapshot[/] - Copy a saved snapshot to existing server
+6. [blue]Sync to Existing[/] - Apply only the differences to existing server
+7. [cyan]Dry Run[/] - Plan a copy to existing server and estimate its duration
+8. [red]Exit[/]
             """, title="Main Menu", border_style="cyan"))
             
-            choice = Prompt.ask("Enter your choice", choices=["1", "2", "3", "4"])
+            choice = Prompt.ask("Enter your choice", choices=["1", "2", "3", "4", "5", "6", "7", "8"])
             
-            if choice == "4":
+            if choice == "8":
                 console.print("[yellow]Goodbye![/]")
                 break
             
@@ -780,14 +3379,17 @@ async def main():
             operation_token = token
             if not operation_token:
                 operation_token = Prompt.ask("Enter your Discord token", password=True)
-                if not await verify_token(operation_token):
+                if not await verify_token(operation_token, config.timeout):
                     console.print("[red]Invalid token. Returning to menu...[/]")
                     continue
                 
-            source_id = Prompt.ask("\nEnter source server ID")
+            if choice == "5":
+                snapshot_path = Prompt.ask("\nEnter snapshot file path")
+            else:
+                source_id = Prompt.ask("\nEnter source server ID")
             
-            async with UserAPI(operation_token) as user_api:
-                copier = ServerCopier(user_api)
+            async with UserAPI(operation_token, retry_policy=config.retry_policy(), timeout=config.timeout) as user_api:
+                copier = ServerCopier(user_api, config=config)
                 
                 if choice == "1":
                     new_name = Prompt.ask("Enter name for the new server")
@@ -802,7 +3404,26 @@ async def main():
                         await copier.clean_server(source_id)
                 elif choice == "3":
                     target_id = Prompt.ask("Enter target server ID")
-                    await copier.copy_to_existing_server(source_id, target_id)
+                    resume = ask_resume(source_id, target_id)
+                    await copier.copy_to_existing_server(source_id, target_id, resume)
+                elif choice == "4":
+                    snapshot_path = Prompt.ask("Enter snapshot file path", default=f"{source_id}.snapshot.json.gz")
+                    await copier.export_snapshot(source_id, snapshot_path)
+                elif choice == "5":
+                    target_id = Prompt.ask("Enter target server ID")
+                    try:
+                        snapshot_source_id = GuildSnapshot.load(snapshot_path).id
+                    except (OSError, ValueError, KeyError):
+                        snapshot_source_id = None
+                    resume = bool(snapshot_source_id) and ask_resume(snapshot_source_id, target_id)
+                    await copier.import_snapshot(snapshot_path, target_id, resume)
+                elif choice == "6":
+                    target_id = Prompt.ask("Enter target server ID")
+                    await copier.sync_server(source_id, target_id)
+                elif choice == "7":
+                    target_id = Prompt.ask("Enter target server ID")
+                    plan_path = Prompt.ask("Enter plan file path", default=f"{source_id}-{target_id}.plan.json")
+                    await copier.plan_copy(source_id, target_id, plan_path)
             
             # Pause before showing menu again
             console.print("\nPress Enter to continue...")
@@ -813,7 +3434,222 @@ async def main():
         logger.error(f"Error in main loop: {str(e)}", exc_info=True)
         console.print(f"[red]An error occurred: {str(e)}[/]")
 
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_UNAUTHORIZED = 3
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the parser of the non-interactive command line"""
+    parser = argparse.ArgumentParser(
+        prog="discopy.py",
+        description="Copy Discord servers without the interactive menu. Run without arguments for the menu."
+    )
+    parser.add_argument('--token', help="Discord token, defaults to DISCORD_TOKEN from the environment or .env")
+    parser.add_argument('--progress', action='store_true', help="Show progress bars")
+    traffic = parser.add_mutually_exclusive_group()
+    traffic.add_argument('--record', metavar='CASSETTE', help="Record every API and CDN response of the run to this file")
+    traffic.add_argument('--replay', metavar='CASSETTE', help="Answer requests from a recorded cassette instead of Discord")
+    parser.add_argument('--replay-scale', type=float, default=1.0,
+                        help="Multiplier for the recorded request times and latencies, 0 replays without waiting")
+    parser.add_argument('--profile', metavar='FOLDED',
+                        help="Split the run's time into rate limit waits, network, CDN and CPU, writing folded stacks for a flamegraph")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    copy_parser = commands.add_parser('copy', help="Copy a server, or a snapshot file, to an existing or a new server")
+    copy_parser.add_argument('source', help="Source server ID, or snapshot path with --snapshot")
+    destination = copy_parser.add_mutually_exclusive_group(required=True)
+    destination.add_argument('--target', help="ID of the existing server to copy into")
+    destination.add_argument('--name', help="Name of a new server to create")
+    copy_parser.add_argument('--snapshot', action='store_true', help="Read the source from a snapshot file")
+    copy_parser.add_argument('--resume', action='store_true', help="Resume an unfinished copy to the same target")
+    copy_parser.add_argument('--dry-run', metavar='PLAN', help="Only write the plan and time estimate to this file")
+    copy_parser.add_argument('--verify', metavar='REPORT', help="Check the target against the source afterwards, writing the drift to this file")
+    copy_parser.add_argument('--fix', action='store_true', help="With --verify, send the changes that remove the drift found")
+
+    clean_parser = commands.add_parser('clean', help="Remove all content from a server")
+    clean_parser.add_argument('guild', help="ID of the server to clean")
+    clean_parser.add_argument('--yes', action='store_true', help="Confirm deleting everything in the server")
+
+    sync_parser = commands.add_parser('sync', help="Apply only the differences between two servers")
+    sync_parser.add_argument('source', help="Source server ID, or snapshot path with --snapshot")
+    sync_parser.add_argument('target', help="ID of the server to bring in line")
+    sync_parser.add_argument('--snapshot', action='store_true', help="Read the source from a snapshot file")
+
+    verify_parser = commands.add_parser('verify', help="Check a copy against its source and report the drift")
+    verify_parser.add_argument('source', help="Source server ID, or snapshot path with --snapshot")
+    verify_parser.add_argument('target', help="ID of the server that was copied into")
+    verify_parser.add_argument('--snapshot', action='store_true', help="Read the source from a snapshot file")
+    verify_parser.add_argument('--report', help="Drift report path, defaults to <target>.drift.json")
+    verify_parser.add_argument('--fix', action='store_true', help="Send the changes that remove the drift found")
+
+    export_parser = commands.add_parser('export', help="Save a server and its assets to a snapshot file")
+    export_parser.add_argument('source', help="Source server ID")
+    export_parser.add_argument('--output', help="Snapshot path, defaults to <source>.snapshot.json.gz")
+    return parser
+
+def command_arguments(args: argparse.Namespace) -> dict:
+    """The arguments that say what a command does, without credentials or how it talks to the network"""
+    return {key: value for key, value in vars(args).items()
+            if key not in ('token', 'progress', 'record', 'replay', 'replay_scale', 'profile')}
+
+async def run_command(args: argparse.Namespace, console: 'Console') -> int:
+    """Run one command of the non-interactive command line, returning its exit code"""
+    replay = None
+    if args.replay:
+        try:
+            replay = Cassette.load(args.replay)
+        except (OSError, ValueError) as e:
+            console.print(f"[red]Error loading cassette: {str(e)}")
+            return EXIT_FAILED
+        token = 'replay'  # Never sent, the cassette answers every request
+    else:
+        token = args.token or os.getenv('DISCORD_TOKEN')
+        if not token:
+            console.print("[red]Error: No token, pass --token or set DISCORD_TOKEN[/]")
+            return EXIT_UNAUTHORIZED
+
+    recorder = Cassette(command=command_arguments(args)) if args.record else None
+    profiler = RunProfiler(args.command) if args.profile else None
+    config = RunConfig.from_config(load_config())
+    try:
+        async with UserAPI(token, retry_policy=config.retry_policy(), recorder=recorder, replay=replay,
+                           replay_scale=args.replay_scale, timeout=config.timeout) as user_api:
+            # Checked over the connection the command then reuses
+            if replay is None and not await user_api.verify_token():
+                console.print("[red]Error: Invalid Discord token[/]")
+                return EXIT_UNAUTHORIZED
+            copier = ServerCopier(user_api, console, show_progress=args.progress, config=config)
+            if profiler is not None:
+                copier.profiler = profiler
+                code = await profiler.measure(profiler.root, dispatch_command(args, copier, console))
+            else:
+                code = await dispatch_command(args, copier, console)
+    finally:
+        if recorder is not None:
+            try:
+                recorder.save(args.record)
+                console.print(f"[cyan]Recorded {len(recorder.interactions)} responses to {args.record}[/]")
+            except OSError as e:
+                console.print(f"[red]Error saving cassette: {str(e)}")
+    if replay is not None and replay.missed:
+        console.print(f"[yellow]{replay.missed} requests had no recorded response, the run diverged from the recording[/]")
+    if profiler is not None:
+        print_profile(console, profiler)
+        try:
+            profiler.write(args.profile)
+            console.print(f"[cyan]Profile written to {args.profile}[/]")
+        except OSError as e:
+            console.print(f"[red]Error saving profile: {str(e)}")
+    return code
+
+def print_profile(console: 'Console', profiler: RunProfiler, top: int = PROFILE_TOP):
+    """Show where a profiled run's time went per stage, and its slowest operations"""
+    from rich.panel import Panel
+    from rich.table import Table
+    from rich.box import ROUNDED
+    columns = ("Ops", "Wall", "Rate limit", "Network", "CDN", "CPU", "Other")
+
+    def cells(frame: ProfileFrame) -> List[str]:
+        return [str(frame.count)] + [f"{value:.2f}s" for value in
+                                     (frame.wall, frame.rate_limit, frame.network, frame.cdn, frame.cpu, frame.other)]
+
+    table = Table(title="Time by stage, summed over concurrent operations", box=ROUNDED)
+    for column in ("Stage",) + columns:
+        table.add_column(column, justify="left" if column == "Stage" else "right")
+    for (phase, stage), frame in profiler.stage_totals().items():
+        table.add_row(f"{phase} {stage}", *cells(frame))
+    console.print(table)
+
+    operations = [frame for path, frame in profiler.frames.items() if len(path) == 4 and path[-1] != 'progress']
+    table = Table(title=f"Slowest {min(top, len(operations))} operations", box=ROUNDED)
+    for column in ("Operation",) + columns[1:]:
+        table.add_column(column, justify="left" if column == "Operation" else "right")
+    for frame in sorted(operations, key=lambda f: f.wall, reverse=True)[:top]:
+        table.add_row(frame.path[3], *cells(frame)[1:])
+    console.print(table)
+
+    root = profiler.root
+    console.print(Panel(
+        f"[cyan]Wall time:[/] {root.wall:.2f}s\n" +
+        f"[cyan]Outside operations:[/] {root.rate_limit:.2f}s rate limit, {root.network:.2f}s network, " +
+        f"{root.cdn:.2f}s CDN, {root.cpu:.2f}s CPU",
+        title=f"Profile of {root.path[0]}",
+        border_style="cyan"
+    ))
+
+async def dispatch_command(args: argparse.Namespace, copier: 'ServerCopier', console: 'Console') -> int:
+    """Run a parsed command with a ready copier, returning its exit code"""
+    if args.command == 'copy':
+        if args.fix and not args.verify:
+            console.print("[red]Error: --fix sends the fixes a verification finds, add --verify[/]")
+            return EXIT_USAGE
+        copier.verify_report, copier.verify_fix = args.verify, args.fix
+        if args.snapshot and args.name:
+            console.print("[red]Error: Snapshots can only be copied to an existing server, use --target[/]")
+            return EXIT_USAGE
+        if args.dry_run:
+            if args.snapshot or args.name:
+                console.print("[red]Error: --dry-run plans copies from a server to an existing server[/]")
+                return EXIT_USAGE
+            ok = await copier.plan_copy(args.source, args.target, args.dry_run) is not None
+        elif args.snapshot:
+            ok = await copier.import_snapshot(args.source, args.target, args.resume)
+        elif args.name:
+            ok = await copier.copy_server(args.source, args.name)
+        else:
+            ok = await copier.copy_to_existing_server(args.source, args.target, args.resume)
+    elif args.command == 'clean':
+        if not args.yes:
+            console.print("[red]Error: Cleaning deletes everything in the server, confirm with --yes[/]")
+            return EXIT_USAGE
+        ok = await copier.clean_server(args.guild)
+    elif args.command == 'sync':
+        if args.snapshot:
+            try:
+                source = GuildSnapshot.load(args.source)
+            except (OSError, ValueError) as e:
+                console.print(f"[red]Error loading snapshot: {str(e)}")
+                return EXIT_FAILED
+            ok = await copier.sync_snapshot(source, args.target)
+        else:
+            ok = await copier.sync_server(args.source, args.target)
+    elif args.command == 'verify':
+        report_path = args.report or f"{args.target}.drift.json"
+        if args.snapshot:
+            try:
+                source = GuildSnapshot.load(args.source)
+            except (OSError, ValueError) as e:
+                console.print(f"[red]Error loading snapshot: {str(e)}")
+                return EXIT_FAILED
+            report = await copier.verify_snapshot(source, args.target, report_path, args.fix)
+        else:
+            report = await copier.verify_server(args.source, args.target, report_path, args.fix)
+        ok = drift_resolved(report)
+    else:
+        ok = await copier.export_snapshot(args.source, args.output or f"{args.source}.snapshot.json.gz")
+    return EXIT_OK if ok else EXIT_FAILED
+
+def cli(argv: List[str]) -> int:
+    """Entry point of the non-interactive command line"""
+    args = build_parser().parse_args(argv)
+    from rich.console import Console  # Not needed for --help
+    console = Console()
+    try:
+        # Read-only, a job runner must not rewrite config.json, and needs no .env when given the token otherwise
+        verify_all(read_only=True, require_env=not (args.token or os.getenv('DISCORD_TOKEN') or args.replay))
+    except (SecurityError, CopyrightError) as e:
+        console.print(f"[red]{str(e)}[/]")
+        return EXIT_UNAUTHORIZED
+    try:
+        return asyncio.run(run_command(args, console))
+    except KeyboardInterrupt:
+        return EXIT_FAILED
+
 if __name__ == "__main__":
+    configure_logging()
+    if len(sys.argv) > 1:
+        sys.exit(cli(sys.argv[1:]))
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
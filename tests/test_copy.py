@@ -0,0 +1,64 @@
+"""Tests for the requests a copy sends, against an in-memory stand-in for the API"""
+
+import asyncio
+import itertools
+
+import discopy
+from discopy import GuildSnapshot, RunConfig, ServerCopier
+
+class FakeAPI:
+    """Answers reads of a target guild and records every write"""
+    def __init__(self, target_id: str):
+        self.target = {"id": target_id, "name": "target", "premium_tier": 0, "features": []}
+        self.writes = []
+        self.ids = itertools.count(1000)
+        self.assets = None
+
+    async def request(self, method: str, endpoint: str, **kwargs):
+        if method == 'GET':
+            return self.target if endpoint.startswith(f"/guilds/{self.target['id']}?") else []
+        self.writes.append((method, endpoint, kwargs.get('json')))
+        return dict(kwargs.get('json') or {}, id=str(next(self.ids)))
+
+def test_copy_maps_everyone_overwrites_to_the_target(tmp_path, monkeypatch):
+    monkeypatch.setattr(discopy, 'JOURNAL_DIR', str(tmp_path))
+    source = GuildSnapshot({"id": "100", "name": "source"}, [
+        {"id": "100", "name": "@everyone", "permissions": "0", "color": 0, "hoist": False, "mentionable": False, "position": 0},
+        {"id": "101", "name": "mod", "permissions": "8", "color": 0, "hoist": False, "mentionable": False, "position": 1},
+    ], [
+        {"id": "110", "name": "private", "type": 0, "position": 0, "parent_id": None, "permission_overwrites": [
+            {"id": "100", "type": 0, "allow": "0", "deny": "1024"},
+            {"id": "101", "type": 0, "allow": "1024", "deny": "0"},
+        ]},
+    ], [], [])
+    api = FakeAPI("200")
+    config = RunConfig(copy_settings=False, copy_emojis=False, copy_stickers=False, clean_target=False)
+    copier = ServerCopier(api, show_progress=False, config=config)
+    copier.console.quiet = True
+
+    assert asyncio.run(copier.copy_snapshot(source, "200"))
+    created_role = next(body for method, endpoint, body in api.writes if endpoint == '/guilds/200/roles' and method == 'POST')
+    created_channel = next(body for method, endpoint, body in api.writes if endpoint == '/guilds/200/channels')
+    # The role is created before the channel that names it, and gets the fake's first id
+    assert created_role["name"] == "mod"
+    assert {o["id"] for o in created_channel["permission_overwrites"]} == {"200", "1000"}
+
+def test_new_server_channels_get_their_member_overwrites():
+    source = GuildSnapshot({"id": "100", "name": "source"}, [], [
+        {"id": "110", "name": "roles only", "type": 0, "position": 0, "parent_id": None,
+         "permission_overwrites": [{"id": "100", "type": 0, "allow": "0", "deny": "1024"}]},
+        {"id": "111", "name": "with member", "type": 0, "position": 1, "parent_id": None, "permission_overwrites": [
+            {"id": "100", "type": 0, "allow": "0", "deny": "1024"},
+            {"id": "555", "type": 1, "allow": "1024", "deny": "0"},
+        ]},
+    ], [], [])
+    api = FakeAPI("200")
+    copier = ServerCopier(api, show_progress=False)
+    operations = copier._member_overwrite_operations(source, {"100": "200"}, {"110": "210", "111": "211"})
+
+    assert [op.endpoint for op in operations] == ['/channels/211']
+    asyncio.run(operations[0].run())
+    assert api.writes == [('PATCH', '/channels/211', {"permission_overwrites": [
+        {"id": "200", "type": 0, "allow": "0", "deny": "1024"},
+        {"id": "555", "type": 1, "allow": "1024", "deny": "0"},
+    ]})]
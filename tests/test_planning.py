@@ -0,0 +1,143 @@
+"""Tests for the sync planner, position moves and the create guild payload"""
+
+import discopy
+from discopy import GuildSnapshot, SyncPlan, changed_fields, guild_create_payload, position_moves
+
+def role(role_id: str, name: str, position: int, **fields) -> dict:
+    return {"id": role_id, "name": name, "permissions": "0", "color": 0, "hoist": False, "mentionable": False,
+            "managed": False, "position": position, **fields}
+
+def channel(channel_id: str, name: str, position: int, channel_type: int = 0, parent_id=None, overwrites=None, **fields) -> dict:
+    return {"id": channel_id, "name": name, "type": channel_type, "position": position, "parent_id": parent_id,
+            "permission_overwrites": overwrites or [], "nsfw": False, **fields}
+
+def snapshot(guild_id: str, roles, channels, emojis=None, stickers=None, **guild) -> GuildSnapshot:
+    return GuildSnapshot(dict({"id": guild_id, "name": "guild"}, **guild),
+                         [role(guild_id, "@everyone", 0)] + roles, channels, emojis or [], stickers or [])
+
+def source_guild() -> GuildSnapshot:
+    return snapshot("100", [role("101", "mod", 1), role("102", "admin", 2)], [
+        channel("110", "info", 0, 4, overwrites=[{"id": "100", "type": 0, "allow": "0", "deny": "1024"}]),
+        channel("111", "rules", 0, parent_id="110", topic="be nice",
+                overwrites=[{"id": "101", "type": 0, "allow": "1024", "deny": "0"}]),
+        channel("112", "voice", 1, 2, parent_id="110", bitrate=64000, user_limit=0),
+    ])
+
+def target_copy() -> GuildSnapshot:
+    """A target the source was copied into, its ids differ and @everyone is the target guild"""
+    return snapshot("200", [role("201", "mod", 1), role("202", "admin", 2)], [
+        channel("210", "info", 0, 4, overwrites=[{"id": "200", "type": 0, "allow": "0", "deny": "1024"}]),
+        channel("211", "rules", 0, parent_id="210", topic="be nice",
+                overwrites=[{"id": "201", "type": 0, "allow": "1024", "deny": "0"}]),
+        channel("212", "voice", 1, 2, parent_id="210", bitrate=64000, user_limit=0),
+    ])
+
+def test_position_moves_none_when_already_in_order():
+    source = [{"id": "1", "position": 0}, {"id": "2", "position": 1}]
+    target = [{"id": "11", "position": 0}, {"id": "12", "position": 1}]
+    assert position_moves(source, target, {"1": "11", "2": "12"}) == []
+
+def test_position_moves_swaps_copied_items():
+    source = [{"id": "1", "position": 0}, {"id": "2", "position": 1}]
+    target = [{"id": "11", "position": 1}, {"id": "12", "position": 0}]
+    moves = position_moves(source, target, {"1": "11", "2": "12"})
+    assert sorted(moves, key=lambda m: m['id']) == [{"id": "11", "position": 0}, {"id": "12", "position": 1}]
+
+def test_position_moves_keeps_the_place_of_objects_that_were_not_copied():
+    source = [{"id": "1", "position": 0}, {"id": "2", "position": 1}]
+    target = [{"id": "12", "position": 0}, {"id": "20", "position": 1}, {"id": "11", "position": 2}]
+    moves = position_moves(source, target, {"1": "11", "2": "12"})
+    assert sorted(moves, key=lambda m: m['id']) == [{"id": "11", "position": 0}, {"id": "12", "position": 2}]
+
+def test_position_moves_orders_within_groups_from_first():
+    source = [{"id": "1", "position": 0, "g": "x"}, {"id": "2", "position": 1, "g": "x"}, {"id": "3", "position": 0, "g": "y"}]
+    target = [{"id": "11", "position": 2, "g": "x"}, {"id": "12", "position": 1, "g": "x"}, {"id": "13", "position": 1, "g": "y"}]
+    moves = position_moves(source, target, {"1": "11", "2": "12", "3": "13"}, lambda item: item['g'], first=1)
+    assert sorted(moves, key=lambda m: m['id']) == [{"id": "11", "position": 1}, {"id": "12", "position": 2}]
+
+def test_changed_fields_treats_empty_values_as_equal():
+    payload = {"topic": None, "rate_limit_per_user": 0, "nsfw": False}
+    assert changed_fields(payload, {"topic": "", "nsfw": None}) == {}
+
+def test_changed_fields_reports_differences_and_skips_ignored_fields():
+    payload = {"name": "renamed", "topic": "new", "bitrate": 64000}
+    assert changed_fields(payload, {"name": "old", "topic": "old", "bitrate": 64000}) == {"topic": "new"}
+
+def test_changed_fields_compares_overwrites_and_roles_as_sets():
+    overwrites = [{"id": "1", "type": 0, "allow": "1", "deny": "0"}, {"id": "2", "type": 1, "allow": "0", "deny": "2"}]
+    target = {"permission_overwrites": list(reversed(overwrites)), "roles": ["b", "a"]}
+    assert changed_fields({"permission_overwrites": overwrites, "roles": ["a", "b"]}, target) == {}
+    changed = [dict(overwrites[0], allow="3"), overwrites[1]]
+    assert changed_fields({"permission_overwrites": changed}, target) == {"permission_overwrites": changed}
+
+def test_sync_plan_of_a_matching_copy_is_empty():
+    plan = SyncPlan(source_guild(), target_copy())
+    assert plan.actions == []
+    assert not plan.out_of_order
+    assert plan.role_mapping == {"100": "200", "101": "201", "102": "202"}
+    assert plan.channel_mapping == {"110": "210", "111": "211", "112": "212"}
+
+def test_sync_plan_finds_creates_updates_and_deletes():
+    target = target_copy()
+    target.channels[1]["topic"] = "changed"
+    target.channels.append(channel("213", "extra", 3, parent_id="210"))
+    del target.roles[2]  # admin
+    plan = SyncPlan(source_guild(), target)
+    actions = {(a.action, a.kind, a.name) for a in plan.actions}
+    assert actions == {('update', 'channel', 'rules'), ('delete', 'channel', 'extra'), ('create', 'role', 'admin')}
+    update = next(a for a in plan.actions if a.action == 'update')
+    assert update.changes == {"topic": "be nice"}
+    assert plan.actions[0].action == 'delete'  # Deletes go first
+
+def test_sync_plan_maps_everyone_overwrites_to_the_target_guild():
+    target = target_copy()
+    target.channels[0]["permission_overwrites"] = [{"id": "100", "type": 0, "allow": "0", "deny": "1024"}]
+    plan = SyncPlan(source_guild(), target)
+    assert [(a.action, a.name) for a in plan.actions] == [('update', 'info')]
+    assert plan.actions[0].changes["permission_overwrites"][0]["id"] == "200"
+
+def test_sync_plan_compares_icon_presence_not_hash():
+    source, target = source_guild(), target_copy()
+    source.guild["icon"], target.guild["icon"] = "source-hash", "upload-hash"
+    assert SyncPlan(source, target).actions == []
+    target.guild["icon"] = None
+    actions = SyncPlan(source, target).actions
+    assert [(a.kind, list(a.changes)) for a in actions] == [('settings', ['icon'])]
+
+def test_guild_create_payload_uses_placeholders():
+    source = source_guild()
+    source.channels[1]["permission_overwrites"].append({"id": "999", "type": 1, "allow": "1024", "deny": "0"})
+    payload = guild_create_payload(source, "copy", None, settings=False)
+
+    assert payload["name"] == "copy"
+    assert [r["id"] for r in payload["roles"]] == [0, 1, 2]
+    assert [r.get("name") for r in payload["roles"][1:]] == ["mod", "admin"]
+    category, rules, voice = payload["channels"]
+    assert category["id"] not in (0, 1, 2) and category["permission_overwrites"][0]["id"] == 0
+    assert rules["parent_id"] == category["id"] and voice["parent_id"] == category["id"]
+    # Member overwrites cannot be expressed before the server exists
+    assert rules["permission_overwrites"] == [{"id": 1, "type": 0, "allow": "1024", "deny": "0"}]
+    assert len({c["id"] for c in payload["channels"]}) == 3
+
+def test_guild_create_payload_leaves_out_channel_types_it_cannot_create():
+    source = source_guild()
+    source.channels.append(channel("120", "forum", 2, 15, parent_id="110"))
+    source.channels.append(channel("121", "stage", 3, 13))
+    payload = guild_create_payload(source, "copy", None, settings=False)
+    assert [c["name"] for c in payload["channels"]] == ["info", "rules", "voice"]
+
+def test_guild_create_payload_carries_settings_when_asked():
+    source = source_guild()
+    source.guild["verification_level"] = 2
+    payload = guild_create_payload(source, "copy", "data:image/png;base64,", settings=True)
+    assert payload["verification_level"] == 2 and payload["icon"] == "data:image/png;base64,"
+    assert "icon" not in guild_create_payload(source, "copy", None, settings=False)
+
+def test_validate_for_target_drops_lottie_stickers_on_normal_servers():
+    source = snapshot("100", [], [], stickers=[{"id": "1", "name": "lottie", "format_type": 3},
+                                             {"id": "2", "name": "png", "format_type": 1}])
+    validated, issues = discopy.validate_for_target(source, discopy.TargetCapacity({"features": []}))
+    assert [s["name"] for s in validated.stickers] == ["png"]
+    assert [(i.name, i.action) for i in issues] == [("lottie", "dropped")]
+    validated, issues = discopy.validate_for_target(source, discopy.TargetCapacity({"features": ["VERIFIED"]}))
+    assert len(validated.stickers) == 2 and not issues
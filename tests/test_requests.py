@@ -0,0 +1,77 @@
+"""Tests for retry classification and read cache invalidation"""
+
+import asyncio
+
+from discopy import ReadCache, RetryPolicy
+
+def test_retry_policy_classifies_failures():
+    assert RetryPolicy.classify(None) == RetryPolicy.NETWORK
+    assert RetryPolicy.classify(429) == RetryPolicy.RATE_LIMIT
+    for status in (500, 502, 503, 504):
+        assert RetryPolicy.classify(status) == RetryPolicy.SERVER
+    for status in (400, 401, 403, 404):
+        assert RetryPolicy.classify(status) == RetryPolicy.CLIENT
+
+def test_retry_policy_limits_retries_per_class():
+    policy = RetryPolicy(max_retries=2, rate_limit_retries=4)
+    assert policy.should_retry(RetryPolicy.SERVER, 2) and not policy.should_retry(RetryPolicy.SERVER, 3)
+    assert policy.should_retry(RetryPolicy.NETWORK, 2) and not policy.should_retry(RetryPolicy.NETWORK, 3)
+    assert policy.should_retry(RetryPolicy.RATE_LIMIT, 4) and not policy.should_retry(RetryPolicy.RATE_LIMIT, 5)
+    assert not policy.should_retry(RetryPolicy.CLIENT, 1)
+
+def test_retry_policy_delays():
+    policy = RetryPolicy(base_delay=1.0, max_delay=10.0)
+    # The rate limiter already holds a rate limited bucket until it resets
+    assert policy.delay(RetryPolicy.RATE_LIMIT, 1, retry_after=5.0) == 0.0
+    assert policy.delay(RetryPolicy.SERVER, 1, retry_after=3.0) == 3.0
+    assert policy.delay(RetryPolicy.SERVER, 1, retry_after=60.0) == 10.0
+    for retries, backoff in ((1, 1.0), (3, 4.0), (10, 10.0)):
+        assert backoff / 2 <= policy.delay(RetryPolicy.NETWORK, retries) <= backoff
+
+def test_read_cache_related_paths():
+    related = ReadCache.related
+    assert related('/guilds/1/roles/2', '/guilds/1/roles')
+    assert related('/guilds/1/roles/2', '/guilds/1')
+    assert related('/guilds/1', '/guilds/1/channels')
+    assert not related('/guilds/1/roles/2', '/guilds/2/roles')
+    assert not related('/guilds/1/roles', '/guilds/1/emojis')
+    # Channel routes do not name their guild
+    assert related('/channels/5', '/guilds/1/channels')
+    assert not related('/channels/5', '/guilds/1/roles')
+
+def cached(endpoints) -> ReadCache:
+    cache = ReadCache(default_ttl=60)
+    for endpoint in endpoints:
+        cache.entries[endpoint] = (float('inf'), {"endpoint": endpoint})
+    return cache
+
+def test_read_cache_invalidate_drops_related_reads_only():
+    cache = cached(['/guilds/1?with_counts=true', '/guilds/1/roles', '/guilds/1/channels', '/guilds/2/roles'])
+    cache.invalidate('/guilds/1/roles/7')
+    assert sorted(cache.entries) == ['/guilds/1/channels', '/guilds/2/roles']
+    cache.invalidate('/channels/9')
+    assert sorted(cache.entries) == ['/guilds/2/roles']
+
+def test_read_cache_get_returns_copies():
+    cache = cached(['/guilds/1/roles'])
+    found, response = cache.get('/guilds/1/roles')
+    response["endpoint"] = "changed"
+    assert found and cache.get('/guilds/1/roles')[1] == {"endpoint": "/guilds/1/roles"}
+
+def test_read_cache_does_not_keep_a_read_invalidated_in_flight():
+    async def run():
+        cache = ReadCache(default_ttl=60)
+        loop = asyncio.get_running_loop()
+        stale, fresh = loop.create_future(), loop.create_future()
+        cache.inflight['/guilds/1/roles'] = stale
+        cache.inflight['/guilds/1/emojis'] = fresh
+        cache.invalidate('/guilds/1/roles/3')
+        stale.set_result([])
+        fresh.set_result([])
+        cache.complete('/guilds/1/roles', stale)
+        cache.complete('/guilds/1/emojis', fresh)
+        return cache
+
+    cache = asyncio.run(run())
+    assert list(cache.entries) == ['/guilds/1/emojis']
+    assert cache.inflight == {}